@@ -164,7 +164,7 @@ def interp2pressure(xds, plevels, hgtsfc=None):
 
 
         cds = lp.get_interp_coefficients(p*100, prsl)
-        mask = (cds["is_right"].sum("level") > 0) & (cds["is_left"].sum("level") > 0)
+        mask = cds["mask"]
         for key in vars3d:
             logging.info(f"Interpolating {key} to {p} hPa")
             interpolated = lp.interp2pressure(xds[key], p*100, prsl, cds)
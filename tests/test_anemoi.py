@@ -0,0 +1,378 @@
+import queue
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import zarr
+
+from ufs2arco.targets import Anemoi, AnemoiInferenceWithForcings
+from ufs2arco.targets.statistics import (
+    packed_statistics,
+    combine_statistics,
+    reduce_statistics,
+    merge_statistics,
+    finalize_statistics,
+)
+from ufs2arco.mpi import SerialTopology
+
+@pytest.fixture
+def source():
+    source = MagicMock()
+    source.name = "MockSource"
+    source.time = pd.date_range("2020-01-01", periods=6, freq="6h")
+    source.fhr = None
+    source.member = None
+    source.t0 = None
+    source.sample_dims = ("time",)
+    source.horizontal_dims = ("latitude", "longitude")
+    source.static_vars = ["lsm"]
+    return source
+
+@pytest.fixture
+def target(source):
+    return Anemoi(
+        source,
+        chunks={"time": 1, "variable": -1, "ensemble": 1, "cell": -1},
+        store_path="/tmp/store/anemoi.zarr",
+        sort_channels_by_levels=True,
+    )
+
+def make_sample(time_index, nans=False):
+    rng = np.random.default_rng(time_index)
+    xds = xr.Dataset(
+        coords={
+            "time": [pd.Timestamp("2020-01-01") + pd.Timedelta(hours=6*time_index)],
+            "level": [850., 500., 1000.],
+            "latitude": np.linspace(-10, 10, 4),
+            "longitude": np.linspace(0, 30, 5),
+        },
+    )
+    xds["t"] = xr.DataArray(rng.normal(size=(1, 3, 4, 5)), dims=("time", "level", "latitude", "longitude"))
+    xds["sp"] = xr.DataArray(rng.normal(size=(1, 4, 5)).astype(np.float32), dims=("time", "latitude", "longitude"))
+    xds["lsm"] = xr.DataArray(rng.normal(size=(4, 5)), dims=("latitude", "longitude"))
+    if nans:
+        xds["sp"][0, 1, 1] = np.nan
+    return xds
+
+def test_stackit(target):
+    xds = make_sample(2)
+    result = target.apply_transforms_to_sample(xds)
+
+    assert result.attrs["variables"] == ["lsm", "sp", "t_500", "t_850", "t_1000"]
+    assert result["data"].dtype == np.float32
+    assert result["data"].dims == ("time", "variable", "ensemble", "cell")
+    assert int(result["time"]) == 2
+
+    expected = {
+        "lsm": xds["lsm"].values,
+        "sp": xds["sp"].values[0],
+        "t_500": xds["t"].sel(level=500).values[0],
+        "t_850": xds["t"].sel(level=850).values[0],
+        "t_1000": xds["t"].sel(level=1000).values[0],
+    }
+    for channel, name in enumerate(result.attrs["variables"]):
+        np.testing.assert_array_equal(
+            result["data"].isel(time=0, ensemble=0, variable=channel).values,
+            expected[name].astype(np.float32).ravel(),
+        )
+
+def test_update_statistics(source):
+    target = Anemoi(
+        source,
+        chunks={"time": 1, "variable": -1, "ensemble": 1, "cell": -1},
+        store_path="/tmp/store/anemoi.zarr",
+        variables_with_nans=["sp"],
+        store_sample_statistics=False,
+    )
+    samples = [target.apply_transforms_to_sample(make_sample(i, nans=i == 3)) for i in range(6)]
+    target.reset_statistics()
+    for xds in samples:
+        target.update_statistics(xds)
+        assert "count_array" not in target.drop_sample_statistics(xds)
+
+    # sp is allowed to have NaNs, so no unexpected NaNs
+    assert target._local_nan_times == set()
+
+    data = np.concatenate([xds["data"].values for xds in samples], axis=0).astype(np.float64)
+    data = np.moveaxis(data, 1, 0).reshape(len(samples[0]["variable"]), -1)
+    np.testing.assert_allclose(target._local_statistics["count"], (~np.isnan(data)).sum(axis=1))
+    np.testing.assert_allclose(target._local_statistics["mean"], np.nanmean(data, axis=1))
+    np.testing.assert_allclose(
+        target._local_statistics["m2"] / target._local_statistics["count"],
+        np.nanvar(data, axis=1),
+    )
+
+def test_flatten_grid(target):
+    data = np.random.default_rng(0).normal(size=(1, 1, 2, 4, 5)).astype(np.float32)
+    xds = xr.Dataset(
+        {"data": (("time", "ensemble", "variable", "latitudes", "longitudes"), data)},
+        coords={"latitudes": np.linspace(-10, 10, 4), "longitudes": np.linspace(0, 30, 5)},
+        attrs={"stack_order": ["latitudes", "longitudes"]},
+    )
+    result = target._flatten_grid(xds)
+
+    assert result["data"].dims == ("time", "ensemble", "variable", "cell")
+    assert np.shares_memory(result["data"].values, data)
+    np.testing.assert_array_equal(result["cell"].values, np.arange(20))
+    np.testing.assert_array_equal(result["latitudes"].values, np.repeat(xds["latitudes"].values, 5))
+    np.testing.assert_array_equal(result["longitudes"].values, np.tile(xds["longitudes"].values, 4))
+
+    # the grid is only computed once
+    again = target._flatten_grid(xds)
+    assert np.shares_memory(again["latitudes"].values, result["latitudes"].values)
+
+def test_layout(source, target):
+    first = target.apply_transforms_to_sample(make_sample(0))
+    assert target._layout is not None
+    assert target._layout["channels"][2:] == [("t", 1), ("t", 0), ("t", 2)]
+
+    # the second sample uses the compiled layout, and gives the same result as stacking from scratch
+    xds = make_sample(3, nans=True)
+    expected = Anemoi(
+        source,
+        chunks=target.chunks,
+        store_path=target.store_path,
+        sort_channels_by_levels=True,
+    ).apply_transforms_to_sample(xds.copy(deep=True))
+    result = target.apply_transforms_to_sample(xds.copy(deep=True))
+    xr.testing.assert_identical(result, expected)
+    assert result.attrs["variables_metadata"]["t_500"]["mars"]["date"] == "20200101"
+    assert result.attrs["variables_metadata"]["t_500"]["mars"]["time"] == "1800"
+    assert first.attrs["variables_metadata"]["t_500"]["mars"]["time"] == "0000"
+
+def test_constant_forcings(source):
+    target = Anemoi(
+        source,
+        chunks={"time": 1, "variable": -1, "ensemble": 1, "cell": -1},
+        store_path="/tmp/store/anemoi.zarr",
+        forcings=["cos_latitude", "cos_julian_day"],
+    )
+    first = target.compute_forcings(make_sample(0))
+    second = target.compute_forcings(make_sample(1))
+
+    # constant forcings are computed once and shared, the others are computed for each time
+    assert np.shares_memory(first["computed_forcing_cos_latitude"].values, second["computed_forcing_cos_latitude"].values)
+    assert not second["computed_forcing_cos_latitude"].values.flags.writeable
+    np.testing.assert_allclose(second["computed_forcing_cos_latitude"].values, np.cos(np.deg2rad(second["latitude"].values)))
+    assert first["computed_forcing_cos_julian_day"].values != second["computed_forcing_cos_julian_day"].values
+
+def test_check_existing_store(source, tmp_path):
+    target = Anemoi(
+        source,
+        chunks={"time": 1, "variable": -1, "ensemble": 1, "cell": -1},
+        store_path=str(tmp_path / "anemoi.zarr"),
+    )
+    attrs = target.manage_coords(xr.Dataset()).attrs
+    zarr.open_group(target.store_path, mode="w").attrs.update(attrs)
+    target.check_existing_store()
+
+    # a store written with sums and squares, i.e. without the version attribute
+    attrs.pop("statistics_format_version")
+    zarr.open_group(target.store_path, mode="w").attrs.update(attrs)
+    with pytest.raises(AssertionError):
+        target.check_existing_store()
+
+def test_check_existing_store_accumulated(source, tmp_path):
+    """Restarting or patching can't accumulate the statistics in memory, so this is rejected before moving any data"""
+    target = Anemoi(
+        source,
+        chunks={"time": 1, "variable": -1, "ensemble": 1, "cell": -1},
+        store_path=str(tmp_path / "anemoi.zarr"),
+        store_sample_statistics=False,
+    )
+    zarr.open_group(target.store_path, mode="w").attrs.update(target.manage_coords(xr.Dataset()).attrs)
+    with pytest.raises(AssertionError, match="store_sample_statistics=False"):
+        target.check_existing_store()
+
+def write_store(store_path, xds, n_written):
+    """Write the dataset to a zarr store by hand, with only the first n_written time steps filled in"""
+    zds = zarr.open_group(store_path, mode="w")
+    zds.attrs.update(xds.attrs)
+    for key, xda in xds.variables.items():
+        array = zds.create_dataset(
+            key,
+            shape=xda.shape,
+            dtype=xda.dtype,
+            chunks=tuple(1 if d == "time" else n for d, n in zip(xda.dims, xda.shape)),
+            fill_value=np.nan if xda.dtype.kind == "f" else None,
+        )
+        array.attrs["_ARRAY_DIMENSIONS"] = list(xda.dims)
+        if xda.dims[:1] == ("time",):
+            array[:n_written] = xda.values[:n_written]
+        elif "time" not in xda.dims:
+            array[:] = xda.values
+    return zds
+
+@pytest.mark.parametrize("store_sample_statistics", [True, False])
+def test_store_forcings(source, tmp_path, store_sample_statistics):
+    source.static_vars = ["lsm", "sp"]
+    source.variables = ["t", "sp", "lsm"]
+    target = AnemoiInferenceWithForcings(
+        source,
+        chunks={"time": 1, "variable": -1, "ensemble": 1, "cell": -1},
+        store_path=str(tmp_path / "inference.zarr"),
+        forcings=["cos_latitude", "sin_longitude", "cos_julian_day", "cos_solar_zenith_angle"],
+        multistep_input=2,
+        store_sample_statistics=store_sample_statistics,
+    )
+    initial_conditions = [target.apply_transforms_to_sample(make_sample(i)) for i in range(2)]
+
+    # the expected result: every channel except lsm and the forcings is NaN after the initial conditions,
+    # and lsm is carried over from the first initial condition
+    expected = list()
+    for i in range(2, len(source.time)):
+        xds = make_sample(i)
+        xds["lsm"] = make_sample(0)["lsm"]
+        for key in ["t", "sp"]:
+            xds[key][:] = np.nan
+        expected.append(target.apply_transforms_to_sample(xds))
+    expected = xr.concat(initial_conditions + expected, dim="time", data_vars="minimal", coords="minimal", compat="override")
+
+    zds = write_store(target.store_path, expected, n_written=2)
+    target.reset_statistics()
+    for xds in initial_conditions:
+        target.update_statistics(xds)
+    # a small block size, so that the time steps are written in a few blocks
+    target.store_forcings(SerialTopology(log_dir=str(tmp_path)), block_size=200)
+
+    np.testing.assert_allclose(zds["data"][:], expected["data"].values, rtol=1e-6, atol=1e-6)
+    variables = list(zds.attrs["variables"])
+    assert np.isnan(zds["data"][2:, variables.index("sp")]).all()
+    np.testing.assert_array_equal(zds["data"][5, variables.index("lsm")], zds["data"][0, variables.index("lsm")])
+
+    if store_sample_statistics:
+        for key in packed_statistics:
+            np.testing.assert_allclose(
+                zds[f"{key}_array"][:].astype(float),
+                expected[f"{key}_array"].values.astype(float),
+                rtol=1e-5,
+                atol=1e-6,
+            )
+    else:
+        stats = combine_statistics(
+            {
+                key: expected[f"{key}_array"].transpose("variable", "time", "ensemble").values
+                for key in packed_statistics
+            },
+            axis=(1, 2),
+        )
+        for key, val in stats.items():
+            np.testing.assert_allclose(target._local_statistics[key].astype(float), val.astype(float), rtol=1e-5, atol=1e-6)
+
+class ThreadTopology:
+    """Stands in for MPITopology, with each rank in its own thread, just to exchange the edges of the time blocks"""
+    def __init__(self, rank, size, mailboxes):
+        self.rank = rank
+        self.size = size
+        self.mailboxes = mailboxes
+
+    def exchange_edges(self, send_array=None, recv_buffer=None):
+        if send_array is not None:
+            self.mailboxes[self.rank-1].put(send_array.copy())
+        if recv_buffer is not None:
+            recv_buffer[...] = self.mailboxes[self.rank].get(timeout=10)
+
+@pytest.mark.parametrize("n_ranks", [1, 3, 4])
+@pytest.mark.parametrize("time_chunk", [1, 2, 3, 7, 20])
+def test_temporal_residual_stats(target, tmp_path, n_ranks, time_chunk):
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(20, 4, 1, 6)).astype(np.float32)
+    data[3, 1, 0, 2] = np.nan   # a NaN in one variable
+    data[5] = np.nan            # a missing time, never written
+    data[15:17] = np.nan        # and two missing times in a row
+    dims = ("time", "variable", "ensemble", "cell")
+    array = zarr.open_array(str(tmp_path / "data.zarr"), mode="w", shape=data.shape, chunks=(time_chunk, 4, 1, 6), dtype=data.dtype)
+    array[:] = data
+    start_idx, end_idx = 2, 17
+
+    mailboxes = [queue.Queue() for _ in range(n_ranks)]
+    def local_stats(rank):
+        topo = SerialTopology(log_dir=str(tmp_path)) if n_ranks == 1 else ThreadTopology(rank, n_ranks, mailboxes)
+        return target._local_temporal_residual_stats(array, dims, start_idx, end_idx, topo)
+
+    with ThreadPoolExecutor(max_workers=n_ranks) as executor:
+        results = list(executor.map(local_stats, range(n_ranks)))
+    stats = results[0]
+    for other in results[1:]:
+        stats = merge_statistics(stats, other)
+    stats = finalize_statistics(stats)
+
+    diff = np.diff(data[start_idx:end_idx+1].astype(np.float64), axis=0)
+    expected = finalize_statistics(reduce_statistics(diff, axis=(0, 2, 3)))
+    # 15 differences, minus the 2 around time 5 and the 3 around times 15-16
+    assert stats["count"][0] == 10 * 6
+    for key in ["count", "has_nans", "maximum", "minimum", "mean", "stdev"]:
+        np.testing.assert_allclose(stats[key].astype(float), expected[key].astype(float), rtol=1e-10)
+
+@pytest.mark.parametrize("with_count", [True, False])
+def test_reconcile_missing_and_nans(source, tmp_path, with_count):
+    """The vectorized has_nans_array update and missing date search gives the same result as looping over dates"""
+    target = Anemoi(
+        source,
+        chunks={"time": 1, "variable": -1, "ensemble": 1, "cell": -1},
+        store_path=str(tmp_path / "anemoi.zarr"),
+        variables_with_nans=["sp"],
+    )
+    variables = ["lsm", "sp", "t_500", "t_850", "t_1000"]
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(6, len(variables), 1, 20))
+    data[1] = np.nan            # missing, never written
+    data[2, 3, 0, 4] = np.nan   # missing, with some NaNs
+    data[4, 2, 0, 2] = np.nan   # unexpected NaN in t_500
+    data[5, 1, 0, 0] = np.nan   # NaN in sp, which is allowed
+    count = (~np.isnan(data)).sum(-1).astype(np.float64)
+    count[1] = np.nan
+    has_nans = np.isnan(data).any(-1)
+    has_nans[1:3] = False       # the per sample statistics never saw the missing dates
+    missing_dates = [str(target.datetime[tidx]) for tidx in [1, 2, 3]]
+
+    arrays = {"data": data, "has_nans_array": has_nans}
+    if with_count:
+        arrays["count_array"] = count
+    zds = zarr.open_group(target.store_path, mode="w")
+    for key, val in arrays.items():
+        zds.create_dataset(key, data=val, chunks=(1,) + val.shape[1:], fill_value=np.nan if val.dtype.kind == "f" else None)
+    zds.attrs.update({"variables": variables, "missing_dates": missing_dates})
+    xds = xr.Dataset(
+        {key: (("time", "variable", "ensemble", "cell")[:val.ndim], val) for key, val in arrays.items()},
+        coords={"time": np.arange(6), "variable": np.arange(len(variables))},
+        attrs=dict(zds.attrs),
+    )
+
+    # the original loop over dates
+    expected = has_nans.copy()
+    for mdate in missing_dates:
+        tidx = list(target.datetime.astype(str)).index(mdate)
+        if np.isnan(data[tidx]).any() and not has_nans[tidx].any():
+            expected[tidx] = True
+    keep = [variables.index(key) for key in variables if key != "sp"]
+    expected_missing = [
+        str(target.datetime[tidx]) for tidx in range(6)
+        if expected[tidx, keep].any() and str(target.datetime[tidx]) not in missing_dates
+    ]
+
+    result, is_missing, update = target._set_has_nans_at_missing_dates(xds, zds, missing_dates)
+    np.testing.assert_array_equal(result, expected)
+    np.testing.assert_array_equal(zds["has_nans_array"][:], expected)
+    np.testing.assert_array_equal(update, [False, True, True, False, False, False])
+    assert target._find_unexpected_nan_dates(xds, result, is_missing) == expected_missing
+    assert expected_missing == [str(target.datetime[4])]
+
+def test_apply_transforms_threads(source):
+    """Prefetching transforms samples on several threads, which fill the caches on the target at the same time"""
+    kw = {
+        "chunks": {"time": 1, "variable": -1, "ensemble": 1, "cell": -1},
+        "store_path": "/tmp/store/anemoi.zarr",
+        "sort_channels_by_levels": True,
+        "forcings": ["cos_latitude", "cos_julian_day"],
+    }
+    expected = [Anemoi(source, **kw).apply_transforms_to_sample(make_sample(i)) for i in range(6)]
+
+    target = Anemoi(source, **kw)
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(lambda i: target.apply_transforms_to_sample(make_sample(i)), range(6)))
+    for result, xds in zip(results, expected):
+        xr.testing.assert_identical(result, xds)
@@ -1,9 +1,16 @@
 import pytest
 import os
+import itertools
+import threading
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
 import xarray as xr
 import pandas as pd
-from ufs2arco.datamover import DataMover
+from ufs2arco.datamover import DataMover, MPIDynamicDataMover, SampleSpace
+from ufs2arco.mpi import SharedCounter
+from ufs2arco.targets import Target
 
 @pytest.fixture
 def source():
@@ -69,3 +76,157 @@ def test_clear_cache(mock_merge, data_mover):
 def test_restart(data_mover):
     data_mover.restart()
     assert data_mover.data_counter == 0
+
+def test_prefetch_batches(source, target):
+    mover = DataMover(source, target, batch_size=2, start=0, cache_dir=".", prefetch_batches=2)
+    batches = [xds for xds in mover]
+    assert len(batches) == len(mover)
+    assert all(isinstance(xds, xr.Dataset) for xds in batches)
+
+    # every sample is read exactly once
+    opened = [tuple(call.kwargs["dims"].values()) for call in source.open_sample_dataset.call_args_list]
+    assert len(opened) == len(mover.sample_indices)
+    assert set(opened) == set(tuple(d.values()) for d in mover.sample_indices)
+    assert mover.executor is None
+
+def test_prefetch_restart(source, target):
+    mover = DataMover(source, target, batch_size=2, start=0, cache_dir=".", prefetch_batches=2)
+    next(mover)
+    assert mover.executor is not None
+    mover.restart(idx=4)
+    assert mover.executor is None
+    assert mover.data_counter == 4
+
+def test_completion_order():
+    first, second = Future(), Future()
+    downloads = {0: [first], 1: [], 2: [second]}
+    second.set_result(None)
+    first.set_result(None)
+    order = list(DataMover._completion_order(downloads, 4))
+    assert sorted(order) == [0, 1, 2, 3]
+    assert order[0] == 1
+    assert order[-1] == 3
+
+def test_find_my_region(source):
+    target = Target(source, chunks={"t0": 1, "fhr": 1, "member": 1}, store_path="/tmp/store/gefsdataset.zarr")
+    mover = DataMover(source, target, batch_size=2, start=0, cache_dir=".")
+    xds = xr.Dataset(coords={"t0": source.t0[1:3], "fhr": [6], "member": [0, 1]})
+    region = mover.find_my_region(xds)
+    assert region == {"t0": slice(1, 3), "fhr": slice(1, 2), "member": slice(0, 2)}
+
+    with pytest.raises(ValueError):
+        target.get_indexer("t0", pd.Timestamp("2023-01-01"))
+
+def test_sample_space(source):
+    coords = {key: getattr(source, key) for key in source.sample_dims}
+    samples = SampleSpace(coords)
+    expected = [dict(zip(coords.keys(), combo)) for combo in itertools.product(*coords.values())]
+    assert len(samples) == len(expected)
+    assert list(samples) == expected
+    assert samples[3:7] == expected[3:7]
+    assert samples[-1] == expected[-1]
+    assert all(samples.index(dims) == i for i, dims in enumerate(expected))
+
+    subset = samples.subset([expected[9], expected[2]])
+    assert len(subset) == 2
+    assert list(subset) == [expected[9], expected[2]]
+    assert subset.index(expected[2]) == 1
+    with pytest.raises(ValueError):
+        subset.index(expected[0])
+
+@patch("ufs2arco.datamover.xr.merge")
+def test_batches(mock_merge, data_mover):
+    mock_merge.return_value = xr.Dataset()
+    data_mover.restart(idx=5)
+    batch_idx = [batch_idx for batch_idx, _ in data_mover.batches()]
+    assert batch_idx == [5, 6, 7]
+
+
+class MockWindow:
+    """Stands in for the MPI window that all ranks share, with ranks as threads"""
+    def __init__(self):
+        self.value = np.zeros(1, dtype=np.int64)
+        self.lock = threading.Lock()
+        self.n_freed = 0
+
+    def Lock(self, rank, lock_type):
+        self.lock.acquire()
+
+    def Unlock(self, rank):
+        self.lock.release()
+
+    def Accumulate(self, buffer, rank, op):
+        assert op == "replace"
+        self.value[:] = buffer
+
+    def Fetch_and_op(self, buffer, result, rank, op):
+        assert op == "sum"
+        result[:] = self.value
+        # give the other threads a chance to get in between, if the window lock did not prevent it
+        threading.Event().wait(1e-4)
+        self.value += buffer
+
+    def Free(self):
+        self.n_freed += 1
+
+def mock_mpi(window):
+    return SimpleNamespace(
+        INT64_T=SimpleNamespace(Get_size=lambda: 8),
+        Win=SimpleNamespace(Allocate=lambda size, disp_unit, comm: window),
+        LOCK_EXCLUSIVE="exclusive",
+        LOCK_SHARED="shared",
+        REPLACE="replace",
+        SUM="sum",
+    )
+
+def mock_comm(rank, barrier):
+    return SimpleNamespace(Get_rank=lambda: rank, Barrier=barrier.wait)
+
+def test_shared_counter():
+    n_ranks = 4
+    window = MockWindow()
+    barrier = threading.Barrier(n_ranks)
+
+    def claim(rank):
+        with SharedCounter(mock_comm(rank, barrier), value=3) as counter:
+            claimed = []
+            while (idx := counter.fetch_and_add(1)) < 40:
+                claimed.append(idx)
+            barrier.wait()
+        counter.free()
+        return claimed
+
+    with patch("ufs2arco.mpi.MPI", mock_mpi(window), create=True):
+        with ThreadPoolExecutor(max_workers=n_ranks) as executor:
+            claimed = list(executor.map(claim, range(n_ranks)))
+
+    # every index is handed out exactly once, and freeing twice is fine
+    assert sorted(idx for indices in claimed for idx in indices) == list(range(3, 40))
+    assert window.n_freed == n_ranks
+
+@patch("ufs2arco.datamover.xr.merge")
+def test_dynamic_data_mover(mock_merge, source, target):
+    mock_merge.return_value = xr.Dataset()
+    n_ranks = 3
+    window = MockWindow()
+    barrier = threading.Barrier(n_ranks)
+
+    def move(rank):
+        topo = MagicMock()
+        topo.rank = rank
+        topo.size = n_ranks
+        topo.create_counter = lambda value: SharedCounter(mock_comm(rank, barrier), value=value)
+        mover = MPIDynamicDataMover(source, target, mpi_topo=topo, start=2, cache_dir=".")
+        moved = [batch_idx for batch_idx, xds in mover.batches()]
+        barrier.wait()
+        mover.close()
+        assert mover.shared_counter is None
+        return moved
+
+    with patch("ufs2arco.datamover._has_mpi", True), patch("ufs2arco.mpi.MPI", mock_mpi(window), create=True):
+        with ThreadPoolExecutor(max_workers=n_ranks) as executor:
+            moved = list(executor.map(move, range(n_ranks)))
+
+    # the loop ends on every rank, once each sample after the start is moved exactly once
+    assert sorted(idx for indices in moved for idx in indices) == list(range(2, 16))
+    assert window.n_freed == n_ranks
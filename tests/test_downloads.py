@@ -0,0 +1,54 @@
+import pytest
+import threading
+from unittest.mock import MagicMock
+
+from ufs2arco.sources.downloads import DownloadPool, download_file
+
+def test_retry():
+    pool = DownloadPool(max_workers=2, max_per_host=1, retries=2, backoff=0.01)
+    func = MagicMock(side_effect=[ConnectionError, ConnectionError, "done"])
+    assert pool.submit("s3://bucket/key", func).result() == "done"
+    assert func.call_count == 3
+
+    func = MagicMock(side_effect=ConnectionError)
+    with pytest.raises(ConnectionError):
+        pool.submit("s3://bucket/key", func).result()
+    assert func.call_count == 3
+
+    # don't bother retrying files that don't exist
+    func = MagicMock(side_effect=FileNotFoundError)
+    with pytest.raises(FileNotFoundError):
+        pool.submit("s3://bucket/key", func).result()
+    assert func.call_count == 1
+    pool.shutdown()
+
+def test_max_per_host():
+    pool = DownloadPool(max_workers=8, max_per_host=2)
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+    release = threading.Event()
+
+    def func():
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        release.wait(timeout=0.1)
+        with lock:
+            active["now"] -= 1
+
+    futures = [pool.submit(f"filecache::s3://bucket/key{i}", func) for i in range(6)]
+    for future in futures:
+        future.result()
+    assert active["max"] == 2
+    pool.shutdown()
+
+def test_download_file(tmp_path):
+    remote = tmp_path / "remote.txt"
+    remote.write_text("some data")
+    local = str(tmp_path / "cache" / "local.txt")
+    assert download_file(f"filecache::file://{remote}", local) == local
+    with open(local) as f:
+        assert f.read() == "some data"
+
+    with pytest.raises(FileNotFoundError):
+        download_file(f"file://{tmp_path}/missing.txt", str(tmp_path / "cache" / "missing.txt"))
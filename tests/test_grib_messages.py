@@ -0,0 +1,177 @@
+import os
+import threading
+import functools
+import http.server
+import pytest
+from unittest.mock import patch
+import numpy as np
+import xarray as xr
+import fsspec
+
+eccodes = pytest.importorskip("eccodes")
+
+from ufs2arco.sources.grib_messages import GribMessageTable, GribIndexStore
+from ufs2arco.sources.grib_inventory import GribInventoryMap, parse_inventory, merge_ranges, download_byte_ranges
+
+@pytest.fixture
+def grib_file(tmp_path):
+    """A small GRIB2 file with temperature and u-wind on 3 pressure levels, plus 2 surface fields,
+    and a NOAA style .idx inventory next to it"""
+    path = str(tmp_path / "test.grib2")
+    names = {130: "TMP", 131: "UGRD", 167: "TMP", 134: "PRES"}
+    levels = {"isobaricInhPa": "{} mb", "heightAboveGround": "{} m above ground", "surface": "surface"}
+    inventory = []
+    messages = {
+        "regular_ll_pl_grib2": [(130, "isobaricInhPa", level) for level in (500, 850, 1000)] + \
+            [(131, "isobaricInhPa", level) for level in (500, 850, 1000)],
+        "regular_ll_sfc_grib2": [(167, "heightAboveGround", 2), (134, "surface", 0)],
+    }
+    with open(path, "wb") as f:
+        for sample, params in messages.items():
+            for param_id, type_of_level, level in params:
+                h = eccodes.codes_grib_new_from_samples(sample)
+                eccodes.codes_set(h, "paramId", param_id)
+                eccodes.codes_set(h, "typeOfLevel", type_of_level)
+                eccodes.codes_set(h, "level", level)
+                n = eccodes.codes_get(h, "numberOfValues")
+                eccodes.codes_set_values(h, np.arange(n, dtype=float) + param_id + level)
+                level_name = levels[type_of_level].format(level)
+                inventory.append(f"{len(inventory)+1}:{f.tell()}:d=2007032312:{names[param_id]}:{level_name}:anl:")
+                eccodes.codes_write(h, f)
+                eccodes.codes_release(h)
+    with open(f"{path}.idx", "w") as f:
+        f.write("\n".join(inventory) + "\n")
+    return path
+
+@pytest.mark.parametrize(
+    "fbk",
+    [
+        {"paramId": 130, "typeOfLevel": "isobaricInhPa"},
+        {"paramId": 131, "typeOfLevel": "isobaricInhPa", "level": 850},
+        {"paramId": 167, "typeOfLevel": "heightAboveGround", "level": 2},
+        {"paramId": 134, "typeOfLevel": "surface", "stepType": "instant"},
+    ],
+)
+def test_open_dataset(grib_file, fbk):
+    table = GribMessageTable(grib_file, filter_keys=("paramId", "typeOfLevel", "level", "stepType"))
+    assert len(table) == 8
+
+    result = table.open_dataset(fbk, decode_timedelta=True)
+    expected = xr.open_dataset(grib_file, engine="cfgrib", filter_by_keys=fbk, decode_timedelta=True, indexpath="")
+    xr.testing.assert_identical(result, expected)
+
+def test_open_dataset_no_match(grib_file):
+    table = GribMessageTable(grib_file, filter_keys=("paramId", "typeOfLevel"))
+    result = table.open_dataset({"paramId": 999, "typeOfLevel": "surface"})
+    assert len(result) == 0
+
+def test_subindex_unscanned_key(grib_file):
+    table = GribMessageTable(grib_file, filter_keys=("paramId",))
+    with pytest.raises(AssertionError):
+        table.subindex({"paramId": 130, "stepRange": "0-6"})
+
+def test_index_store(grib_file, tmp_path):
+    store = GribIndexStore(str(tmp_path / "index"))
+    file_id = GribIndexStore.file_id("s3://bucket/test.grib2", size=100, etag="abc")
+    filter_keys = ("paramId", "typeOfLevel", "level")
+    fbk = {"paramId": 131, "typeOfLevel": "isobaricInhPa"}
+    expected = GribMessageTable(grib_file, filter_keys=filter_keys, store=store, file_id=file_id).open_dataset(fbk)
+
+    # the second time around the file should not be scanned at all
+    with patch("ufs2arco.sources.grib_messages.messages.FileIndex.from_fieldset", side_effect=RuntimeError):
+        table = GribMessageTable(grib_file, filter_keys=filter_keys, store=store, file_id=file_id)
+        xr.testing.assert_identical(table.open_dataset(fbk), expected)
+
+        # unless we ask for keys that were not stored
+        with pytest.raises(RuntimeError):
+            GribMessageTable(grib_file, filter_keys=filter_keys + ("stepRange",), store=store, file_id=file_id)
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Stand-in for the NOAA buckets, which support HTTP range requests"""
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            content = f.read()
+        byte_range = self.headers.get("Range", None)
+        if byte_range is None:
+            self.send_response(200)
+        else:
+            start, end = byte_range.replace("bytes=", "").split("-")
+            end = int(end) + 1 if end != "" else len(content)
+            content = content[int(start):end]
+            self.send_response(206)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def http_server(grib_file):
+    handler = functools.partial(RangeRequestHandler, directory=os.path.dirname(grib_file))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def test_parse_inventory():
+    text = "1:0:d=2024010100:TMP:500 mb:anl:\n" + \
+        "2:100:d=2024010100:APCP:surface:0-6 hour acc fcst:\n" + \
+        "3:200:d=2024010100:TMP:2 m above ground:6 hour fcst:ENS=+1\n"
+    inventory = parse_inventory(text)
+    assert [entry["offset"] for entry in inventory] == [0, 100, 200]
+    assert [entry["kind"] for entry in inventory] == ["", "acc", ""]
+    assert [entry["step_range"] for entry in inventory] == ["0", "0-6", "6"]
+
+def test_merge_ranges():
+    assert merge_ranges([(10, 20), (0, 10), (30, 40), (35, None)]) == [(0, 20), (30, None)]
+
+def test_select_submessages():
+    text = "1:0:d=2024010100:TMP:500 mb:anl:\n" + \
+        "2.1:100:d=2024010100:UGRD:10 m above ground:anl:\n" + \
+        "2.2:100:d=2024010100:VGRD:10 m above ground:anl:\n" + \
+        "3:250:d=2024010100:PRES:surface:anl:\n" + \
+        "4.1:400:d=2024010100:UGRD:250 mb:anl:\n" + \
+        "4.2:400:d=2024010100:VGRD:250 mb:anl:\n"
+    inventory = parse_inventory(text)
+    inventory_map = GribInventoryMap(["paramId"])
+    for entry, param_id in zip(inventory, [130, 165, 166, 134, 131, 132]):
+        inventory_map.mapping[inventory_map.descriptor(entry)] = {(("paramId", param_id),)}
+
+    # each submessage ends where the next message starts, and the last one at the end of the file
+    assert inventory_map.select(inventory, [{"paramId": 166}]) == [(100, 250)]
+    assert inventory_map.select(inventory, [{"paramId": 165}, {"paramId": 134}]) == [(100, 400)]
+    assert inventory_map.select(inventory, [{"paramId": 131}]) == [(400, None)]
+    assert inventory_map.select(inventory, [{"paramId": 130}]) == [(0, 100)]
+
+def test_byte_range_subset(grib_file, http_server, tmp_path):
+    fs, remote_path = fsspec.core.url_to_fs(f"{http_server}/test.grib2")
+    with open(f"{grib_file}.idx") as f:
+        inventory = parse_inventory(f.read())
+    filter_keys = ("paramId", "typeOfLevel", "level", "stepType")
+
+    inventory_map = GribInventoryMap(filter_keys)
+    fbks = [{"paramId": 131, "typeOfLevel": "isobaricInhPa"}, {"paramId": 134, "typeOfLevel": "surface"}]
+    assert inventory_map.select(inventory, fbks) is None
+
+    # learn the inventory entries from the full file, then only download what's needed
+    inventory_map.learn(inventory, GribMessageTable(grib_file, filter_keys=filter_keys))
+    ranges = inventory_map.select(inventory, fbks)
+    assert len(ranges) == 2
+    local_file = download_byte_ranges(fs, remote_path, ranges, str(tmp_path / "subset" / "test.grib2"))
+    assert os.path.getsize(local_file) < os.path.getsize(grib_file)
+
+    subset = GribMessageTable(local_file, filter_keys=filter_keys)
+    full = GribMessageTable(grib_file, filter_keys=filter_keys)
+    assert len(subset) == 4
+    for fbk in fbks:
+        expected = full.open_dataset(fbk).load()
+        result = subset.open_dataset(fbk).load()
+        xr.testing.assert_equal(result, expected)
@@ -0,0 +1,147 @@
+import sys
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+import numpy as np
+import xarray as xr
+
+import importlib
+
+# the module, rather than the function with the same name
+hr = importlib.import_module("ufs2arco.transforms.horizontal_regrid")
+
+@pytest.fixture
+def source_dataset():
+    lat = np.linspace(-90, 90, 19)
+    lon = np.linspace(0, 350, 36)
+    return xr.Dataset(
+        {"t": (("latitude", "longitude"), np.random.rand(len(lat), len(lon)))},
+        coords={"latitude": lat, "longitude": lon},
+    )
+
+@pytest.fixture
+def target_grid_path(tmp_path):
+    path = str(tmp_path / "target.nc")
+    xr.Dataset(coords={"lat": np.linspace(-90, 90, 10), "lon": np.linspace(0, 340, 18)}).to_netcdf(path)
+    return path
+
+def mock_regridder(ds_in, ds_out, **kwargs):
+    """Stand in for xesmf.Regridder, which just returns the output grid"""
+    def regrid(xds, keep_attrs=True):
+        return xr.Dataset(
+            {"t": (("lat", "lon"), np.zeros((len(ds_out.lat), len(ds_out.lon))))},
+            coords={"lat": ds_out.lat.values, "lon": ds_out.lon.values},
+        )
+    return regrid
+
+def test_regridder_cache(source_dataset, target_grid_path, tmp_path):
+    xesmf = MagicMock()
+    xesmf.Regridder = MagicMock(side_effect=mock_regridder)
+    cache = dict()
+    kw = {
+        "target_grid_path": target_grid_path,
+        "regridder_kwargs": {"method": "bilinear", "filename": str(tmp_path / "weights.nc")},
+        "regridder_cache": cache,
+    }
+    with patch.dict(sys.modules, {"xesmf": xesmf}):
+        first = hr.horizontal_regrid(source_dataset, **kw)
+        second = hr.horizontal_regrid(source_dataset + 1, **kw)
+        assert xesmf.Regridder.call_count == 1
+        assert len(cache) == 1
+        xr.testing.assert_identical(first, second)
+        assert first.sizes == {"latitude": 10, "longitude": 18}
+
+        # a different source grid gets its own regridder
+        hr.horizontal_regrid(source_dataset.isel(longitude=slice(0, 18)), **kw)
+        assert xesmf.Regridder.call_count == 2
+        assert len(cache) == 2
+
+def test_regridder_cache_threads(source_dataset, target_grid_path, tmp_path):
+    def slow_regridder(ds_in, ds_out, **kwargs):
+        time.sleep(0.1)
+        return mock_regridder(ds_in, ds_out, **kwargs)
+
+    xesmf = MagicMock()
+    xesmf.Regridder = MagicMock(side_effect=slow_regridder)
+    cache = dict()
+    kw = {
+        "target_grid_path": target_grid_path,
+        "regridder_kwargs": {"method": "bilinear", "filename": str(tmp_path / "weights.nc")},
+        "regridder_cache": cache,
+    }
+    with patch.dict(sys.modules, {"xesmf": xesmf}):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda _: hr.horizontal_regrid(source_dataset, **kw), range(4)))
+    assert xesmf.Regridder.call_count == 1
+    assert len(cache) == 1
+    assert len(results) == 4
+
+def test_sparse_backend(tmp_path):
+    """Regridding with weights that just pick every other grid point is the same as subsampling"""
+    lat = np.linspace(-90, 90, 19)
+    lon = np.linspace(0, 350, 36)
+    xds = xr.Dataset(
+        {
+            "t": (("level", "latitude", "longitude"), np.random.rand(3, len(lat), len(lon)).astype(np.float32)),
+            "sp": (("latitude", "longitude"), np.random.rand(len(lat), len(lon))),
+            "ak": (("level",), np.arange(3.)),
+        },
+        coords={"level": [500, 850, 1000], "latitude": lat, "longitude": lon},
+    )
+    target_grid_path = str(tmp_path / "target.nc")
+    xr.Dataset(coords={"lat": lat[::2], "lon": lon[::2]}).to_netcdf(target_grid_path)
+
+    # weights in the xesmf format, with 1-based indices
+    ilat, ilon = np.meshgrid(np.arange(0, len(lat), 2), np.arange(0, len(lon), 2), indexing="ij")
+    row = np.arange(ilat.size) + 1
+    col = (ilat * len(lon) + ilon).ravel() + 1
+    filename = str(tmp_path / "weights.nc")
+    xr.Dataset({"row": ("n_s", row), "col": ("n_s", col), "S": ("n_s", np.ones(row.size))}).to_netcdf(filename)
+
+    # the sparse backend never imports xesmf, i.e. ESMF is not loaded
+    with patch.dict(sys.modules, {"xesmf": None}):
+        result = hr.horizontal_regrid(
+            xds,
+            target_grid_path=target_grid_path,
+            regridder_kwargs={"method": "bilinear", "filename": filename},
+            backend="sparse",
+        )
+    expected = xds[["t", "sp"]].isel(latitude=slice(None, None, 2), longitude=slice(None, None, 2))
+    assert "ak" not in result
+    assert result["t"].dtype == np.float32
+    xr.testing.assert_allclose(result[["t", "sp"]], expected)
+
+def test_sparse_backend_unmapped(tmp_path):
+    """Target cells without any weights are NaN, as with xesmf's unmapped_to_nan=True"""
+    xds = xr.Dataset(
+        {"t": (("latitude", "longitude"), np.arange(6.).reshape(2, 3))},
+        coords={"latitude": [0., 10.], "longitude": [0., 10., 20.]},
+    )
+    target_grid_path = str(tmp_path / "target.nc")
+    xr.Dataset(coords={"lat": [0., 10.], "lon": [5., 15.]}).to_netcdf(target_grid_path)
+
+    # the average of the neighbors in longitude, except for the last target cell, which has an empty row
+    row = np.array([1, 1, 2, 2, 3, 3])
+    col = np.array([1, 2, 2, 3, 4, 5])
+    filename = str(tmp_path / "weights.nc")
+    xr.Dataset({"row": ("n_s", row), "col": ("n_s", col), "S": ("n_s", np.full(row.size, 0.5))}).to_netcdf(filename)
+
+    kw = {"target_grid_path": target_grid_path, "backend": "sparse"}
+    result = hr.horizontal_regrid(xds, regridder_kwargs={"method": "bilinear", "filename": filename}, **kw)
+    np.testing.assert_array_equal(result["t"].values, [[0.5, 1.5], [3.5, np.nan]])
+
+    result = hr.horizontal_regrid(
+        xds,
+        regridder_kwargs={"method": "bilinear", "filename": filename, "unmapped_to_nan": False},
+        **kw,
+    )
+    np.testing.assert_array_equal(result["t"].values, [[0.5, 1.5], [3.5, 0.]])
+
+    # options that only matter when computing the weights are not silently ignored
+    with pytest.raises(ValueError):
+        hr.horizontal_regrid(
+            xds,
+            regridder_kwargs={"method": "bilinear", "filename": filename, "extrap_method": "nearest_s2d"},
+            **kw,
+        )
@@ -0,0 +1,139 @@
+import pytest
+
+import numpy as np
+import xarray as xr
+
+from ufs2arco.layers2pressure import Layers2Pressure
+from ufs2arco.transforms import Transformer
+
+@pytest.fixture
+def lp():
+    return Layers2Pressure()
+
+@pytest.fixture
+def prsl(lp):
+    rng = np.random.default_rng(0)
+    pfull = lp.xds["pfull"].values * 100
+    scale = rng.uniform(0.7, 1.05, size=(4, 5))
+    prsl = xr.DataArray(
+        pfull[:, None, None] * scale[None],
+        dims=("pfull", "lat", "lon"),
+        coords={"pfull": lp.xds["pfull"]},
+    )
+    prsl[:, 0, 0] = pfull
+    return prsl
+
+
+def reference_interp(xda, pstar, prsl):
+    """columnwise np.interp in log pressure, NaN outside of the column"""
+    x = xda.transpose(..., "pfull").values
+    p = np.log(prsl.transpose(..., "pfull").values)
+    p = np.broadcast_to(p, x.shape)
+    result = np.full(x.shape[:-1], np.nan)
+    for idx in np.ndindex(*x.shape[:-1]):
+        if p[idx][0] <= np.log(pstar) <= p[idx][-1]:
+            result[idx] = np.interp(np.log(pstar), p[idx], x[idx])
+    return result
+
+
+def test_interp2pressure(lp, prsl):
+    rng = np.random.default_rng(1)
+    xda = xr.DataArray(
+        rng.normal(size=(3,) + prsl.shape),
+        dims=("time",) + prsl.dims,
+        coords={"pfull": prsl["pfull"]},
+    )
+    # including exact levels at the top, middle, and bottom of the first column
+    for pstar in [50_000., 104_000., 1.] + list(prsl.values[[0, 60, 126], 0, 0]):
+        result = lp.interp2pressure(xda, pstar, prsl)
+        assert result.dims == ("time", "lat", "lon")
+        np.testing.assert_allclose(result.values, reference_interp(xda, pstar, prsl))
+
+    # same answer with the levels upside down
+    flipped = lp.interp2pressure(xda.isel(pfull=slice(None, None, -1)), 50_000., prsl.isel(pfull=slice(None, None, -1)))
+    np.testing.assert_allclose(flipped.values, reference_interp(xda, 50_000., prsl))
+
+
+def test_interp2pressure_levels(lp, prsl):
+    rng = np.random.default_rng(2)
+    xds = xr.Dataset({
+        key: xr.DataArray(rng.normal(size=(2,) + prsl.shape), dims=("time",) + prsl.dims, attrs={"units": key})
+        for key in ["tmp", "ugrd"]
+    })
+    xds["pressfc"] = xds["tmp"].isel(pfull=-1)
+    pstar = np.array([10_000., 50_000., 85_000., 100_000.])
+
+    pds = lp.interp2pressure_levels(xds, pstar, prsl)
+    assert sorted(pds.data_vars) == ["tmp", "ugrd"]
+    for key in pds.data_vars:
+        assert pds[key].dims == ("time", "lat", "lon", "pstar")
+        assert pds[key].attrs == xds[key].attrs
+        for i, p in enumerate(pstar):
+            np.testing.assert_allclose(pds[key].isel(pstar=i).values, reference_interp(xds[key], p, prsl))
+
+    # output chunks follow the horizontal chunks of the input
+    chunked = lp.interp2pressure_levels(
+        xds.chunk({"time": 1, "lat": 2, "lon": 3, "pfull": 50}),
+        pstar,
+        prsl.chunk({"pfull": 10}),
+    )
+    assert chunked["tmp"].chunks == ((1, 1), (2, 2), (3, 2), (4,))
+    xr.testing.assert_allclose(chunked.compute(), pds)
+
+
+def test_calc_geopotential(lp):
+    rng = np.random.default_rng(3)
+    pfull = lp.xds["pfull"]
+    delz = xr.DataArray(
+        -rng.uniform(10, 500, size=(2, len(pfull), 3, 4)),
+        dims=("time", "pfull", "lat", "lon"),
+        coords={"pfull": pfull},
+    )
+    hgtsfc = xr.DataArray(rng.uniform(0, 3000, size=(3, 4)), dims=("lat", "lon"))
+
+    # interface geopotential summed from the ground up, minus half of each layer
+    dz = lp.g * np.abs(delz.values)
+    phii = lp.g * hgtsfc.values[None, None] + np.cumsum(dz[:, ::-1], axis=1)[:, ::-1]
+    expected = phii - 0.5 * dz
+
+    geopotential = lp.calc_geopotential(hgtsfc, delz)
+    assert geopotential.dims == delz.dims
+    np.testing.assert_allclose(geopotential.values, expected)
+
+    # levels ordered from the ground up, and chunked
+    flipped = lp.calc_geopotential(hgtsfc, delz.isel(pfull=slice(None, None, -1)).chunk({"time": 1, "lat": 2}))
+    assert flipped.chunks[1] == (len(pfull),)
+    np.testing.assert_allclose(flipped.values[:, ::-1], expected)
+
+
+def test_derived_variables_transform(lp):
+    rng = np.random.default_rng(4)
+    level = lp.xds["pfull"].values
+    dims = ("time", "level", "latitude", "longitude")
+    shape = (1, len(level), 3, 4)
+    xds = xr.Dataset(coords={"level": level})
+    xds["pressfc"] = (("time", "latitude", "longitude"), rng.uniform(70_000, 102_000, size=(1, 3, 4)).astype(np.float32))
+    xds["hgtsfc_static"] = (("latitude", "longitude"), rng.uniform(0, 3000, size=(3, 4)).astype(np.float32))
+    xds["tmp"] = (dims, rng.uniform(200, 300, size=shape).astype(np.float32))
+    xds["spfh"] = (dims, rng.uniform(0, 0.01, size=shape).astype(np.float32))
+
+    transformer = Transformer({"fv_derived_variables": {"variables": ["delz", "prsl", "geopotential"]}})
+    result = transformer(xds.copy())
+
+    native = Layers2Pressure(level_name="level")
+    delz = native.calc_delz(xds["pressfc"], xds["tmp"], xds["spfh"])
+    prsl = native.calc_layer_mean_pressure(xds["pressfc"], xds["tmp"], xds["spfh"], delz)
+    geopotential = native.calc_geopotential(xds["hgtsfc_static"], delz)
+    for key, expected in zip(["delz", "prsl", "geopotential"], [delz, prsl, geopotential]):
+        assert result[key].dims == dims
+        assert result[key].dtype == np.float32
+        np.testing.assert_allclose(result[key].values, expected.transpose(*dims).values, rtol=1e-5)
+
+    # and then on to pressure levels
+    transformer = Transformer({
+        "fv_derived_variables": {"variables": ["delz", "prsl", "geopotential"]},
+        "interp2pressure": {"levels": [500, 850], "variables": ["tmp", "geopotential"]},
+    })
+    result = transformer(xds.copy())
+    assert sorted(result.data_vars) == ["geopotential", "hgtsfc_static", "pressfc", "tmp"]
+    assert list(result["level"].values) == [500, 850]
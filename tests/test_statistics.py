@@ -0,0 +1,69 @@
+import pytest
+
+import numpy as np
+
+from ufs2arco.targets.statistics import (
+    reduce_statistics,
+    merge_statistics,
+    combine_statistics,
+    pack_statistics,
+    unpack_statistics,
+    merge_packed_statistics,
+    finalize_statistics,
+)
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(2, 1, 3, 7, 11)).astype(np.float32)
+    data[0, 0, 1, 2, 3] = np.nan
+    data[1, 0, 2] = np.nan
+    return data
+
+@pytest.mark.parametrize("block_size", [5, 2**20])
+def test_reduce_statistics(data, block_size):
+    axis = (3, 4)
+    stats = reduce_statistics(data, axis=axis, block_size=block_size)
+    x = data.astype(np.float64)
+
+    np.testing.assert_array_equal(stats["count"], (~np.isnan(x)).sum(axis))
+    np.testing.assert_array_equal(stats["has_nans"], np.isnan(x).any(axis))
+    with pytest.warns(RuntimeWarning):
+        np.testing.assert_array_equal(stats["maximum"], np.nanmax(x, axis))
+        np.testing.assert_array_equal(stats["minimum"], np.nanmin(x, axis))
+        np.testing.assert_allclose(stats["mean"], np.nan_to_num(np.nanmean(x, axis)))
+        np.testing.assert_allclose(stats["m2"], np.nan_to_num(np.nanvar(x, axis) * stats["count"]))
+    assert stats["has_nans"].dtype == bool
+    assert stats["mean"].shape == (2, 1, 3)
+
+def test_reduce_statistics_with_nans(data):
+    stats = reduce_statistics(data, axis=(3, 4), skipna=False, block_size=5)
+    x = data.astype(np.float64)
+    np.testing.assert_array_equal(stats["maximum"], x.max((3, 4)))
+    np.testing.assert_array_equal(stats["minimum"], x.min((3, 4)))
+    np.testing.assert_allclose(stats["mean"], x.mean((3, 4)))
+    np.testing.assert_allclose(stats["m2"], x.var((3, 4)) * 77)
+
+def test_merge_statistics():
+    # a large offset, where squares/count - mean**2 loses most of the digits
+    rng = np.random.default_rng(1)
+    data = 1e8 + rng.normal(size=(10, 3, 50))
+    samples = reduce_statistics(data, axis=2)
+
+    combined = combine_statistics(samples, axis=0)
+    merged = {key: val[0] for key, val in samples.items()}
+    packed = pack_statistics(merged)
+    for i in range(1, 10):
+        this_one = {key: val[i] for key, val in samples.items()}
+        merged = merge_statistics(merged, this_one)
+        merge_packed_statistics(pack_statistics(this_one), packed)
+
+    expected_m2 = data.var(axis=(0, 2)) * 500
+    for stats in [combined, merged, unpack_statistics(packed)]:
+        np.testing.assert_array_equal(stats["count"], 500)
+        np.testing.assert_allclose(stats["mean"], data.mean(axis=(0, 2)), rtol=1e-14)
+        np.testing.assert_allclose(stats["m2"], expected_m2, rtol=1e-6)
+
+    final = finalize_statistics(combined)
+    np.testing.assert_allclose(final["stdev"], data.std(axis=(0, 2)), rtol=1e-6)
+    np.testing.assert_allclose(final["sums"], data.sum(axis=(0, 2)), rtol=1e-14)
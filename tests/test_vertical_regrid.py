@@ -0,0 +1,40 @@
+import pytest
+
+import numpy as np
+import xarray as xr
+
+from ufs2arco.transforms.vertical_regrid import fv_vertical_regrid
+
+@pytest.fixture
+def xds():
+    rng = np.random.default_rng(0)
+    level = np.array([1., 3., 7., 12., 20., 50., 100., 300., 700., 1000.])
+    xds = xr.Dataset(coords={"level": level, "lat": np.arange(3.)})
+    xds["delz"] = (("time", "level", "lat"), -rng.uniform(10, 100, size=(2, len(level), 3)).astype(np.float32), {"units": "m"})
+    xds["tmp"] = (("time", "lat", "level"), rng.uniform(200, 300, size=(2, 3, len(level))).astype(np.float32), {"long_name": "temperature"})
+    xds["ugrd"] = (("level", "time", "lat"), rng.normal(size=(len(level), 2, 3)))
+    xds["pressfc"] = (("time", "lat"), rng.normal(size=(2, 3)))
+    return xds
+
+
+@pytest.mark.parametrize("interfaces", [[0, 10, 100, 1000], [5, 50, 2000], [0, 2, 2.5, 10, 1000], [0, 10, 100, 1000, 2000, 3000]])
+def test_fv_vertical_regrid(xds, interfaces):
+    result = fv_vertical_regrid(xds.copy(), weight_var="delz", interfaces=interfaces, keep_weight_var=True)
+
+    # layers are closed on the right, as with groupby_bins
+    n_layers = len(interfaces) - 1
+    layer = np.searchsorted(interfaces, xds["level"].values, side="left") - 1
+    delz = xds["delz"].values
+    for key in ["tmp", "ugrd"]:
+        assert result[key].dims == ("time", "level", "lat")
+        assert result[key].dtype == np.result_type(xds[key].dtype, delz.dtype)
+        assert result[key].attrs["long_name"] == f"vertically regridded {xds[key].attrs.get('long_name', key)}"
+        x = xds[key].transpose("time", "level", "lat").values
+        for k in range(n_layers):
+            in_layer = layer == k
+            expected = (x[:, in_layer] * delz[:, in_layer]).sum(axis=1) / delz[:, in_layer].sum(axis=1) if in_layer.any() else np.nan
+            np.testing.assert_allclose(result[key].isel(level=k).values, expected * np.ones((2, 3)), rtol=1e-6)
+
+    assert result["delz"].attrs["units"] == "m"
+    np.testing.assert_array_equal(result["pressfc"].values, xds["pressfc"].values)
+    np.testing.assert_allclose(result["level"].values, (np.array(interfaces[:-1]) + np.array(interfaces[1:])) / 2)
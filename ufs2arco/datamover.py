@@ -1,10 +1,12 @@
 import os
 import shutil
-import itertools
 import logging
 
-from math import ceil
+from math import ceil, prod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
+import pandas as pd
 import xarray as xr
 import dask.array
 
@@ -12,6 +14,101 @@ from .mpi import MPITopology, _has_mpi
 
 logger = logging.getLogger("ufs2arco")
 
+class SampleSpace():
+    """All combinations of the sample dimension values, e.g. every (t0, fhr, member),
+    without storing them. Each sample has a flat index, in the same order as ``itertools.product``,
+    and is converted to and from its dimension values with mixed-radix arithmetic.
+
+    A ``subset`` of flat indices can be given to enumerate only some samples (e.g. when patching missing data).
+
+    Example:
+        >>> samples = SampleSpace({"t0": t0, "fhr": [0, 6], "member": [0, 1, 2]})
+        >>> samples[7]
+        {"t0": t0[1], "fhr": 0, "member": 1}
+        >>> samples.index({"t0": t0[1], "fhr": 0, "member": 1})
+        7
+    """
+
+    def __init__(self, coords: dict, subset=None):
+        """
+        Args:
+            coords (dict): with the values for each sample dimension, in order
+            subset (array_like, optional): flat indices of the samples to use, in the order they should be visited
+        """
+        self.coords = coords
+        self.dims = tuple(coords.keys())
+        self.shape = tuple(len(values) for values in coords.values())
+        self.flat_indices = None if subset is None else np.asarray(subset, dtype=np.int64)
+        self._indexes = dict()
+
+    def __len__(self) -> int:
+        if self.flat_indices is None:
+            return prod(self.shape)
+        return len(self.flat_indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._sample(i) for i in range(*key.indices(len(self)))]
+
+        n_samples = len(self)
+        idx = key + n_samples if key < 0 else key
+        if not 0 <= idx < n_samples:
+            raise IndexError(f"SampleSpace.__getitem__: index {key} out of range for {n_samples} samples")
+        return self._sample(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self._sample(idx)
+
+    def _sample(self, idx: int) -> dict:
+        flat = idx if self.flat_indices is None else int(self.flat_indices[idx])
+        positions = []
+        for size in reversed(self.shape):
+            flat, position = divmod(flat, size)
+            positions.append(position)
+        return {dim: self.coords[dim][position] for dim, position in zip(self.dims, reversed(positions))}
+
+    def _flat_index(self, dims: dict) -> int:
+        flat = 0
+        for dim, size in zip(self.dims, self.shape):
+            if dim not in self._indexes:
+                self._indexes[dim] = pd.Index(self.coords[dim])
+            try:
+                position = self._indexes[dim].get_loc(dims[dim])
+            except KeyError:
+                raise ValueError(f"SampleSpace: could not find {dim} = {dims[dim]}")
+            flat = flat * size + position
+        return flat
+
+    def index(self, dims: dict) -> int:
+        """The position of a sample, like ``list.index``
+
+        Args:
+            dims (dict): with a value for each sample dimension
+
+        Returns:
+            idx (int): position of this sample
+        """
+        flat = self._flat_index(dims)
+        if self.flat_indices is None:
+            return flat
+        found = np.flatnonzero(self.flat_indices == flat)
+        if len(found) == 0:
+            raise ValueError(f"SampleSpace.index: {dims} is not in this subset")
+        return int(found[0])
+
+    def subset(self, samples: list[dict]) -> "SampleSpace":
+        """Create a SampleSpace with only the given samples
+
+        Args:
+            samples (list[dict]): with the dimension values of each sample to keep, in the order to visit them
+
+        Returns:
+            sample_space (SampleSpace): with the same coords and only these samples
+        """
+        return SampleSpace(self.coords, subset=[self._flat_index(dims) for dims in samples])
+
+
 class DataMover():
     """Move data, using the concept of a data "sample" to define how much data is stored to zarr at once.
     A data sample is defined by :attr:`sample_dims`. For example, if a dataset has dimensions
@@ -25,13 +122,13 @@ class DataMover():
         * This is the same as loop through the data storing one sample at a time,
           except that it stores ``batch_size`` samples in a hard disk cache.
           It clears the cache after every batch.
-        * Multithreading for simultaneous reading/writing could be implemented, but hasn't seemed necessary.
-          Also it would double (or more) the cache requirements.
+        * Set ``prefetch_batches > 0`` to read the next batch(es) on background threads while the
+          current batch is being written. Each batch in flight has its own cache directory,
+          so this requires ``1 + prefetch_batches`` times the cache space of a single batch.
     """
     counter = 0
     data_counter = 0
 
-    stop_event = None
     executor = None
     futures = None
 
@@ -43,6 +140,7 @@ class DataMover():
         transformer=None,
         start=0,
         cache_dir=".",
+        prefetch_batches=0,
     ):
 
         self.source = source
@@ -53,16 +151,22 @@ class DataMover():
         self.counter = start
         self.data_counter = start
         self.outer_cache_dir = cache_dir
+        self.prefetch_batches = prefetch_batches
 
-        # construct the sample indices
+        # construct the sample indices, without enumerating all combinations
         # e.g. {"t0": [date1, date2], "fhrs": [0, 6], "member": [0, 1, 2]}
         all_sample_iterations = {
             key: getattr(source, key)
             for key in self.source.sample_dims
         }
-        self.sample_indices = list()
-        for combo in itertools.product(*all_sample_iterations.values()):
-            self.sample_indices.append(dict(zip(self.source.sample_dims, combo)))
+        self.sample_indices = SampleSpace(all_sample_iterations)
+
+        # the inference target only reads data for the initial conditions,
+        # it computes the forcings for every other time step itself, see AnemoiInferenceWithForcings.store_forcings
+        if type(self.target).__name__ == "AnemoiInferenceWithForcings":
+            self.sample_indices = self.sample_indices.subset(
+                [dims for dims in self.sample_indices if self.target.load_data_flag(dims)]
+            )
 
         self.restart(idx=start)
 
@@ -88,8 +192,19 @@ class DataMover():
             return data
         else:
             logger.debug(f"{self.name}.__next__: counter > len(self)")
+            self.shutdown()
             raise StopIteration
 
+    def batches(self):
+        """Loop through the remaining batches, starting at :attr:`data_counter`
+
+        Yields:
+            batch_idx (int): index of the batch, e.g. for :meth:`get_batch_indices` and :meth:`clear_cache`
+            xds (xr.Dataset or None): the data, see :meth:`get_data`
+        """
+        for batch_idx in range(self.data_counter, len(self)):
+            yield batch_idx, next(self)
+
 
     def get_cache_dir(self, batch_idx):
         return f"{self.outer_cache_dir}/{self.name.lower()}-cache/{batch_idx}"
@@ -105,63 +220,141 @@ class DataMover():
         logger.debug(f"{self.name}._next_data[{self.data_counter}]")
         if self.data_counter < len(self):
             batch_indices = self.get_batch_indices(self.data_counter)
-            cache_dir = self.get_cache_dir(self.data_counter)
-            if len(batch_indices) > 0:
-                dlist = []
-
-                for these_dims in batch_indices:
-
-                    if type(self.target).__name__ == "AnemoiInferenceWithForcings":
-                        is_t0 = getattr(self.target, "load_data_flag", lambda dims: False)(these_dims)
-                        if is_t0:
-                            # if t0 then we want all data for initial conditions, so proceed as "normal"
-                            fds = self.source.open_sample_dataset(
-                                dims=these_dims,
-                                open_static_vars=self.target.always_open_static_vars,
-                                cache_dir=cache_dir,
-                            )
-                            # but, save the structure of the dataset to use for later timesteps to calculate forcings
-                            self.target.save_ds_structure(fds)
-                        else:
-                            # no longer dealing with IC's, and only need to calculate forcings
-                            # we simply take ds structure and get it ready to go through those calcs
-                            fds = self.target.ds_structure.copy()
-                            fds = fds.assign_coords(t0=("t0", [these_dims["t0"]]))
-
-                    else:
-                        # everything other than inference target should go here
-                        fds = self.source.open_sample_dataset(
-                            dims=these_dims,
-                            open_static_vars=self.target.always_open_static_vars,
-                            cache_dir=cache_dir,
-                        )
-
-                    if len(fds) > 0:
-                        fds = self.transformer(fds)
-                        fds = self.target.apply_transforms_to_sample(fds)
-                        dlist.append(fds)
-                if len(dlist) == 1:
-                    xds = dlist[0]
-                else:
-                    # if len(dlist) == 0, this returns an empty dataset
-                    xds = xr.merge(dlist, join="outer", compat="no_conflicts")
-                return xds
+            return self._load_batch(self.data_counter, batch_indices)
+        else:
+            logger.debug(f"{self.name}._next_data: data_counter > len(self)")
+            raise StopIteration
 
+
+    def _load_batch(self, batch_idx, batch_indices):
+        """Open, transform, and merge all samples in a batch
+
+        Args:
+            batch_idx (int): the batch index, used for the cache directory
+            batch_indices (list[dict]): the sample dims to read
+
+        Returns:
+            xds (xr.Dataset or None): None if there are no samples in this batch
+        """
+        cache_dir = self.get_cache_dir(batch_idx)
+        if len(batch_indices) > 0:
+            dlist = [None for _ in batch_indices]
+
+            # start downloading every file in the batch at once, and open samples as their files arrive
+            downloads = dict()
+            for i, these_dims in enumerate(batch_indices):
+                futures = self.source.download_sample(
+                    dims=these_dims,
+                    open_static_vars=self.target.always_open_static_vars,
+                    cache_dir=cache_dir,
+                )
+                downloads[i] = list(futures.values())
+
+            for i in self._completion_order(downloads, len(batch_indices)):
+                these_dims = batch_indices[i]
+                fds = self.source.open_sample_dataset(
+                    dims=these_dims,
+                    open_static_vars=self.target.always_open_static_vars,
+                    cache_dir=cache_dir,
+                )
+
+                if len(fds) > 0:
+                    fds = self.transformer(fds)
+                    fds = self.target.apply_transforms_to_sample(fds)
+                    dlist[i] = fds
+
+            # merge in the original order
+            dlist = [fds for fds in dlist if fds is not None]
+            if len(dlist) == 1:
+                xds = dlist[0]
             else:
-                return None
+                # if len(dlist) == 0, this returns an empty dataset
+                xds = xr.merge(dlist, join="outer", compat="no_conflicts")
+            return xds
+
         else:
-            logger.debug(f"{self.name}._next_data: data_counter > len(self)")
+            return None
+
+
+    @staticmethod
+    def _completion_order(downloads, n_samples):
+        """Yield sample indices in the order that all of their downloads finish,
+        followed by any samples without downloads
+
+        Args:
+            downloads (dict): with sample index as key, and a list of futures as the value
+            n_samples (int): total number of samples
+        """
+        remaining = {i: len(futures) for i, futures in downloads.items()}
+        owner = {future: i for i, futures in downloads.items() for future in futures}
+        for i, count in remaining.items():
+            if count == 0:
+                yield i
+        for future in as_completed(owner):
+            i = owner[future]
+            remaining[i] -= 1
+            if remaining[i] == 0:
+                yield i
+        for i in range(n_samples):
+            if i not in remaining:
+                yield i
+
+
+    def _next_prefetched_data(self):
+        """Return the batch at :attr:`data_counter`, after making sure that the next
+        :attr:`prefetch_batches` batches are being read in the background"""
+        logger.debug(f"{self.name}._next_prefetched_data[{self.data_counter}]")
+        if self.data_counter < len(self):
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.prefetch_batches,
+                    thread_name_prefix=f"{self.name.lower()}-prefetch",
+                )
+                self.futures = dict()
+
+            # batch indices are always determined here, on the main thread
+            last = min(self.data_counter + self.prefetch_batches + 1, len(self))
+            for batch_idx in range(self.data_counter, last):
+                if batch_idx not in self.futures:
+                    batch_indices = self.get_batch_indices(batch_idx)
+                    self.futures[batch_idx] = self.executor.submit(self._load_batch, batch_idx, batch_indices)
+
+            data = self.futures.pop(self.data_counter).result()
+            if self.data_counter == len(self) - 1:
+                self.shutdown()
+            return data
+        else:
+            logger.debug(f"{self.name}._next_prefetched_data: data_counter > len(self)")
             raise StopIteration
 
 
     def get_data(self):
         """Pull a batch of data from the queue"""
         logger.debug(f"{self.name}.get_data")
-        data = self._next_data()
+        if self.prefetch_batches > 0:
+            data = self._next_prefetched_data()
+        else:
+            data = self._next_data()
         self.data_counter += 1
         return data
 
 
+    def shutdown(self):
+        """Stop reading batches in the background, waiting for any batch that is already being read"""
+        if self.executor is not None:
+            logger.debug(f"{self.name}.shutdown: stopping prefetch threads")
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+        self.futures = None
+
+
+    def close(self):
+        """Release anything the mover holds onto, after the last batch has been moved.
+        For the MPI movers, this is collective.
+        """
+        self.shutdown()
+
+
     def clear_cache(self, batch_idx):
         cache_dir = self.get_cache_dir(batch_idx)
         if os.path.isdir(cache_dir):
@@ -169,12 +362,14 @@ class DataMover():
             shutil.rmtree(cache_dir, ignore_errors=True)
 
     def restart(self, idx=0):
-        """Restart the :attr:`data_counter` to get ready for the pass through the data
+        """Restart the :attr:`counter` and :attr:`data_counter` to get ready for the pass through the data
 
         Args:
             idx (int, optional): index to restart to
         """
         logger.debug(f"{self.name}.restart: idx = {idx}")
+        self.shutdown()
+        self.counter = idx
         self.data_counter = idx
 
 
@@ -202,6 +397,7 @@ class DataMover():
 
         # transform it to target space
         xds = self.target.apply_transforms_to_sample(xds)
+        xds = self.target.drop_sample_statistics(xds)
 
         # create container
         # start with the dimensions we haven't read yet (sample_dims)
@@ -258,9 +454,8 @@ class DataMover():
         """
         region = {k: slice(None, None) for k in xds.dims}
         for key in self.target.renamed_sample_dims:
-            full_array = getattr(self.target, key) # e.g. all of the initial conditions
-            batch_indices = [list(full_array).index(value) for value in xds[key].values]
-            region[key] = slice(batch_indices[0], batch_indices[-1]+1)
+            batch_indices = self.target.get_indexer(key, xds[key].values) # e.g. within all of the initial conditions
+            region[key] = slice(int(batch_indices[0]), int(batch_indices[-1])+1)
         return region
 
 
@@ -281,6 +476,7 @@ class MPIDataMover(DataMover):
         transformer=None,
         start=0,
         cache_dir=".",
+        prefetch_batches=0,
     ):
         assert _has_mpi, f"{self.name}.__init__: Unable to import mpi4py, cannot use this class"
 
@@ -295,6 +491,7 @@ class MPIDataMover(DataMover):
             transformer=transformer,
             start=start,
             cache_dir=cache_dir,
+            prefetch_batches=prefetch_batches,
         )
         logger.info(str(self))
 
@@ -303,7 +500,7 @@ class MPIDataMover(DataMover):
         underline = "".join(["-" for _ in range(len(title))])
         msg = f"\n{title}\n{underline}\n"
 
-        for key in ["local_batch_index", "data_per_process", "batch_size"]:
+        for key in ["local_batch_index", "data_per_process", "batch_size", "prefetch_batches"]:
             msg += f"{key:<18s}: {getattr(self, key):02d}\n"
 
         msg += f"{'Total Samples':<18s}: {len(self.sample_indices)}\n"
@@ -318,3 +515,79 @@ class MPIDataMover(DataMover):
         st = (batch_idx * self.batch_size) + self.local_batch_index
         ed = st + self.data_per_process
         return self.sample_indices[st:ed]
+
+
+class MPIDynamicDataMover(MPIDataMover):
+    """Like :class:`MPIDataMover`, except that samples are handed out on request rather than
+    assigned to each process ahead of time. The index of the next sample to move is kept in a counter
+    on the root rank, and each process atomically fetches and increments it (with one-sided MPI communication)
+    whenever it is ready for more work. So, a process that hits a slow or missing file does not hold up the others.
+
+    Note:
+        * Each batch is a single sample, and the batch index is the sample index
+        * The number of batches moved by each process varies, so loop through the data with :meth:`batches`
+        * ``prefetch_batches`` is not supported
+    """
+    def __init__(
+        self,
+        source,
+        target,
+        mpi_topo,
+        transformer=None,
+        start=0,
+        cache_dir=".",
+        prefetch_batches=0,
+    ):
+        assert _has_mpi, f"{self.name}.__init__: Unable to import mpi4py, cannot use this class"
+        if prefetch_batches > 0:
+            raise NotImplementedError(f"{self.name}.__init__: prefetch_batches > 0 is not supported, since samples are handed out one at a time")
+
+        self.topo = mpi_topo
+        self.data_per_process = 1
+        self.local_batch_index = 0
+        self.shared_counter = self.topo.create_counter(value=start)
+        DataMover.__init__(
+            self,
+            source=source,
+            target=target,
+            batch_size=1,
+            transformer=transformer,
+            start=start,
+            cache_dir=cache_dir,
+            prefetch_batches=prefetch_batches,
+        )
+        logger.info(str(self))
+
+    def restart(self, idx=0):
+        """Restart the shared counter, along with the local counters. This is collective.
+
+        Args:
+            idx (int, optional): sample index to restart to
+        """
+        super().restart(idx=idx)
+        self.shared_counter.reset(idx)
+
+    def close(self):
+        """Free the shared counter's MPI window, this is collective"""
+        super().close()
+        if self.shared_counter is not None:
+            self.shared_counter.free()
+            self.shared_counter = None
+
+    def batches(self):
+        """Claim and move one sample at a time, until there are none left
+
+        Yields:
+            batch_idx (int): the sample index, e.g. for :meth:`get_batch_indices` and :meth:`clear_cache`
+            xds (xr.Dataset): the data, see :meth:`get_data`
+        """
+        while True:
+            batch_idx = self.shared_counter.fetch_and_add(1)
+            if batch_idx >= len(self):
+                logger.debug(f"{self.name}.batches: no samples left")
+                return
+            self.counter = batch_idx
+            self.data_counter = batch_idx
+            xds = self.get_data()
+            self.counter += 1
+            yield batch_idx, xds
@@ -18,7 +18,7 @@ from ufs2arco.mpi import MPITopology, SerialTopology
 import ufs2arco.sources
 from ufs2arco.transforms import Transformer
 import ufs2arco.targets
-from ufs2arco.datamover import DataMover, MPIDataMover
+from ufs2arco.datamover import DataMover, MPIDataMover, MPIDynamicDataMover
 
 logger = logging.getLogger("ufs2arco")
 
@@ -28,7 +28,7 @@ class Driver:
     Attributes:
         config (dict): Configuration dictionary loaded from the YAML file.
         Source, Transformer, Target
-        Mover (Type[DataMover] | Type[MPIDataMover]): The data mover class (DataMover or MPIDataMover).
+        Mover (Type[DataMover] | Type[MPIDataMover] | Type[MPIDynamicDataMover]): The data mover class (DataMover, MPIDataMover, or MPIDynamicDataMover).
 
     Methods:
         __init__(config_filename: str): Initializes the Driver object with configuration from the specified YAML file.
@@ -161,7 +161,7 @@ class Driver:
 
         kwargs = self.mover_kwargs.copy()
         if self.use_mpi:
-            Mover = MPIDataMover
+            Mover = MPIDynamicDataMover if self.mover_name == "mpidynamicdatamover" else MPIDataMover
             kwargs["mpi_topo"] = self.topo
         else:
             Mover = DataMover
@@ -176,7 +176,11 @@ class Driver:
         Returns:
             bool: True if MPI is to be used, False otherwise.
         """
-        return self.config["mover"]["name"].lower() == "mpidatamover"
+        return self.mover_name in ("mpidatamover", "mpidynamicdatamover")
+
+    @property
+    def mover_name(self) -> str:
+        return self.config["mover"]["name"].lower()
 
     @property
     def source_kwargs(self) -> dict:
@@ -257,16 +261,17 @@ class Driver:
         self.setup(runtype="create")
 
         # create container, only if mover start is not 0
+        # and only keep statistics in memory if we'll see every sample
         if self.mover.start == 0:
             self.write_container(overwrite=overwrite)
+            self.target.reset_statistics()
+        else:
+            self.target.check_existing_store()
 
         # loop through batches
         n_batches = len(self.mover)
         missing_dims = []
-        for batch_idx in range(self.mover.start, n_batches):
-
-            xds = next(self.mover)
-
+        for batch_idx, xds in self.mover.batches():
 
             # xds is None if MPI rank looks for non existent indices (i.e., last batch scenario)
             # len(xds) == 0 if we couldn't find the file we were looking for
@@ -274,6 +279,8 @@ class Driver:
             if has_content:
 
                 xds = xds.reset_coords(drop=True)
+                self.target.update_statistics(xds)
+                xds = self.target.drop_sample_statistics(xds)
                 region = self.mover.find_my_region(xds)
                 xds.to_zarr(self.store_path, region=region)
                 self.mover.clear_cache(batch_idx)
@@ -288,6 +295,7 @@ class Driver:
             logger.info(f"Done with batch {batch_idx+1} / {n_batches}")
 
         self.topo.barrier()
+        self.mover.close()
         logger.info(f"Done moving the data\n")
 
         self.report_missing_data(missing_dims)
@@ -297,17 +305,18 @@ class Driver:
     def patch(self):
 
         self.setup(runtype="patch")
+        self.target.check_existing_store()
         missing_dims = _open_patch_yaml(self.get_missing_data_path(self.store_path))
 
         logger.info(f"Starting patch workflow with missing_dims\n{missing_dims}\n")
 
-        # hacky for now, reset the mover's sample_indices to be the missing dims
-        self.mover.sample_indices = missing_dims
+        # reset the mover's sample_indices to be the missing dims
+        self.mover.sample_indices = self.mover.sample_indices.subset(missing_dims)
         self.mover.restart(idx=0)
 
         missing_again = list()
         n_batches = len(self.mover)
-        for batch_idx, xds in enumerate(self.mover):
+        for batch_idx, xds in self.mover.batches():
 
             # xds is None if MPI rank looks for non existent indices (i.e., last batch scenario)
             # len(xds) == 0 if we couldn't find the file we were looking for
@@ -315,6 +324,7 @@ class Driver:
             if has_content:
 
                 xds = xds.reset_coords(drop=True)
+                xds = self.target.drop_sample_statistics(xds)
                 region = self.mover.find_my_region(xds)
                 xds.to_zarr(self.store_path, region=region)
                 self.mover.clear_cache(batch_idx)
@@ -328,6 +338,7 @@ class Driver:
             logger.info(f"Done with batch {batch_idx+1} / {n_batches}")
 
         self.topo.barrier()
+        self.mover.close()
         logger.info(f"Done moving the data\n")
 
         self.report_missing_data(missing_again)
@@ -170,17 +170,24 @@ class Layers2Pressure():
         pressfc: xr.DataArray,
         temp: xr.DataArray,
         spfh: xr.DataArray,
+        prsi: Optional[xr.DataArray]=None,
+        dlogp: Optional[xr.DataArray]=None,
     ) -> xr.DataArray:
         """Compute a hydrostatic approximation of the layer thickness at each vertical level.
 
         Args:
             pressfc, temp, spfh (xr.DataArray): surface pressure, temperature, and specific humidity
+            prsi (xr.DataArray, optional): pressure at vertical grid interfaces, computed from pressfc if not provided
+            dlogp (xr.DataArray, optional): difference of log interface pressure, from :meth:`calc_dlogp`,
+                computed from prsi if not provided
 
         Returns:
             delz (xr.DataArray): layer thickness (m)
         """
-        prsi = self.calc_pressure_interfaces(pressfc)
-        dlogp = self.calc_dlogp(prsi)
+        if dlogp is None:
+            if prsi is None:
+                prsi = self.calc_pressure_interfaces(pressfc)
+            dlogp = self.calc_dlogp(prsi)
         dlogp = dlogp.sel({self.level_name: temp[self.level_name]})
         spfh_thresh = spfh.where(spfh > self.q_min, self.q_min)
         return -self.Rd /  self.g * temp * (1. + self.z_vir*spfh_thresh) * dlogp
@@ -191,6 +198,8 @@ class Layers2Pressure():
         temp: xr.DataArray,
         spfh: xr.DataArray,
         delz: xr.DataArray,
+        prsi: Optional[xr.DataArray]=None,
+        dlogp: Optional[xr.DataArray]=None,
     ) -> xr.DataArray:
         """Compute pressure at vertical grid cell center (i.e., layer mean)
 
@@ -199,15 +208,22 @@ class Layers2Pressure():
 
         Args:
             pressfc, temp, spfh, delz (xr.DataArray): surface pressure, temperature, specific humidity, and layer thickness
+            prsi (xr.DataArray, optional): pressure at vertical grid interfaces, computed from pressfc if not provided
+            dlogp (xr.DataArray, optional): only pass this if ``delz`` was computed by :meth:`calc_delz` with the same ``dlogp``.
+                Then ``-g*delz = rTv*dlogp``, so the layer mean pressure is simply ``dpres / dlogp``, and ``delz`` is not used
 
         Returns:
             prsl (xr.DataArray): layer mean thickness
         """
 
-        prsi = self.calc_pressure_interfaces(pressfc)
+        if prsi is None:
+            prsi = self.calc_pressure_interfaces(pressfc)
         dpres = self.calc_pressure_thickness(prsi)
         dpres = dpres.sel({self.level_name: temp[self.level_name]})
 
+        if dlogp is not None:
+            return dpres / dlogp.sel({self.level_name: temp[self.level_name]})
+
         # rTv computed here:
         # https://github.com/NOAA-GFDL/GFDL_atmos_cubed_sphere/blob/ab195d5026ca4c221b6cbb3888c8ae92d711f89a/driver/fvGFS/atmosphere.F90#L2199-L2200
         spfh_thresh = spfh.where(spfh > self.q_min, self.q_min)
@@ -234,32 +250,26 @@ class Layers2Pressure():
             geopotential (xr.DataArray): height in [m^2 / s^2] (i.e. height * gravity)
         """
 
-        # a coordinate helper
-        kp1_left = xr.DataArray(
-            np.arange(len(self.pfull)),
-            coords={self.level_name: self.pfull.values},
+        # positions in the full vertical grid, to figure out which end of delz is at the ground
+        positions = self.pfull.to_index().get_indexer(delz[self.level_name].values)
+        assert (positions >= 0).all(), \
+            f"Layers2Pressure.calc_geopotential: can't find all of delz['{self.level_name}'] in the vertical grid"
+        steps = np.diff(positions)
+        assert (steps > 0).all() or (steps < 0).all(), \
+            f"Layers2Pressure.calc_geopotential: delz['{self.level_name}'] needs to be monotonic"
+
+        geopotential = xr.apply_ufunc(
+            _integrate_geopotential,
+            hgtsfc.reset_coords(drop=True),
+            delz.reset_coords(drop=True),
+            input_core_dims=[[], [self.level_name]],
+            output_core_dims=[[self.level_name]],
+            kwargs={"g": self.g, "ground_is_last": bool(positions[0] <= positions[-1])},
+            dask="parallelized",
+            output_dtypes=[np.result_type(hgtsfc.dtype, delz.dtype)],
         )
-
-        # Geopotential at the surface
-        phi0 = self.g * hgtsfc
-        phi0 = phi0.expand_dims({"kp1": [len(self.pfull)]})
-        phi0 = phi0.reset_coords(drop=True)
-
-        # Concatenate, cumulative sum from the ground to TOA
-        dz = self.g*np.abs(delz)
-        dz["kp1"] = kp1_left.sel({self.level_name: delz[self.level_name]})
-        dz = dz.swap_dims({self.level_name: "kp1"}).drop_vars(self.level_name)
-        dz = dz.reset_coords(drop=True)
-
-        phii = xr.concat([dz,phi0], dim="kp1", data_vars="all")
-
-        phii = phii.sortby("kp1", ascending=False)
-        phii = phii.cumsum("kp1")
-        phii = phii.sortby("kp1", ascending=True)
-
-        # At last, geopotential is interfacial value + .5 * layer thickness * gravity
-        geopotential = phii - 0.5 * dz
-        geopotential = geopotential.swap_dims({"kp1": self.level_name}).drop_vars("kp1")
+        geopotential = geopotential.transpose(*delz.dims, ...)
+        geopotential.attrs = {}
         geopotential.attrs["units"] = "m**2 / s**2"
         geopotential.attrs["description"] = "Diagnosed using ufs2arco.Layers2Pressure.calc_geopotential"
         return geopotential
@@ -273,6 +283,9 @@ class Layers2Pressure():
     ):
         """Interpolate data on FV3 native vertical grid to pressure level (p*)
 
+        The two levels that bracket p* are gathered directly from ``xda``, using the indices in ``cds``,
+        and interpolated linearly in log pressure.
+
         Args:
             xda (xr.DataArray): field to be interpolated
             pstar (float): pressure level to be interpolated to, same units as prsl please
@@ -286,54 +299,127 @@ class Layers2Pressure():
         if cds is None:
             cds = self.get_interp_coefficients(pstar, prsl)
 
-        xda_left = xda.where(cds["is_left"]).sum(self.level_name)
-        xda_right = xda.where(cds["is_right"]).sum(self.level_name)
+        return self._interp_levels(xda, cds)
+
+
+    def interp2pressure_levels(
+        self,
+        xds: xr.Dataset,
+        pstar: list | np.ndarray,
+        prsl: xr.DataArray,
+        cds: Optional[xr.Dataset]=None,
+    ) -> xr.Dataset:
+        """Interpolate many fields on the FV3 native vertical grid to many pressure levels at once
+
+        The interpolation coefficients are computed once for all pressure levels, and
+        each field is then interpolated to every level in a single pass.
+        If the data are chunked with dask, the result has the same chunks as the input in
+        every dimension other than the vertical, which is a single chunk.
 
-        result = xda_left + (xda_right - xda_left) * cds["factor"]
+        Args:
+            xds (xr.Dataset): with the fields to be interpolated, each with the vertical dimension ``level_name``
+            pstar (array_like): pressure levels to interpolate to, same units as prsl please
+            prsl (xr.DataArray): layer mean pressure
+            cds (xr.Dataset, optional): from :meth:`get_interp_coefficients`, computed if not provided
 
-        mask = (cds["is_right"].sum(self.level_name) > 0) & (cds["is_left"].sum(self.level_name) > 0)
-        return result.where(mask)
+        Returns:
+            pds (xr.Dataset): with each field interpolated to the pressure levels, along the new dimension "pstar"
+        """
+
+        pstar = np.atleast_1d(pstar)
+        fields = [key for key in xds.data_vars if self.level_name in xds[key].dims]
+        assert len(fields) > 0, \
+            f"Layers2Pressure.interp2pressure_levels: no fields with vertical dimension '{self.level_name}' to interpolate"
+
+        if cds is None:
+            if prsl.chunks is not None:
+                chunksizes = xds[fields[0]].chunksizes
+                chunks = {d: chunksizes.get(d, -1) for d in prsl.dims}
+                chunks[self.level_name] = -1
+                prsl = prsl.chunk(chunks)
+            cds = self.get_interp_coefficients(pstar, prsl)
+
+        pds = xr.Dataset(attrs=xds.attrs.copy())
+        for key in fields:
+            xda = xds[key]
+            if xda.chunks is not None:
+                xda = xda.chunk({self.level_name: -1})
+            pds[key] = self._interp_levels(xda, cds)
+            pds[key].attrs = xds[key].attrs.copy()
+        return pds
 
 
     def get_interp_coefficients(self, pstar: float, prsl: xr.DataArray) -> xr.Dataset:
         """Compute the coefficients needed to interpolate between pressure levels
 
+        The bracketing levels are found with a single :func:`numpy.searchsorted` over every column at once,
+        which assumes that prsl is monotonic in each column (as it is on the FV3 vertical grid).
+        If prsl is chunked with dask, the vertical dimension needs to be in a single chunk.
+
         Args:
             pstar (float): pressure level to interpolate to in same units as prsl
             prsl (xr.DataArray): layer mean pressure
 
         Returns:
-            cds (xr.Dataset): with coefficients needed to do interpolation
+            cds (xr.Dataset): with coefficients needed to do interpolation, i.e.
+                the index of the levels left (lower pressure) and right (higher pressure) of pstar,
+                the distance to each in log pressure, the interpolation factor, and
+                a mask that is False where pstar is outside of the column (no extrapolation)
         """
-        dlev = pstar - prsl
-        dloglev = np.log(pstar) - np.log(prsl)
-
-        # get coefficients representing pressure distance left and right of pstar
-        is_left = dlev == dlev.where(dlev>=0).min(self.level_name)
-        is_right = dlev == dlev.where(dlev<=0).max(self.level_name)
+        pstar_values = np.atleast_1d(pstar).astype(np.float64)
+        results = xr.apply_ufunc(
+            _bracketing_levels,
+            prsl,
+            kwargs={"pstar": pstar_values},
+            input_core_dims=[[self.level_name]],
+            output_core_dims=[["pstar"]]*5,
+            dask="parallelized",
+            output_dtypes=[np.int64, np.int64, bool, np.float64, np.float64],
+            dask_gufunc_kwargs={"output_sizes": {"pstar": len(pstar_values)}},
+        )
+        cds = xr.Dataset(
+            dict(zip(["left_index", "right_index", "mask", "p_left", "p_right"], results)),
+        )
 
         # TODO: add extrapolation from level to ground here
-        p_left = dloglev.where(is_left).sum(self.level_name)
-        p_right = -dloglev.where(is_right).sum(self.level_name)
-
-        denominator = p_left + p_right
-        denominator = denominator.where(denominator > 1e-6, 1e-6)
-        factor = p_left / denominator
-        factor = factor.where(
+        denominator = cds["p_left"] + cds["p_right"]
+        cds["denominator"] = denominator.where(denominator > 1e-6, 1e-6)
+        factor = cds["p_left"] / cds["denominator"]
+        cds["factor"] = factor.where(
             factor < 10.,
             10.
         ).where(
             factor > -10.,
             -10.,
         )
-        return xr.Dataset({
-            "is_left": is_left,
-            "is_right": is_right,
-            "p_left": p_left,
-            "p_right": p_right,
-            "denominator": denominator,
-            "factor": factor,
-        })
+
+        if np.ndim(pstar) == 0:
+            cds = cds.squeeze("pstar", drop=True)
+        else:
+            cds = cds.assign_coords(pstar=pstar_values)
+        return cds
+
+
+    def _interp_levels(self, xda: xr.DataArray, cds: xr.Dataset) -> xr.DataArray:
+        """Interpolate ``xda`` between the levels in ``cds``, for every pstar at once"""
+        has_pstar = "pstar" in cds.dims
+        if not has_pstar:
+            cds = cds.expand_dims("pstar", axis=-1)
+
+        result = xr.apply_ufunc(
+            _interp_along_last_axis,
+            xda,
+            cds["left_index"],
+            cds["right_index"],
+            cds["factor"],
+            cds["mask"],
+            input_core_dims=[[self.level_name]] + [["pstar"]]*4,
+            output_core_dims=[["pstar"]],
+            dask="parallelized",
+            output_dtypes=[np.result_type(xda.dtype, cds["factor"].dtype)],
+        )
+        return result if has_pstar else result.squeeze("pstar", drop=True)
+
 
     def _dphalf_to_pfull(self, xda, name):
         xds = xda.to_dataset(name=name)
@@ -342,3 +428,115 @@ class Layers2Pressure():
         xds = xds.swap_dims({self.interface_name: self.level_name})
         xds = xds.drop_vars(self.interface_name)
         return xds[name]
+
+
+def _integrate_geopotential(hgtsfc: np.ndarray, delz: np.ndarray, g: float, ground_is_last: bool) -> np.ndarray:
+    """Integrate the hydrostatic layer thickness from the ground up to the top of the atmosphere
+
+    The sum runs over a reversed view of the levels, directly into the single output array.
+
+    Args:
+        hgtsfc (np.ndarray): surface height, broadcastable to delz without its last axis
+        delz (np.ndarray): layer thickness with the vertical axis last
+        g (float): gravity
+        ground_is_last (bool): True if the last level is closest to the ground
+
+    Returns:
+        geopotential (np.ndarray): at layer centers, shaped like delz
+    """
+    shape = np.broadcast_shapes(np.shape(hgtsfc) + (1,), delz.shape)
+    dtype = np.result_type(hgtsfc, delz)
+
+    dz = np.abs(np.broadcast_to(delz, shape), dtype=dtype)
+    dz *= g
+    geopotential = np.empty(shape, dtype=dtype)
+
+    upward = slice(None, None, -1) if ground_is_last else slice(None)
+    np.cumsum(dz[..., upward], axis=-1, out=geopotential[..., upward])
+
+    # interface value at the top of each layer, minus half of the layer
+    geopotential += g * np.asarray(hgtsfc, dtype=dtype)[..., None]
+    dz *= 0.5
+    geopotential -= dz
+    return geopotential
+
+
+def _interp_along_last_axis(
+    x: np.ndarray,
+    left_index: np.ndarray,
+    right_index: np.ndarray,
+    factor: np.ndarray,
+    mask: np.ndarray,
+) -> np.ndarray:
+    """Linear interpolation between the levels ``left_index`` and ``right_index`` on the last axis of ``x``,
+    broadcasting the leading dimensions, and NaN where ``mask`` is False"""
+    leading = np.broadcast_shapes(x.shape[:-1], left_index.shape[:-1])
+    x = np.broadcast_to(x, leading + x.shape[-1:])
+    left = np.take_along_axis(x, np.broadcast_to(left_index, leading + left_index.shape[-1:]), axis=-1)
+    right = np.take_along_axis(x, np.broadcast_to(right_index, leading + right_index.shape[-1:]), axis=-1)
+    result = left + (right - left) * factor
+    return np.where(mask, result, np.nan)
+
+
+def _bracketing_levels(prsl: np.ndarray, pstar: np.ndarray) -> tuple:
+    """Find the vertical levels that bracket each target pressure, in every column
+
+    To search all columns at once, the log pressure in each column is shifted
+    into its own non-overlapping range, so that the flattened array is sorted and a single
+    :func:`numpy.searchsorted` finds the position of every target pressure in every column.
+
+    Args:
+        prsl (np.ndarray): layer mean pressure with the vertical dimension last, monotonic in each column
+        pstar (np.ndarray): 1D array of target pressures, same units as prsl
+
+    Returns:
+        left_index, right_index (np.ndarray): of the level with the closest pressure <= and >= pstar,
+            with shape prsl.shape[:-1] + pstar.shape
+        mask (np.ndarray): True where both levels exist
+        p_left, p_right (np.ndarray): log pressure distance from pstar to the left and right levels
+    """
+    n_levels = prsl.shape[-1]
+    shape = prsl.shape[:-1] + pstar.shape
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logp = np.log(prsl.reshape(-1, n_levels).astype(np.float64))
+        logpstar = np.log(pstar)
+    n_columns = logp.shape[0]
+
+    # if pressure decreases with level index, search the flipped columns
+    finite = np.isfinite(logp).all(axis=-1)
+    descending = n_levels > 1 and finite.any() and logp[finite][0, 0] > logp[finite][0, -1]
+    if descending:
+        logp = logp[:, ::-1]
+    logp = np.where(finite[:, None], logp, 0.)
+
+    lo = min(logp.min(initial=0.), logpstar.min(initial=0.))
+    hi = max(logp.max(initial=0.), logpstar.max(initial=0.))
+    offset = np.arange(n_columns, dtype=np.float64)[:, None] * (hi - lo + 1.)
+    keys = ((logp - lo) + offset).ravel()
+    queries = (logpstar[None, :] - lo) + offset
+
+    # number of levels in each column with pressure <= pstar
+    n_below = np.searchsorted(keys, queries.ravel(), side="right").reshape(n_columns, -1)
+    n_below -= np.arange(n_columns)[:, None] * n_levels
+
+    left = n_below - 1
+    left_in = np.clip(left, 0, n_levels-1)
+    exact = (left >= 0) & (np.take_along_axis(logp, left_in, axis=-1) == logpstar[None, :])
+    right = np.where(exact, left, n_below)
+    right_in = np.clip(right, 0, n_levels-1)
+    mask = (left >= 0) & (right < n_levels) & finite[:, None]
+
+    p_left = np.where(mask, logpstar[None, :] - np.take_along_axis(logp, left_in, axis=-1), 0.)
+    p_right = np.where(mask, np.take_along_axis(logp, right_in, axis=-1) - logpstar[None, :], 0.)
+
+    if descending:
+        left_in = n_levels - 1 - left_in
+        right_in = n_levels - 1 - right_in
+
+    return (
+        left_in.reshape(shape),
+        right_in.reshape(shape),
+        mask.reshape(shape),
+        p_left.reshape(shape),
+        p_right.reshape(shape),
+    )
@@ -4,6 +4,8 @@ import logging
 import warnings
 from typing import Optional, Any, List
 
+import numpy as np
+
 try:
     from mpi4py import MPI
     _has_mpi = True
@@ -20,6 +22,9 @@ class MPITopology:
     Handles MPI-based parallel processing topology.
     """
 
+    # message tag used by exchange_edges
+    _edge_tag = 77
+
     def __init__(
         self,
         log_dir: Optional[str] = None,
@@ -114,6 +119,114 @@ class MPITopology:
     def any(self, local_array, result_buffer):
         self.Reduce(local_array, result_buffer, op=MPI.LOR)
 
+    def reduce_records(self, local_array, result_buffer, func):
+        """Reduce to the root rank with a user defined operation, which combines records
+
+        Args:
+            local_array (np.ndarray): float64 array with shape (n_records, record_size)
+            result_buffer (np.ndarray): same shape as local_array, only filled on the root rank
+            func (callable): ``func(records, result)`` merges records into result, in place.
+                It has to be commutative and associative, and work on any number of records
+                since MPI can apply it to pieces of the arrays.
+        """
+        assert local_array.dtype == np.float64 and local_array.ndim == 2, \
+            f"MPITopology.reduce_records: need a 2D float64 array, got {local_array.dtype} with shape {local_array.shape}"
+        n_records, record_size = local_array.shape
+
+        def op_func(inmem, inoutmem, datatype):
+            records = np.frombuffer(inmem, dtype=np.float64).reshape(-1, record_size)
+            result = np.frombuffer(inoutmem, dtype=np.float64).reshape(-1, record_size)
+            func(records, result)
+
+        record = MPI.DOUBLE.Create_contiguous(record_size).Commit()
+        op = MPI.Op.Create(op_func, commute=True)
+        try:
+            self.comm.Reduce(
+                [local_array, n_records, record],
+                [result_buffer, n_records, record],
+                op=op,
+                root=self.root,
+            )
+        finally:
+            op.Free()
+            record.Free()
+
+    def exchange_edges(self, send_array=None, recv_buffer=None) -> None:
+        """Send an array to the previous rank, and receive one from the next rank,
+        e.g. to share the first time step of each rank's contiguous block of data
+
+        Args:
+            send_array (np.ndarray, optional): sent to rank - 1, if provided
+            recv_buffer (np.ndarray, optional): filled with the array from rank + 1, if provided
+        """
+        request = None
+        if send_array is not None:
+            request = self.comm.Isend(send_array, dest=self.rank-1, tag=self._edge_tag)
+        if recv_buffer is not None:
+            self.comm.Recv(recv_buffer, source=self.rank+1, tag=self._edge_tag)
+        if request is not None:
+            request.Wait()
+
+    def create_counter(self, value: int = 0) -> "SharedCounter":
+        """Create a counter on the root rank that all processes can increment. This is collective."""
+        return SharedCounter(self.comm, root=self.root, value=value)
+
+
+class SharedCounter:
+    """
+    An integer that lives on the root rank, which any process can atomically fetch and increment
+    with one-sided MPI communication (``MPI_Fetch_and_op``), without the root process having to respond.
+    """
+
+    def __init__(self, comm, root: int = 0, value: int = 0) -> None:
+        """
+        Args:
+            comm (MPI.Comm): the communicator, all processes in it have to call this
+            root (int, optional): the rank that holds the counter
+            value (int, optional): the initial value
+        """
+        self.comm = comm
+        self.root = root
+        itemsize = MPI.INT64_T.Get_size()
+        window_size = itemsize if comm.Get_rank() == root else 0
+        self.win = MPI.Win.Allocate(window_size, disp_unit=itemsize, comm=comm)
+        self.reset(value)
+
+    def reset(self, value: int = 0) -> None:
+        """Set the counter, this is collective"""
+        self.comm.Barrier()
+        if self.comm.Get_rank() == self.root:
+            buffer = np.array([value], dtype=np.int64)
+            self.win.Lock(self.root, MPI.LOCK_EXCLUSIVE)
+            self.win.Accumulate(buffer, self.root, op=MPI.REPLACE)
+            self.win.Unlock(self.root)
+        self.comm.Barrier()
+
+    def fetch_and_add(self, increment: int = 1) -> int:
+        """Atomically add ``increment`` to the counter
+
+        Returns:
+            value (int): the value before it was incremented
+        """
+        buffer = np.array([increment], dtype=np.int64)
+        result = np.zeros(1, dtype=np.int64)
+        self.win.Lock(self.root, MPI.LOCK_SHARED)
+        self.win.Fetch_and_op(buffer, result, self.root, op=MPI.SUM)
+        self.win.Unlock(self.root)
+        return int(result[0])
+
+    def free(self) -> None:
+        """Release the MPI window, this is collective"""
+        if self.win is not None:
+            self.win.Free()
+            self.win = None
+
+    def __enter__(self) -> "SharedCounter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.free()
+
 
 class SerialTopology:
     """
@@ -184,7 +297,8 @@ class SerialTopology:
         pass
 
     def gather(self, local_array):
-        return local_array
+        # a list with one entry per rank, same as MPI
+        return [local_array]
 
     # since the communication doesn't need to happen
     # we can assume these results already exist
@@ -200,3 +314,10 @@ class SerialTopology:
 
     def any(self, local_array, result_buffer):
         result_buffer[:] = local_array
+
+    def reduce_records(self, local_array, result_buffer, func):
+        result_buffer[:] = local_array
+
+    def exchange_edges(self, send_array=None, recv_buffer=None) -> None:
+        assert send_array is None and recv_buffer is None, \
+            f"SerialTopology.exchange_edges: there are no other ranks to exchange with"
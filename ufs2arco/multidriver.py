@@ -159,9 +159,17 @@ class MultiDriver(Driver):
             # After the first source, drop "forcings" from target kwargs... no need to compute them more than once
             kwargs.pop("forcings", None)
 
+        # the first target fills in the time steps without data,
+        # so it needs to carry over the static variables from every source
+        if name == "anemoi_inference_with_forcings":
+            self.targets[0].static_vars = list(dict.fromkeys(key for target in self.targets for key in target.static_vars))
+
 
     def _init_mover(self):
 
+        if self.mover_name == "mpidynamicdatamover":
+            raise NotImplementedError(f"MultiDriver._init_mover: mpidynamicdatamover is not supported with multiple sources, use mpidatamover")
+
         kwargs = self.mover_kwargs.copy()
         if self.use_mpi:
             Mover = MPIDataMover
@@ -203,8 +211,12 @@ class MultiDriver(Driver):
         self.setup(runtype="create")
 
         # create container, only if mover start is not 0
+        # and only keep statistics in memory if we'll see every sample
         if self.mover.start == 0:
             self.write_container(overwrite=overwrite)
+            self.target.reset_statistics()
+        else:
+            self.target.check_existing_store()
 
         # loop through batches
         n_batches = len(self.mover)
@@ -235,6 +247,8 @@ class MultiDriver(Driver):
             if all(foundit) and len(foundit) == len(self.movers):
 
                 mds = self.target.merge_multisource(dslist)
+                self.target.update_statistics(mds)
+                mds = self.target.drop_sample_statistics(mds)
 
                 region = self.mover.find_my_region(mds)
                 mds.to_zarr(self.target.store_path, region=region)
@@ -244,6 +258,8 @@ class MultiDriver(Driver):
             logger.info(f"Done with batch {batch_idx+1} / {n_batches}")
 
         self.topo.barrier()
+        for mover in self.movers:
+            mover.close()
         logger.info(f"Done moving the data\n")
 
         self.report_missing_data(missing_dims)
@@ -6,11 +6,6 @@ import numpy as np
 
 from .ufsregridder import UFSRegridder
 
-try:
-    import xesmf as xe
-except ImportError:
-    pass
-
 
 class CICE6Regridder(UFSRegridder):
     """
@@ -42,6 +37,9 @@ class CICE6Regridder(UFSRegridder):
 
     def _create_regridder(self, ds_in: xr.Dataset) -> None:
 
+        # imported here, so that ESMF is only loaded when it's needed
+        import xesmf as xe
+
         # create rotation dataset
         self.rotation_file = self.config.get("rotation_file", None)
         self.ds_rot = None
@@ -7,11 +7,6 @@ import cf_xarray as cfxr
 
 from .ufsregridder import UFSRegridder
 
-try:
-    import xesmf as xe
-except ImportError:
-    pass
-
 
 class MOM6Regridder(UFSRegridder):
     """
@@ -135,6 +130,9 @@ class MOM6Regridder(UFSRegridder):
     
     def _create_regridder(self, ds_in: xr.Dataset) -> None:
 
+        # imported here, so that ESMF is only loaded when it's needed
+        import xesmf as xe
+
         # create rotation dataset
         self.rotation_file = self.config.get("rotation_file", None)
         self.ds_rot = None
@@ -1,4 +1,5 @@
 import yaml
+import importlib.util
 import numpy as np
 import xarray as xr
 from abc import ABC, abstractmethod
@@ -6,13 +7,8 @@ import warnings
 
 from .gaussian_grid import gaussian_latitudes
 
-try:
-    from xesmf import Regridder
-
-    _has_xesmf = True
-except ImportError:
-    Regridder = None
-    _has_xesmf = False
+# xesmf is only imported when a regridder is created, since importing it also loads ESMF
+_has_xesmf = importlib.util.find_spec("xesmf") is not None
 
 
 class UFSRegridder(ABC):
@@ -121,9 +117,9 @@ class UFSRegridder(ABC):
         self,
         ds_in: xr.Dataset,
         ds_rot: xr.Dataset,
-        rg_tt: Regridder,
-        rg_ut: Regridder,
-        rg_vt: Regridder,
+        rg_tt: "xesmf.Regridder",
+        rg_ut: "xesmf.Regridder",
+        rg_vt: "xesmf.Regridder",
         coords_xy: set,
         variable_map: dict,
     ) -> xr.Dataset:
@@ -128,6 +128,16 @@ class Source:
         """
         return xds
 
+    def download_sample(self, dims: dict, open_static_vars: bool, cache_dir: str) -> dict:
+        """
+        An optional routine that starts downloading the files for a sample in the background,
+        so that a whole batch can be downloaded at once. See example in noaa_grib_forecast.py.
+
+        Returns:
+            futures (dict): with :class:`concurrent.futures.Future` values, empty if there is nothing to download
+        """
+        return dict()
+
 
     def apply_slices(self, xds: xr.Dataset) -> xr.Dataset:
         """Apply any slices, for now just data selection via "sel" or "isel"
@@ -0,0 +1,117 @@
+import os
+import time
+import random
+import logging
+import tempfile
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import fsspec
+
+logger = logging.getLogger("ufs2arco")
+
+class DownloadPool:
+    """
+    Run downloads on a bounded thread pool, with a limit on the number of simultaneous
+    requests to each host, and retries with exponential backoff.
+
+    Example:
+        >>> pool = DownloadPool(max_workers=8, max_per_host=4)
+        >>> future = pool.submit("s3://noaa-gefs-pds/...", download_file, "s3://noaa-gefs-pds/...", "/tmp/cache/file")
+        >>> local_file = future.result()
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_per_host: int = 4,
+        retries: int = 3,
+        backoff: float = 1.0,
+    ) -> None:
+        """
+        Args:
+            max_workers (int, optional): total number of simultaneous downloads
+            max_per_host (int, optional): number of simultaneous downloads from any one host
+            retries (int, optional): number of times to retry a failed download
+            backoff (float, optional): seconds to wait before the first retry, doubled after each attempt
+        """
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self._executor = None
+        self._semaphores = dict()
+        self._lock = threading.Lock()
+
+    def submit(self, url: str, func, *args, **kwargs) -> Future:
+        """Call ``func(*args, **kwargs)`` in the background, counting it as a request to the host in ``url``
+
+        Args:
+            url (str): used to determine the host, may be chained like "filecache::s3://bucket/key"
+            func (callable): does the download, should raise FileNotFoundError if there's nothing to retry
+
+        Returns:
+            future (concurrent.futures.Future): with the result of ``func``
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="ufs2arco-download",
+                )
+            host = urlparse(url.split("::")[-1]).netloc
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            semaphore = self._semaphores[host]
+        return self._executor.submit(self._run, semaphore, url, func, *args, **kwargs)
+
+    def _run(self, semaphore, url, func, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                with semaphore:
+                    return func(*args, **kwargs)
+            except FileNotFoundError:
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                wait = self.backoff * 2**attempt * (1 + random.random())
+                logger.debug(f"DownloadPool: attempt {attempt+1} for {url} failed with {e}, retrying in {wait:.1f}s")
+                time.sleep(wait)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+def download_file(url: str, local_path: str, **storage_options) -> str:
+    """Download a full remote file, unless it is already there.
+
+    The file is written to a temporary name and then renamed, so that a partially
+    downloaded file is never mistaken for a complete one.
+
+    Args:
+        url (str): the remote path, a leading "filecache::" is ignored
+        local_path (str): where to put it
+        storage_options: passed to :func:`fsspec.core.url_to_fs`
+
+    Returns:
+        local_path (str)
+    """
+    if os.path.isfile(local_path):
+        return local_path
+
+    fs, remote_path = fsspec.core.url_to_fs(url.split("::")[-1], **storage_options)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(local_path), suffix=".tmp")
+    os.close(fd)
+    try:
+        fs.get_file(remote_path, tmp)
+        os.replace(tmp, local_path)
+    finally:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+    return local_path
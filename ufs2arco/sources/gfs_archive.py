@@ -52,6 +52,10 @@ class GFSArchive(NOAAGribForecastData, Source):
         use_nearest_levels: Optional[bool] = False,
         slices: Optional[dict] = None,
         accum_hrs: Optional[dict] = None,
+        grib_index_dir: Optional[str] = None,
+        fetch_byte_ranges: Optional[bool] = False,
+        max_concurrent_downloads: Optional[int] = 8,
+        max_downloads_per_host: Optional[int] = 4,
     ) -> None:
         """
         Args:
@@ -66,6 +70,12 @@ class GFSArchive(NOAAGribForecastData, Source):
                 {"accum_tp": 1}
                 would be the same as passing filter_by_keys={"stepRange": "5-6"}
                 when reading fhr 6 data using xarray and cfgrib
+            grib_index_dir (str, optional): if provided, store the message table of every GRIB file that gets read here,
+                so that files are only scanned once across batches, MPI processes, and reruns
+            fetch_byte_ranges (bool, optional): if True, use the .idx inventory next to each GRIB file
+                to only download the messages needed for the requested variables
+            max_concurrent_downloads (int, optional): number of files to download at once
+            max_downloads_per_host (int, optional): number of files to download at once from any one host
         """
         self.t0 = pd.date_range(**t0)
         self.fhr = np.arange(fhr["start"], fhr["end"] + 1, fhr["step"])
@@ -75,6 +85,10 @@ class GFSArchive(NOAAGribForecastData, Source):
             use_nearest_levels=use_nearest_levels,
             slices=slices,
             accum_hrs=accum_hrs,
+            grib_index_dir=grib_index_dir,
+            fetch_byte_ranges=fetch_byte_ranges,
+            max_concurrent_downloads=max_concurrent_downloads,
+            max_downloads_per_host=max_downloads_per_host,
         )
 
 
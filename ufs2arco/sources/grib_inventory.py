@@ -0,0 +1,198 @@
+import os
+import logging
+import tempfile
+
+from .grib_messages import GribMessageTable
+
+logger = logging.getLogger("ufs2arco")
+
+def parse_inventory(text: str) -> list[dict]:
+    """Parse a wgrib2 style inventory (the ``.idx`` files next to NOAA GRIB2 files), with lines like
+
+        ``12:345678:d=2024010100:TMP:500 mb:6 hour fcst:``
+
+    Args:
+        text (str): contents of the inventory file
+
+    Returns:
+        inventory (list[dict]): one entry per message, in file order, with keys
+            "offset", "var", "level", "forecast", "kind", and "step_range"
+    """
+    inventory = []
+    for line in text.splitlines():
+        fields = line.strip().split(":")
+        if len(fields) < 6:
+            continue
+        forecast = fields[5]
+        inventory.append({
+            "offset": int(fields[1]),
+            "var": fields[3],
+            "level": fields[4],
+            "forecast": forecast,
+            "kind": _forecast_kind(forecast),
+            "step_range": _forecast_step_range(forecast),
+        })
+    return inventory
+
+
+def _forecast_kind(forecast: str) -> str:
+    """e.g. "0-6 hour acc fcst" -> "acc", "6 hour fcst" -> "", "15 min fcst" -> "" """
+    tokens = forecast.split()
+    if len(tokens) >= 3 and tokens[-1] == "fcst" and tokens[-2] in ("acc", "ave", "max", "min") and not tokens[-3][0].isdigit():
+        return tokens[-2]
+    return ""
+
+
+def _forecast_step_range(forecast: str) -> str | None:
+    """Convert the inventory's forecast time to cfgrib's stepRange, if it's in hours.
+    Returns None when it can't be determined.
+
+    e.g. "anl" -> "0", "6 hour fcst" -> "6", "5-6 hour acc fcst" -> "5-6"
+    """
+    tokens = forecast.split()
+    if forecast == "anl":
+        return "0"
+    if len(tokens) >= 3 and tokens[1] == "hour" and tokens[-1] == "fcst":
+        return tokens[0]
+    return None
+
+
+def merge_ranges(ranges: list[tuple]) -> list[tuple]:
+    """Merge sorted, adjacent or overlapping byte ranges
+
+    Args:
+        ranges (list[tuple]): (start, end) pairs, with end exclusive, and end=None meaning end of file
+
+    Returns:
+        merged (list[tuple]): with as few ranges as possible
+    """
+    merged = []
+    for start, end in sorted(ranges, key=lambda r: r[0]):
+        if len(merged) > 0:
+            last_start, last_end = merged[-1]
+            if last_end is None:
+                continue
+            if start <= last_end:
+                new_end = None if end is None else max(last_end, end)
+                merged[-1] = (last_start, new_end)
+                continue
+        merged.append((start, end))
+    return merged
+
+
+class GribInventoryMap:
+    """
+    Map entries in NOAA's ``.idx`` inventories to the GRIB keys that cfgrib sees.
+
+    The inventory names messages with wgrib2 conventions (e.g. ``TMP:500 mb``), whereas our
+    reference yaml files select messages with cfgrib's ``filter_by_keys`` (e.g. ``paramId=130``).
+    Rather than maintaining a translation table, it is learned by matching message byte offsets
+    in one fully downloaded file with its inventory, see :meth:`learn`. When an inventory
+    has an entry that has not been learned yet, :meth:`select` returns None,
+    which signals that a full download is needed to learn it.
+    """
+
+    def __init__(self, filter_keys: list | tuple | set) -> None:
+        """
+        Args:
+            filter_keys (list, tuple, set): GRIB keys used in ``filter_by_keys``
+        """
+        self.filter_keys = [key for key in filter_keys if key != "stepRange"]
+        self.mapping = dict()
+
+    @staticmethod
+    def descriptor(entry: dict) -> tuple:
+        return (entry["var"], entry["level"], entry["kind"])
+
+    def learn(self, inventory: list[dict], table: GribMessageTable) -> None:
+        """Learn the GRIB keys of each inventory entry from the scanned, complete file
+
+        Args:
+            inventory (list[dict]): from :func:`parse_inventory`
+            table (GribMessageTable): scan of the file that the inventory describes
+        """
+        positions = {key: table.index_keys.index(key) for key in self.filter_keys if key in table.index_keys}
+        headers_by_offset = dict()
+        for header_values, field_ids in table.index.field_ids_index:
+            header = tuple((key, header_values[i]) for key, i in positions.items())
+            for field_id in field_ids:
+                offset = field_id[0] if isinstance(field_id, tuple) else field_id
+                headers_by_offset.setdefault(offset, set()).add(header)
+
+        for entry in inventory:
+            headers = headers_by_offset.get(entry["offset"], None)
+            if headers is None:
+                logger.warning(f"GribInventoryMap.learn: no message found at offset {entry['offset']} for {entry}")
+                continue
+            self.mapping.setdefault(self.descriptor(entry), set()).update(headers)
+
+    def select(self, inventory: list[dict], filter_by_keys: list[dict]) -> list[tuple] | None:
+        """Find the byte ranges of all messages that could match any of ``filter_by_keys``
+
+        Args:
+            inventory (list[dict]): from :func:`parse_inventory`
+            filter_by_keys (list[dict]): as used by cfgrib
+
+        Returns:
+            ranges (list[tuple] or None): merged (start, end) byte ranges, end exclusive and None at the end of the file,
+                or None if the inventory has entries that have not been learned yet
+        """
+        # submessages (e.g. "12.1", "12.2") share the offset of their message,
+        # so each message ends at the next distinct offset, or the end of the file
+        ends = []
+        offset, next_offset = None, None
+        for entry in reversed(inventory):
+            if entry["offset"] != offset:
+                offset, next_offset = entry["offset"], offset
+            ends.append(next_offset)
+        ends = ends[::-1]
+
+        ranges = []
+        for entry, end in zip(inventory, ends):
+            headers = self.mapping.get(self.descriptor(entry), None)
+            if headers is None:
+                return None
+
+            if any(self._matches(entry, dict(header), fbk) for header in headers for fbk in filter_by_keys):
+                ranges.append((entry["offset"], end))
+        return merge_ranges(ranges)
+
+    @staticmethod
+    def _matches(entry: dict, header: dict, fbk: dict) -> bool:
+        for key, val in fbk.items():
+            if key == "stepRange":
+                # only rule it out if we know the inventory's step range
+                if entry["step_range"] is not None and entry["step_range"] != str(val):
+                    return False
+            elif key in header and header[key] != val:
+                return False
+        return True
+
+
+def download_byte_ranges(fs, path: str, ranges: list[tuple], local_path: str) -> str:
+    """Download only the given byte ranges of a remote file, concatenated into a local file.
+    Since GRIB messages are self contained, the result is a valid GRIB file.
+
+    Args:
+        fs (fsspec.spec.AbstractFileSystem): the remote filesystem
+        path (str): the remote path
+        ranges (list[tuple]): (start, end) byte ranges, see :meth:`GribInventoryMap.select`
+        local_path (str): where to write the result
+
+    Returns:
+        local_path (str)
+    """
+    starts = [start for start, _ in ranges]
+    ends = [end for _, end in ranges]
+    chunks = fs.cat_ranges([path]*len(ranges), starts, ends)
+
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(local_path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        for chunk in chunks:
+            if isinstance(chunk, Exception):
+                os.remove(tmp)
+                raise chunk
+            f.write(chunk)
+    os.replace(tmp, local_path)
+    return local_path
@@ -0,0 +1,240 @@
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+from typing import Optional
+
+import xarray as xr
+from xarray.backends.locks import ensure_lock
+
+from cfgrib import cfmessage, dataset, messages
+from cfgrib.xarray_plugin import CfGribDataStore, ECCODES_LOCK
+
+logger = logging.getLogger("ufs2arco")
+
+class GribMessageTable:
+    """
+    The header keys of every message in a GRIB file, found with a single scan through the file.
+
+    Opening a GRIB file with ``xr.open_dataset(..., engine="cfgrib", filter_by_keys=...)``
+    scans every message in the file each time it is called.
+    Here the file is scanned once, using the union of all keys that will be filtered on,
+    and each subsequent :meth:`open_dataset` call only decodes the messages it selects.
+
+    If a :class:`GribIndexStore` and a ``file_id`` are provided, the scan is looked up there first,
+    and saved there otherwise, so that the same file never has to be scanned twice.
+
+    Example:
+        >>> table = GribMessageTable("gec00.t00z.pgrb2af000", filter_keys=("paramId", "typeOfLevel", "level"))
+        >>> xds = table.open_dataset({"paramId": 130, "typeOfLevel": "isobaricInhPa"}, decode_timedelta=True)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        filter_keys: Optional[list | tuple | set] = None,
+        errors: str = "warn",
+        store: Optional["GribIndexStore"] = None,
+        file_id: Optional[str] = None,
+    ) -> None:
+        """
+        Args:
+            path (str): path to a local GRIB file
+            filter_keys (list, tuple, set, optional): any GRIB keys that will be used in ``filter_by_keys``
+                in addition to the ones cfgrib always indexes
+            errors (str, optional): passed to cfgrib
+            store (GribIndexStore, optional): persistent storage for the scan
+            file_id (str, optional): identifies the file in the ``store``, see :meth:`GribIndexStore.file_id`
+        """
+        self.path = path
+        self.errors = errors
+        filter_keys = filter_keys if filter_keys is not None else tuple()
+        index_keys = dataset.compute_index_keys(filter_by_keys={key: None for key in filter_keys})
+        self.stream = messages.FileStream(path, errors=errors)
+
+        stored = None
+        use_store = store is not None and file_id is not None
+        if use_store:
+            stored = store.load(file_id, index_keys=index_keys, size=os.path.getsize(path))
+
+        if stored is not None:
+            self.index_keys, field_ids_index = stored
+            self.index = messages.FileIndex(
+                fieldset=self.stream,
+                index_keys=self.index_keys,
+                field_ids_index=field_ids_index,
+                computed_keys=cfmessage.COMPUTED_KEYS,
+            )
+        elif os.path.getsize(path) == 0:
+            # e.g. when none of the messages were needed from a byte range request
+            self.index_keys = index_keys
+            self.index = messages.FileIndex(
+                fieldset=self.stream,
+                index_keys=self.index_keys,
+                field_ids_index=[],
+                computed_keys=cfmessage.COMPUTED_KEYS,
+            )
+        else:
+            self.index_keys = index_keys
+            self.index = messages.FileIndex.from_fieldset(
+                self.stream,
+                self.index_keys,
+                computed_keys=cfmessage.COMPUTED_KEYS,
+            )
+            if use_store:
+                store.save(
+                    file_id,
+                    index_keys=self.index_keys,
+                    field_ids_index=self.index.field_ids_index,
+                    size=os.path.getsize(path),
+                )
+
+    def __len__(self) -> int:
+        return sum(len(field_ids) for _, field_ids in self.index.field_ids_index)
+
+    def subindex(self, filter_by_keys: dict) -> messages.FileIndex:
+        """Create the same index that cfgrib would create for this ``filter_by_keys``, without rescanning the file
+
+        The full table is projected onto the keys that cfgrib would have used, keeping
+        cfgrib's ordering (groups in order of first appearance, messages in file order), and then filtered.
+
+        Args:
+            filter_by_keys (dict): GRIB keys and values to select
+
+        Returns:
+            index (cfgrib.messages.FileIndex): with only the selected messages
+        """
+        index_keys = dataset.compute_index_keys(filter_by_keys=filter_by_keys)
+        missing = [key for key in index_keys if key not in self.index_keys]
+        assert len(missing) == 0, \
+            f"GribMessageTable.subindex: keys {missing} were not scanned in {self.path}, add them to filter_keys"
+
+        positions = [self.index_keys.index(key) for key in index_keys]
+        projected = dict()
+        for header_values, field_ids in self.index.field_ids_index:
+            key = tuple(header_values[i] for i in positions)
+            projected.setdefault(key, []).extend(field_ids)
+
+        index = messages.FileIndex(
+            fieldset=self.stream,
+            index_keys=index_keys,
+            field_ids_index=[(key, sorted(field_ids)) for key, field_ids in projected.items()],
+            computed_keys=cfmessage.COMPUTED_KEYS,
+        )
+        return index.subindex(filter_by_keys)
+
+    def open_dataset(self, filter_by_keys: dict, **kwargs) -> xr.Dataset:
+        """Open the messages selected by ``filter_by_keys``, equivalent to
+        ``xr.open_dataset(path, engine="cfgrib", filter_by_keys=filter_by_keys, **kwargs)``
+
+        Args:
+            filter_by_keys (dict): GRIB keys and values to select
+            kwargs: passed to :func:`xarray.open_dataset`, e.g. ``decode_timedelta``
+
+        Returns:
+            xds (xr.Dataset): with the selected messages
+        """
+        store = _IndexedCfGribDataStore(self.subindex(filter_by_keys), errors=self.errors)
+        return xr.open_dataset(store, **kwargs)
+
+
+class GribIndexStore:
+    """
+    A directory of GRIB message tables, which outlives the cache of the GRIB files themselves.
+
+    Each entry is keyed by the remote file it came from (see :meth:`file_id`),
+    so it can be shared between batches, MPI processes, and reruns of the same recipe.
+    Entries are written to a temporary file and then renamed, so concurrent writers are safe.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Args:
+            directory (str): where to store the message tables
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def file_id(path: str, size: Optional[int] = None, etag: Optional[str] = None) -> str:
+        """A content address for a remote file
+
+        Args:
+            path (str): the remote path
+            size (int, optional): size of the file in bytes
+            etag (str, optional): the ETag reported by the server, if any
+
+        Returns:
+            file_id (str): sha256 hex digest
+        """
+        content = f"{path}|{size}|{etag}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, file_id: str) -> str:
+        return os.path.join(self.directory, file_id[:2], f"{file_id}.pkl")
+
+    def load(self, file_id: str, index_keys: list, size: int) -> tuple | None:
+        """Return a stored message table, if it exists and has all of ``index_keys``
+
+        Args:
+            file_id (str): the key for this file
+            index_keys (list): the GRIB keys that need to be in the table
+            size (int): size of the local file, which has to match the stored size
+
+        Returns:
+            index_keys, field_ids_index (tuple or None): as in :class:`cfgrib.messages.FileIndex`
+        """
+        path = self._entry_path(file_id)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except Exception:
+            logger.warning(f"GribIndexStore.load: could not read {path}, will rescan")
+            return None
+
+        if entry.get("size") != size:
+            logger.warning(f"GribIndexStore.load: size mismatch for {path}, will rescan")
+            return None
+        if not set(index_keys).issubset(entry["index_keys"]):
+            logger.debug(f"GribIndexStore.load: {path} is missing some index keys, will rescan")
+            return None
+        return entry["index_keys"], entry["field_ids_index"]
+
+    def save(self, file_id: str, index_keys: list, field_ids_index: list, size: int) -> None:
+        """Store a message table
+
+        Args:
+            file_id (str): the key for this file
+            index_keys (list): the GRIB keys in the table
+            field_ids_index (list): as in :class:`cfgrib.messages.FileIndex`
+            size (int): size of the local file
+        """
+        path = self._entry_path(file_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "index_keys": list(index_keys),
+            "field_ids_index": list(field_ids_index),
+            "size": size,
+        }
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(entry, f)
+            os.replace(tmp, path)
+        except Exception:
+            logger.warning(f"GribIndexStore.save: could not write {path}")
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+
+
+class _IndexedCfGribDataStore(CfGribDataStore):
+    """A cfgrib data store built from an existing index, rather than a filename"""
+
+    def __init__(self, index, lock=None, **backend_kwargs):
+        if lock is None:
+            lock = ECCODES_LOCK
+        self.lock = ensure_lock(lock)
+        self.ds = dataset.open_from_index(index, **backend_kwargs)
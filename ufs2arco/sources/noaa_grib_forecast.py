@@ -1,12 +1,17 @@
 import os
 import yaml
 import logging
+import threading
 from typing import Optional
 import fsspec
 
 import pandas as pd
 import xarray as xr
 
+from .grib_messages import GribMessageTable, GribIndexStore
+from .grib_inventory import GribInventoryMap, parse_inventory, download_byte_ranges
+from .downloads import DownloadPool, download_file
+
 logger = logging.getLogger("ufs2arco")
 
 class NOAAGribForecastData:
@@ -49,6 +54,10 @@ class NOAAGribForecastData:
         use_nearest_levels: Optional[bool] = False,
         slices: Optional[dict] = None,
         accum_hrs: Optional[dict] = None,
+        grib_index_dir: Optional[str] = None,
+        fetch_byte_ranges: Optional[bool] = False,
+        max_concurrent_downloads: Optional[int] = 8,
+        max_downloads_per_host: Optional[int] = 4,
     ) -> None:
         path = os.path.join(
             os.path.dirname(__file__),
@@ -71,6 +80,23 @@ class NOAAGribForecastData:
 
         self._accum_hrs = accum_hrs
 
+        # for persistent GRIB message tables
+        self.grib_index_dir = grib_index_dir
+        self._grib_index_store = GribIndexStore(grib_index_dir) if grib_index_dir is not None else None
+
+        # for only downloading the messages we need, based on the .idx inventory files
+        self.fetch_byte_ranges = fetch_byte_ranges
+        self._inventory_map = GribInventoryMap(self._filter_keys)
+        self._inventory_lock = threading.Lock()
+
+        # for downloading all files in a sample or batch at once
+        self._download_pool = DownloadPool(
+            max_workers=max_concurrent_downloads,
+            max_per_host=max_downloads_per_host,
+        )
+        self._downloads = dict()
+        self._downloads_lock = threading.Lock()
+
         # looks for variables with any time bounds
         for varname in variables:
             tbds = self._varmeta[varname].get("time_bounds", None)
@@ -104,6 +130,31 @@ class NOAAGribForecastData:
             slices=slices,
         )
 
+    @property
+    def _filter_keys(self) -> set:
+        """All GRIB keys that are used in any ``filter_by_keys``, so that each file only has to be scanned once"""
+        keys = {"stepRange"}
+        for meta in self._varmeta.values():
+            keys |= set(meta["filter_by_keys"].keys())
+        return keys
+
+    def _file_id(self, path: str, local_file: str) -> str:
+        """Identify a remote GRIB file by its path and size
+
+        The size comes from the complete local copy, rather than asking the server,
+        so that this doesn't add a request for every file that is read.
+        The files in NOAA's archives are not modified after they're written, so this is enough to identify them.
+
+        Args:
+            path (str): the remote path, possibly chained with "filecache::"
+            local_file (str): the complete cached copy of the remote file
+
+        Returns:
+            file_id (str): key for :class:`GribIndexStore`
+        """
+        remote = path.split("::")[-1]
+        return GribIndexStore.file_id(remote, size=os.path.getsize(local_file))
+
     def _open_static_vars(self, dims) -> bool:
         """Do this once per t0, ensemble member"""
         cond = True
@@ -133,6 +184,119 @@ class NOAAGribForecastData:
             )
         return local_file
 
+    def _requested_filter_by_keys(self, dims, variables, file_suffix) -> list[dict]:
+        """All filter_by_keys that might be used to read these variables from this file"""
+        fbks = []
+        for varname in variables:
+            meta = self._varmeta[varname]
+            if file_suffix in meta["file_suffixes"]:
+                fbk = meta["filter_by_keys"].copy()
+                if self._accum_hrs is not None and varname in self._accum_hrs and dims["fhr"]>0:
+                    fbk["stepRange"] = f"{int(dims['fhr']) - int(self._accum_hrs[varname])}-{int(dims['fhr'])}"
+                fbks.append(fbk)
+                altname = meta.get("alternative_name", None)
+                if altname is not None:
+                    fbks.append(self._varmeta[altname]["filter_by_keys"].copy())
+        return fbks
+
+    def _fetch_file(self, dims, file_suffix, cache_dir, variables):
+        """Download one of the files for this sample into the cache, raising an error if it can't be found.
+
+        If :attr:`fetch_byte_ranges` is True, only the messages needed for these variables are downloaded,
+        using the byte offsets in the .idx inventory that NOAA stores next to each GRIB2 file.
+
+        Returns:
+            local_file, is_subset (str, bool): path to the local file, and if it is only a subset of the remote file
+        """
+        path = self._build_path(
+            **dims,
+            file_suffix=file_suffix,
+        )
+        remote = path.split("::")[-1]
+        kw = {"anon": True} if "s3://" in remote else {}
+        full_file = os.path.join(cache_dir, "files", remote.split("://")[-1])
+        if not self.fetch_byte_ranges:
+            return download_file(remote, full_file, **kw), False
+
+        fs, remote_path = fsspec.core.url_to_fs(remote, **kw)
+        try:
+            inventory = parse_inventory(fs.cat_file(f"{remote_path}.idx").decode())
+        except:
+            logger.warning(f"{self.name}: Trouble reading the inventory {remote}.idx, downloading the full file")
+            return download_file(remote, full_file, **kw), False
+
+        fbks = self._requested_filter_by_keys(dims, variables, file_suffix)
+        with self._inventory_lock:
+            ranges = self._inventory_map.select(inventory, fbks)
+
+        if ranges is None:
+            # the first time we see these inventory entries, learn what they are from the full file
+            logger.info(f"{self.name}: learning the inventory entries of {remote}, downloading the full file")
+            local_file = download_file(remote, full_file, **kw)
+            try:
+                table = GribMessageTable(local_file, filter_keys=self._filter_keys)
+                with self._inventory_lock:
+                    self._inventory_map.learn(inventory, table)
+            except:
+                logger.warning(f"{self.name}: unable to learn the inventory entries of {remote}")
+            return local_file, False
+
+        local_file = os.path.join(cache_dir, "byte-ranges", remote.split("://")[-1])
+        return download_byte_ranges(fs, remote_path, ranges, local_file), True
+
+    def download_sample(
+        self,
+        dims: dict,
+        open_static_vars: bool,
+        cache_dir: str,
+    ) -> dict:
+        """Start downloading all of the files needed for this sample in the background.
+        Calling this again for the same sample, e.g. from :meth:`open_sample_dataset`,
+        returns the downloads that are already in progress.
+
+        Args:
+            dims (dict): the sample
+            open_static_vars (bool): as in :meth:`open_sample_dataset`
+            cache_dir (str): where to put the files
+
+        Returns:
+            futures (dict): with file_suffix as key, and a :class:`concurrent.futures.Future` as the value
+        """
+        osv = open_static_vars or self._open_static_vars(dims)
+        variables = self.variables if osv else self.dynamic_vars
+        futures = dict()
+        for suffix in self.file_suffixes:
+            path = self._build_path(**dims, file_suffix=suffix)
+            key = (cache_dir, path)
+            with self._downloads_lock:
+                if key not in self._downloads:
+                    self._downloads[key] = self._download_pool.submit(
+                        path,
+                        self._fetch_file,
+                        dims,
+                        suffix,
+                        cache_dir,
+                        variables,
+                    )
+                futures[suffix] = self._downloads[key]
+        return futures
+
+    def _wait_for_download(self, dims, file_suffix, cache_dir, future):
+        """Get the local file from a download started by :meth:`download_sample`, or None if it failed"""
+        path = self._build_path(**dims, file_suffix=file_suffix)
+        try:
+            local_file, is_subset = future.result()
+        except:
+            local_file, is_subset = None, False
+            logger.warning(
+                f"{self.name}: Trouble finding the file: {path}\n\t" +
+                f"dims = {dims}, file_suffix = {file_suffix}"
+            )
+        finally:
+            with self._downloads_lock:
+                self._downloads.pop((cache_dir, path), None)
+        return local_file, is_subset
+
     def open_sample_dataset(
         self,
         dims: dict,
@@ -140,24 +304,48 @@ class NOAAGribForecastData:
         cache_dir: Optional[str] = None,
     ) -> xr.Dataset:
 
+        osv = open_static_vars or self._open_static_vars(dims)
+        variables = self.variables if osv else self.dynamic_vars
+
         # 1. cache the grib files for this date, member, fhr
+        # all files are downloaded at once, unless they already are from download_sample
         cached_files = {}
+        remote_paths = {}
+        subsets = set()
         for suffix in self.file_suffixes:
-            path = self._build_path(
+            remote_paths[suffix] = self._build_path(
                 **dims,
                 file_suffix=suffix,
             )
-            if cache_dir is not None:
-                cached_files[suffix] = self._open_local(dims, suffix, cache_dir)
-            else:
-                cached_files[suffix] = path
+        if cache_dir is not None:
+            futures = self.download_sample(dims, open_static_vars, cache_dir)
+            for suffix, future in futures.items():
+                cached_files[suffix], is_subset = self._wait_for_download(dims, suffix, cache_dir, future)
+                if is_subset:
+                    subsets.add(suffix)
+        else:
+            cached_files = remote_paths.copy()
 
         # 2. read data arrays from those files
         dsdict = {}
-        osv = open_static_vars or self._open_static_vars(dims)
-        variables = self.variables if osv else self.dynamic_vars
         we_got_the_data = all(val is not None for val in cached_files.values())
         if we_got_the_data:
+            # scan each local file once, rather than once per variable
+            for suffix, file in cached_files.items():
+                if os.path.isfile(file):
+                    try:
+                        file_id = None
+                        if self._grib_index_store is not None and suffix not in subsets:
+                            file_id = self._file_id(remote_paths[suffix], file)
+                        cached_files[suffix] = GribMessageTable(
+                            file,
+                            filter_keys=self._filter_keys,
+                            store=self._grib_index_store,
+                            file_id=file_id,
+                        )
+                    except:
+                        logger.warning(f"{self.name}: unable to scan {file}, will open each variable separately")
+
             for varname in variables:
                 dslist = []
                 # Note that when there are 2 file suffixes, we always try to read from both
@@ -197,13 +385,13 @@ class NOAAGribForecastData:
         self,
         dims: dict,
         varname: str,
-        file: fsspec.spec.AbstractFileSystem,
+        file: fsspec.spec.AbstractFileSystem | GribMessageTable,
     ) -> xr.DataArray:
         """
         Open a single variable from a GRIB file.
 
         Args:
-            file (fsspec.spec.AbstractFileSystem): The file to read.
+            file (fsspec.spec.AbstractFileSystem | GribMessageTable): The file to read, or its already scanned messages.
             varname (str): The variable name to extract.
 
         Returns:
@@ -231,12 +419,15 @@ class NOAAGribForecastData:
                 fbk = self._varmeta[altname]["filter_by_keys"].copy()
 
         try:
-            xds = xr.open_dataset(
-                file,
-                engine="cfgrib",
-                filter_by_keys=fbk,
-                decode_timedelta=True,
-            )
+            if isinstance(file, GribMessageTable):
+                xds = file.open_dataset(fbk, decode_timedelta=True)
+            else:
+                xds = xr.open_dataset(
+                    file,
+                    engine="cfgrib",
+                    filter_by_keys=fbk,
+                    decode_timedelta=True,
+                )
         except:
             logger.warning(f"{self.name}._open_single_variable: unable to read varname = {varname} at dims = {dims}")
             return None
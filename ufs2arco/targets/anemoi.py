@@ -10,6 +10,18 @@ import zarr
 
 from ufs2arco.sources import Source
 from ufs2arco.targets import Target
+from ufs2arco.targets import forcings as fmod
+from ufs2arco.targets.statistics import (
+    packed_statistics,
+    reduce_statistics,
+    empty_statistics,
+    combine_statistics,
+    merge_statistics,
+    pack_statistics,
+    unpack_statistics,
+    merge_packed_statistics,
+    finalize_statistics,
+)
 
 logger = logging.getLogger("ufs2arco")
 
@@ -39,6 +51,10 @@ class Anemoi(Target):
     allow_nans = True
     data_dtype = np.float32
 
+    # the layout of the stored per sample statistics ("*_array" variables)
+    # 1: sums and squares, 2: count, mean, and m2
+    statistics_format_version = 2
+
     # these are basically properties
     always_open_static_vars = True
 
@@ -101,7 +117,7 @@ class Anemoi(Target):
             return self.start_date
         else:
             date = pd.Timestamp(self.statistics_period.get("start"))
-            assert date in self.datetime, "{self.name}: could not find statistics_start_date within datetime"
+            assert date in self.get_index("datetime"), "{self.name}: could not find statistics_start_date within datetime"
             return str(date).replace(" ", "T")
 
     @property
@@ -110,7 +126,7 @@ class Anemoi(Target):
             return self.end_date
         else:
             date = pd.Timestamp(self.statistics_period.get("end"))
-            assert date in self.datetime, "{self.name}: could not find statistics_end_date within datetime"
+            assert date in self.get_index("datetime"), "{self.name}: could not find statistics_end_date within datetime"
             return str(date).replace(" ", "T")
 
     @property
@@ -146,12 +162,14 @@ class Anemoi(Target):
         sort_channels_by_levels: Optional[bool] = False,
         variables_with_nans: Optional[list] = None,
         transformed_dims: Optional[dict] = None,
+        store_sample_statistics: Optional[bool] = True,
     ) -> None:
         """
 
         Args:
             ... the rest of the docs ...
             transformed_dims (dict, optional): if your dataset gets regridded to have new dimension names, e.g. from latitude/longitude to a curvilinear grid with y/x coordinates (in the case of GFS -> HRRR grid), we need to explicitly tell the target class about this transformation, so it knows how to handle horizontal dimensions, since horizontal dimensions are always different. So this would be based on dimension order e.g. {'latitude': 'y', 'longitude': 'x'}
+            store_sample_statistics (bool, optional): if True (default), store the per sample statistics (the "*_array" variables) in the zarr store, and read them back in :meth:`finalize`. If False, the statistics are accumulated in memory as each batch is written, and the "*_array" variables are never stored. This only works when the dataset is created in one go, i.e. not with a restart or :meth:`Driver.patch`, since those do not see every sample.
         """
 
         super().__init__(
@@ -165,6 +183,9 @@ class Anemoi(Target):
         )
 
         self.sort_channels_by_levels = sort_channels_by_levels
+        self._channel_orders = dict()
+        self._flat_grids = dict()
+        self._layout = None
         # additional checks
         if self._has_fhr:
             assert len(self.source.fhr) == 1, \
@@ -179,6 +200,12 @@ class Anemoi(Target):
 
         self.variables_with_nans = variables_with_nans
         self.transformed_dims = transformed_dims if transformed_dims else {}
+        self.store_sample_statistics = store_sample_statistics
+
+        # statistics accumulated while storing the data, see reset_statistics
+        self._local_statistics = None
+        self._local_nan_times = None
+        self._missing_in_statistics_period = False
 
 
     def apply_transforms_to_sample(
@@ -198,10 +225,7 @@ class Anemoi(Target):
 
         xds = super().apply_transforms_to_sample(xds)
         xds = self._map_datetime_to_index(xds)
-        xds = self._map_levels_to_suffixes(xds)
-        xds = self._map_static_to_expanded(xds)
-        xds = xds.transpose(* (("time", "ensemble") + tuple(xds.attrs["stack_order"])) )
-        xds = self._stackit(xds)
+        xds = self._stack_channels(xds)
         xds = self._calc_sample_stats(xds)
         if self.do_flatten_grid:
             xds = self._flatten_grid(xds)
@@ -222,6 +246,7 @@ class Anemoi(Target):
             "frequency": self.datetime.freqstr,
             "statistics_start_date": self.statistics_start_date,
             "statistics_end_date": self.statistics_end_date,
+            "statistics_format_version": self.statistics_format_version,
         }
         xds.attrs.update(attrs)
         return xds
@@ -272,7 +297,7 @@ class Anemoi(Target):
             xds (xr.Dataset): with new time dimension "time" ("dates" is still there)
         """
 
-        t = [list(self.datetime).index(date) for date in xds["dates"].values]
+        t = self.get_indexer("datetime", xds["dates"].values)
         xds["time"] = xr.DataArray(
             t,
             coords=xds["dates"].coords,
@@ -305,15 +330,16 @@ class Anemoi(Target):
 
         nds = xr.Dataset()
         nds.attrs["variables_metadata"] = dict()
+        mars_dates = self._mars_dates(xds.time.values[0])
 
         for name in xds.data_vars:
             meta = {
                 "mars": {
-                    "date": str(self.datetime[xds.time.values[0]]).replace("-","")[:8],
+                    "date": mars_dates["date"],
                     "param": name,
                     "step": 0, # this is the fhr=0 assumption
-                    "time": str(self.datetime[xds.time.values[0]]).replace("-","").replace(" ", "").replace(":","")[8:12], # no idea what this should be actually
-                    "valid_datetime": str(self.datetime[xds.time.values[0]]).replace(" ", "T"),
+                    "time": mars_dates["time"],
+                    "valid_datetime": mars_dates["valid_datetime"],
                     "variable": name,
                 },
             }
@@ -322,9 +348,7 @@ class Anemoi(Target):
             if "level" in xds[name].dims:
                 for level in xds[name].level.values:
                     idx = self._get_level_index(xds, level)
-                    ilevel = int(level)
-                    ilevel = ilevel if ilevel == level else level
-                    suffix_name = f"{name}_{ilevel}" if not self.use_level_index else f"{name}_{idx}"
+                    suffix_name, ilevel = self._level_suffix(name, level, idx)
                     nds[suffix_name] = xds[name].sel({"level": level}, drop=True)
                     units = xds["level"].attrs.get('units', '')
                     nds[suffix_name].attrs.update(
@@ -363,6 +387,24 @@ class Anemoi(Target):
         return nds
 
 
+    def _mars_dates(self, time_index: int) -> dict:
+        """The date related entries of the "mars" metadata, for a logical time index"""
+        date = str(self.datetime[time_index])
+        return {
+            "date": date.replace("-","")[:8],
+            "time": date.replace("-","").replace(" ", "").replace(":","")[8:12], # no idea what this should be actually
+            "valid_datetime": date.replace(" ", "T"),
+        }
+
+
+    def _level_suffix(self, name: str, level: int | float, idx: int) -> tuple:
+        """The channel name for a 3D variable at a vertical level, and the level as it appears in the name"""
+        ilevel = int(level)
+        ilevel = ilevel if ilevel == level else level
+        suffix_name = f"{name}_{ilevel}" if not self.use_level_index else f"{name}_{idx}"
+        return suffix_name, ilevel
+
+
     @staticmethod
     def _get_level_index(xds: xr.Dataset, value: int | float) -> int | float:
         return xds["level"].values.tolist().index(value)
@@ -411,6 +453,124 @@ class Anemoi(Target):
         return xds
 
 
+    def _stack_channels(self, xds: xr.Dataset) -> xr.Dataset:
+        """
+        Go from the dataset with (time, ensemble, level, latitudes, longitudes) variables
+        to the stacked (time, ensemble, variable, latitudes, longitudes) "data" array.
+
+        The first sample goes through :meth:`_map_levels_to_suffixes`, :meth:`_map_static_to_expanded`,
+        and :meth:`_stackit`, and the resulting channel layout is compiled into a plan (see :meth:`_compile_layout`).
+        Every later sample with the same variables, dimensions, and levels is copied straight into
+        the output buffer with :meth:`_apply_layout`. If the variables change, the plan is recompiled.
+
+        Args:
+            xds (xr.Dataset): from :meth:`_map_datetime_to_index`
+
+        Returns:
+            xds (xr.Dataset): with "data" DataArray, which has all variables/levels stacked together
+        """
+        signature = self._layout_signature(xds)
+        with self._cache_lock:
+            layout = self._layout
+            if layout is None or layout["signature"] != signature:
+                nds = self._map_levels_to_suffixes(xds)
+                nds = self._map_static_to_expanded(nds)
+                nds = nds.transpose(* (("time", "ensemble") + tuple(nds.attrs["stack_order"])) )
+                nds = self._stackit(nds)
+                self._layout = self._compile_layout(xds, nds, signature)
+                return nds
+
+        return self._apply_layout(xds, layout)
+
+
+    @staticmethod
+    def _layout_signature(xds: xr.Dataset) -> tuple:
+        """Everything about a sample that determines the channel layout"""
+        levels = tuple(xds["level"].values.tolist()) if "level" in xds.dims else None
+        return (
+            tuple((name, xds[name].dims) for name in xds.data_vars),
+            tuple(xds.sizes.items()),
+            levels,
+        )
+
+
+    def _compile_layout(self, xds: xr.Dataset, nds: xr.Dataset, signature: tuple) -> dict:
+        """
+        Map each channel of the stacked "data" array back to the variable (and vertical level) it came from
+
+        Args:
+            xds (xr.Dataset): the sample passed to :meth:`_stack_channels`
+            nds (xr.Dataset): the stacked result for this sample
+            signature (tuple): from :meth:`_layout_signature`
+
+        Returns:
+            layout (dict): with the signature, the (name, level index or None) of each channel,
+                the dims of "data", and the attributes (of the dataset and coordinates) that don't depend on the date
+        """
+        sources = dict()
+        for name in xds.data_vars:
+            if "level" in xds[name].dims:
+                for level in xds[name].level.values:
+                    idx = self._get_level_index(xds, level)
+                    suffix_name, _ = self._level_suffix(name, level, idx)
+                    sources[suffix_name] = (name, idx)
+            else:
+                sources[name] = (name, None)
+
+        return {
+            "signature": signature,
+            "channels": [sources[name] for name in nds.attrs["variables"]],
+            "dims": nds["data"].dims,
+            "attrs": deepcopy(nds.attrs),
+            "coord_attrs": {key: nds[key].attrs.copy() for key in nds.coords},
+        }
+
+
+    def _apply_layout(self, xds: xr.Dataset, layout: dict) -> xr.Dataset:
+        """
+        Stack a sample using the compiled layout, the same as :meth:`_stack_channels`
+        but without creating any intermediate datasets
+
+        Args:
+            xds (xr.Dataset): from :meth:`_map_datetime_to_index`
+            layout (dict): from :meth:`_compile_layout`, with the same signature as ``xds``
+
+        Returns:
+            xds (xr.Dataset): with "data" DataArray, which has all variables/levels stacked together
+        """
+        dims = layout["dims"]
+        field_dims = tuple(d for d in dims if d != "variable")
+        channel_axis = dims.index("variable")
+        shape = tuple(len(layout["channels"]) if d == "variable" else xds.sizes[d] for d in dims)
+        data = np.empty(shape, dtype=self.data_dtype)
+
+        for this_channel, (name, level_index) in enumerate(layout["channels"]):
+            xda = xds[name]
+            if level_index is not None:
+                xda = xda.isel(level=level_index, drop=True)
+
+            # static variables get broadcasted over any missing dims
+            present = tuple(d for d in field_dims if d in xda.dims)
+            values = xda.transpose(*present).values
+            values = np.expand_dims(values, [i for i, d in enumerate(field_dims) if d not in present])
+            data[(slice(None),)*channel_axis + (this_channel,)] = values
+
+        coords = {key: val for key, val in xds.coords.items() if set(val.dims).issubset(dims)}
+        coords["variable"] = np.arange(len(layout["channels"]))
+        nds = xr.DataArray(data, coords=coords, dims=dims).to_dataset(name="data")
+        for key, val in layout["coord_attrs"].items():
+            if key in nds.coords:
+                nds[key].attrs = val.copy()
+
+        attrs = deepcopy(layout["attrs"])
+        mars_dates = self._mars_dates(xds.time.values[0])
+        for meta in attrs["variables_metadata"].values():
+            if "mars" in meta:
+                meta["mars"].update(mars_dates)
+        nds.attrs = attrs
+        return nds
+
+
     def _stackit(self, xds: xr.Dataset) -> xr.Dataset:
         """
         Stack the multivariate dataset to a single data array with all variables (and vertical levels) stacked together
@@ -423,16 +583,8 @@ class Anemoi(Target):
         Returns:
             xds (xr.Dataset): with "data" DataArray, which has all variables/levels stacked together
         """
-        varlist = sorted(
-            list(xds.data_vars),
-            key=self._sort_channels_by_levels if self.sort_channels_by_levels else None,
-        )
-        channel = [i for i, _ in enumerate(varlist)]
-        channel = xr.DataArray(
-            channel,
-            coords={"variable": channel},
-            dims="variable",
-        )
+        varlist = self._channel_order(tuple(xds.data_vars))
+        channel = np.arange(len(varlist))
 
         # this might be nice, but it doesn't exist in anemoi
         # and it causes problems with the container / fill workflow
@@ -443,53 +595,123 @@ class Anemoi(Target):
         #    dims=channel.dims,
         #)
 
-        data_vars = xr.concat(
-            [
-                xds[name].expand_dims(
-                    {"variable": [this_channel]},
-                ).astype(
-                    self.data_dtype,
-                )
-                for this_channel, name in zip(channel, varlist)
-            ],
-            dim="variable",
-            data_vars="all",
-            combine_attrs="drop",
-        )
+        # all variables have the same (time, ensemble, *horizontal) dims at this point,
+        # so copy each one straight into its slot of a single preallocated array
+        sample_dims = xds[varlist[0]].dims
+        dims = sample_dims[:2] + ("variable",) + sample_dims[2:]
+        shape = tuple(len(xds[d]) for d in sample_dims[:2]) + (len(varlist),) + tuple(len(xds[d]) for d in sample_dims[2:])
+        data = np.empty(shape, dtype=self.data_dtype)
+        for this_channel, name in zip(channel, varlist):
+            assert xds[name].dims == sample_dims, \
+                f"{self.name}._stackit: {name} has dims {xds[name].dims}, expected {sample_dims}"
+            data[:, :, this_channel] = xds[name].values
+
+        coords = {key: val for key, val in xds.coords.items() if set(val.dims).issubset(dims)}
+        coords["variable"] = channel
+        data_vars = xr.DataArray(data, coords=coords, dims=dims)
         nds = data_vars.to_dataset(name="data")
         nds.attrs = xds.attrs.copy()
         # not making this a data array, even though it might be kinda nice
         nds.attrs["variables"] = varlist
         return nds
 
+    def _channel_order(self, names: tuple) -> list:
+        """The order of the variables in the stacked "data" array, which is computed once for each set of names"""
+        with self._cache_lock:
+            if names not in self._channel_orders:
+                self._channel_orders[names] = sorted(
+                    list(names),
+                    key=self._sort_channels_by_levels if self.sort_channels_by_levels else None,
+                )
+            return list(self._channel_orders[names])
+
     def _flatten_grid(self, xds: xr.Dataset) -> xr.Dataset:
         """
         Flatten (latitudes, longitudes) -> (cell,)
 
         (time, ensemble, variable, latitudes, longitudes) -> (time, ensemble, variable, cell)
 
+        Each array is reshaped, which is a view of the same memory when the horizontal dims come last
+        (as they do for "data" after :meth:`_stackit`), so no MultiIndex is built and nothing is copied.
+        The "cell" coordinate and the flattened horizontal coordinates are computed once per grid, see :meth:`_flat_grid`.
+
         Args:
             xds (xr.Dataset): with expanded grid
 
         Returns:
             xds (xr.Dataset): with grid flattened to "cell"
         """
-        nds = xds.stack(cell2d=xds.attrs["stack_order"])
-        nds["cell"] = xr.DataArray(
-            np.arange(len(nds["cell2d"])),
-            coords=nds["cell2d"].coords,
-            dims=nds["cell2d"].dims,
-            attrs={
-                "description": f"logical index for 'cell2d', which is a flattened lon x lat array",
-            },
-        )
-        nds = nds.swap_dims({"cell2d": "cell"})
+        stack_order = tuple(xds.attrs["stack_order"])
+        grid = self._flat_grid(xds, stack_order)
+        n_cells = len(grid["cell"])
+
+        def flatten(xda):
+            if not set(stack_order).issubset(xda.dims):
+                return xda.variable
+            other = tuple(d for d in xda.dims if d not in stack_order)
+            xda = xda.transpose(*other, *stack_order)
+            return xr.Variable(
+                dims=other + ("cell",),
+                data=xda.data.reshape(xda.shape[:len(other)] + (n_cells,)),
+                attrs=xda.attrs,
+            )
 
-        # For some reason, there's a failure when trying to store this multi-index
-        # it's not needed in Anemoi, so no need to keep it anyway.
-        nds = nds.drop_vars("cell2d")
+        coords = {"cell": grid["cell"]}
+        for key in xds.coords:
+            if key in stack_order:
+                coords[key] = grid[key]
+            else:
+                coords[key] = flatten(xds[key])
+
+        nds = xr.Dataset(
+            {key: flatten(xds[key]) for key in xds.data_vars},
+            coords=coords,
+            attrs=xds.attrs.copy(),
+        )
         return nds
 
+    def _flat_grid(self, xds: xr.Dataset, stack_order: tuple) -> dict:
+        """The "cell" coordinate, and the horizontal dimension coordinates repeated over every cell,
+        which are only recomputed if the grid changes
+
+        Args:
+            xds (xr.Dataset): with expanded grid
+            stack_order (tuple): the horizontal dims, in the order they are flattened
+
+        Returns:
+            grid (dict): with read-only xr.Variables for "cell" and each of the ``stack_order`` dims
+        """
+        with self._cache_lock:
+            cached = self._flat_grids.get(stack_order, None)
+        if cached is not None and all(np.array_equal(cached["index"][d], xds[d].values) for d in stack_order):
+            return cached["grid"]
+
+        field_shape = tuple(len(xds[d]) for d in stack_order)
+        n_cells = int(np.prod(field_shape))
+        cell = np.arange(n_cells)
+        cell.flags.writeable = False
+        grid = {
+            "cell": xr.Variable(
+                dims="cell",
+                data=cell,
+                attrs={
+                    "description": f"logical index for 'cell2d', which is a flattened lon x lat array",
+                },
+            ),
+        }
+        for axis, d in enumerate(stack_order):
+            values = np.expand_dims(xds[d].values, [i for i in range(len(stack_order)) if i != axis])
+            values = np.broadcast_to(values, field_shape).reshape(n_cells)
+            values.flags.writeable = False
+            grid[d] = xr.Variable(dims="cell", data=values, attrs=xds[d].attrs.copy())
+
+        with self._cache_lock:
+            self._flat_grids[stack_order] = {
+                "index": {d: xds[d].values.copy() for d in stack_order},
+                "grid": grid,
+            }
+        return grid
+
     def _calc_sample_stats(self, xds: xr.Dataset) -> xr.Dataset:
         """
         Compute statistics for this data sample, which will be aggregated later
@@ -501,19 +723,97 @@ class Anemoi(Target):
             xds (xr.Dataset): with the following statistics, each with an "_array" suffix,
                 in order to indicate that the result will still have "time" and "ensemble" dimensions
                 that will need to get aggregated
-                ["count", "has_nans", "maximum", "minimum", "squares", "sums"]
+                ["count", "has_nans", "maximum", "minimum", "mean", "m2"],
+                where "m2" is the sum of squared deviations from the sample mean
         """
 
         dims = list(self.expanded_horizontal_dims)
-        xds["count_array"] = (~np.isnan(xds["data"])).sum(dims, skipna=self.allow_nans).astype(np.float64)
-        xds["has_nans_array"] = np.isnan(xds["data"]).any(dims)
-        xds["maximum_array"] = xds["data"].max(dims, skipna=self.allow_nans).astype(np.float64)
-        xds["minimum_array"] = xds["data"].min(dims, skipna=self.allow_nans).astype(np.float64)
-        xds["squares_array"] = (xds["data"]**2).sum(dims, skipna=self.allow_nans).astype(np.float64)
-        xds["sums_array"] = xds["data"].sum(dims, skipna=self.allow_nans).astype(np.float64)
+        if isinstance(xds["data"].data, np.ndarray):
+            # the data is in memory, so compute everything in one pass
+            axis = tuple(xds["data"].get_axis_num(dims))
+            stats = reduce_statistics(xds["data"].values, axis=axis, skipna=self.allow_nans)
+            template = xds["data"].isel({d: 0 for d in dims}, drop=True)
+            for key, val in stats.items():
+                xds[f"{key}_array"] = template.copy(data=val)
+        else:
+            data = xds["data"].astype(np.float64)
+            mean = data.mean(dims, skipna=self.allow_nans)
+            xds["count_array"] = (~np.isnan(xds["data"])).sum(dims).astype(np.float64)
+            xds["has_nans_array"] = np.isnan(xds["data"]).any(dims)
+            xds["maximum_array"] = data.max(dims, skipna=self.allow_nans)
+            xds["minimum_array"] = data.min(dims, skipna=self.allow_nans)
+            xds["mean_array"] = mean.fillna(0.) if self.allow_nans else mean
+            xds["m2_array"] = ((data - mean)**2).sum(dims, skipna=self.allow_nans)
         return xds
 
 
+    def reset_statistics(self) -> None:
+        """Start accumulating the statistics in memory, as each batch is stored.
+        This is called by the driver only when it will see every sample, i.e. not with a restart or patch.
+        """
+        self._local_statistics = None
+        self._local_nan_times = set()
+        self._missing_in_statistics_period = False
+
+
+    def update_statistics(self, xds: xr.Dataset) -> None:
+        """Merge the per sample statistics of a batch that is about to be stored
+        into the statistics accumulated on this rank, and keep track of times with unexpected NaNs
+
+        Args:
+            xds (xr.Dataset): a batch from :meth:`apply_transforms_to_sample`, with "time" as logical index values
+        """
+        if self._local_nan_times is None:
+            return
+
+        keep_idx = self._variables_to_check_for_nans(xds.attrs["variables"], xds["variable"].values)
+        nanidx = xds["has_nans_array"].sel(variable=keep_idx).any(["variable", "ensemble"]).values
+        self._local_nan_times.update(int(t) for t in xds["time"].values[nanidx])
+
+        start_idx, end_idx = self._statistics_index_range()
+        time = xds["time"].values
+        in_period = (time >= start_idx) & (time <= end_idx)
+        if in_period.any():
+            dims = ["variable", "time", "ensemble"]
+            stats = combine_statistics(
+                {
+                    key: xds[f"{key}_array"].isel(time=in_period).transpose(*dims).values
+                    for key in packed_statistics
+                },
+                axis=(1, 2),
+            )
+            if self._local_statistics is None:
+                self._local_statistics = stats
+            else:
+                self._local_statistics = merge_statistics(self._local_statistics, stats)
+
+
+    def check_existing_store(self) -> None:
+        """Make sure that the per sample statistics in an existing store, e.g. for a restart or patch,
+        have the same layout as the ones computed here, so that they are never merged with another format.
+        Stores without the "statistics_format_version" attribute were written with sums and squares, i.e. version 1.
+
+        This is called before any data is moved, so it also rejects ``store_sample_statistics=False``,
+        which needs every sample to come through in one go.
+        """
+        assert self.store_sample_statistics, \
+            f"{self.name}.check_existing_store: can't restart or patch the store at {self.store_path} with store_sample_statistics=False, " +\
+            "since the statistics can only be accumulated in memory when the dataset is created in one go"
+
+        version = zarr.open(self.store_path, mode="r").attrs.get("statistics_format_version", 1)
+        assert version == self.statistics_format_version, \
+            f"{self.name}.check_existing_store: the store at {self.store_path} has statistics_format_version = {version}, " +\
+            f"but this code uses statistics_format_version = {self.statistics_format_version}. " +\
+            "Recreate the dataset from scratch rather than restarting or patching it."
+
+
+    def drop_sample_statistics(self, xds: xr.Dataset) -> xr.Dataset:
+        """Drop the per sample statistics, unless they are to be stored"""
+        if self.store_sample_statistics:
+            return xds
+        return xds.drop_vars([f"{key}_array" for key in packed_statistics], errors="ignore")
+
+
     def finalize(self, topo) -> None:
         """Finalize the dataset with
         * dates
@@ -521,9 +821,21 @@ class Anemoi(Target):
         * temporal stats (if specified)
         """
 
+        use_accumulated = self._local_nan_times is not None
+        assert use_accumulated or self.store_sample_statistics, \
+            f"{self.name}.finalize: with store_sample_statistics=False, the statistics have to be accumulated while creating the dataset in one go (not with a restart or patch)"
+
+        if use_accumulated:
+            nan_times = topo.gather(sorted(self._local_nan_times))
+        else:
+            self.check_existing_store()
+
         if topo.is_root:
             self.add_dates()
-            self.reconcile_missing_and_nans()
+            if use_accumulated:
+                self._reconcile_missing_and_nan_times(sorted(set(t for times in nan_times for t in times)))
+            else:
+                self.reconcile_missing_and_nans()
         topo.barrier()
 
         logger.info(f"Aggregating statistics")
@@ -570,72 +882,186 @@ class Anemoi(Target):
             1. Make sure missing_dates show up as True in the ``has_nans_array``
                (which propagates to ``has_nans``, since :meth:`aggregate_stats: is called right after this.)
             2. If we have NaNs that we should not have, report it as a missing date
+
+        Both are done with boolean masks over the time axis. Whether a missing date actually has NaNs
+        is decided by the stored ``count_array`` (fewer valid points than grid cells means NaNs, and samples
+        that were never written are filled with NaNs), and the data is only read
+        for the dates where the counts can't settle it.
         """
 
         logger.info(f"{self.name}.reconcile_missing_and_nans: Starting...")
 
-        something_happened = False
         xds = xr.open_zarr(self.store_path)
-        xds = xds.swap_dims({"time": "dates"})
-        xds["has_nans_array"].load()
-        missing_dates = xds.attrs.get("missing_dates", [])
-        attrs = xds.attrs.copy()
-
-        nds = xr.Dataset()
-        nds["has_nans_array"] = xds["has_nans_array"]
+        zds = zarr.open(self.store_path, mode="a")
+        missing_dates = list(xds.attrs.get("missing_dates", []))
 
         # 1. Make sure has_nans_array is True at missing_dates
-        logger.info("Checking that has_nans_array = True at each missing_date")
-        for mdate in missing_dates:
-            this_one = xds.sel(dates=mdate)
-            is_actually_nan = np.isnan(this_one["data"]).any().values
-            has_nan = this_one["has_nans_array"].any().values
-            if is_actually_nan and not has_nan:
-                something_happened = True
+        has_nans, is_missing, update = self._set_has_nans_at_missing_dates(xds, zds, missing_dates)
 
-                logger.info(f" ... setting the date in has_nans_array to True: {mdate}")
-                nds["has_nans_array"].loc[{"dates": mdate}] = True
+        # 2. Make sure dates with unexpected NaNs get added to missing_dates
+        new_missing_dates = self._find_unexpected_nan_dates(xds, has_nans, is_missing)
 
+        if len(new_missing_dates) > 0:
+            zds.attrs["missing_dates"] = sorted(missing_dates + new_missing_dates)
 
-        # 2. Make sure dates with unexpected NaNs get added to missing_dates
+        if update.any() or len(new_missing_dates) > 0:
+            zarr.consolidate_metadata(self.store_path)
+            logger.info(f"{self.name}.reconcile_missing_and_nans: Updated zarr with missing_dates and has_nans_array")
+
+
+    def _set_has_nans_at_missing_dates(self, xds: xr.Dataset, zds: zarr.Group, missing_dates: list) -> tuple:
+        """Set ``has_nans_array`` to True in the store at the missing dates that actually have NaNs
+
+        Args:
+            xds (xr.Dataset): the store, opened with xarray
+            zds (zarr.Group): the same store, opened with zarr in append mode
+            missing_dates (list): the dates that could not be found
+
+        Returns:
+            has_nans (np.ndarray): the updated ``has_nans_array``, with dimensions ("time", "variable", "ensemble")
+            is_missing (np.ndarray): True at the time indices of the missing dates
+            update (np.ndarray): True at the time indices that were updated in the store
+        """
+        stat_dims = ("time", "variable", "ensemble")
+        has_nans = xds["has_nans_array"].transpose(*stat_dims).values.astype(bool)
+        other_axes = (1, 2)
+        n_time = has_nans.shape[0]
+
+        logger.info("Checking that has_nans_array = True at each missing_date")
+        is_missing = np.zeros(n_time, dtype=bool)
+        if len(missing_dates) > 0:
+            is_missing[self.get_indexer("datetime", pd.DatetimeIndex(missing_dates))] = True
+
+        candidates = is_missing & ~has_nans.any(axis=other_axes)
+        is_actually_nan = np.zeros(n_time, dtype=bool)
+        if candidates.any():
+            unknown = candidates.copy()
+            if "count_array" in xds:
+                count = xds["count_array"].transpose(*stat_dims).isel(time=candidates).values
+                n_cells = int(np.prod([xds.sizes[d] for d in xds["data"].dims if d not in stat_dims]))
+                unwritten = np.isnan(count).any(axis=other_axes)
+                fill_value = zds["data"].fill_value
+                fill_is_nan = fill_value is not None and np.isnan(fill_value)
+
+                is_actually_nan[candidates] = (count < n_cells).any(axis=other_axes) | (unwritten & fill_is_nan)
+                unknown[candidates] = unwritten & ~fill_is_nan
+
+            for tidx in np.flatnonzero(unknown):
+                is_actually_nan[tidx] = bool(np.isnan(xds["data"].isel(time=tidx)).any().values)
+
+        update = candidates & is_actually_nan
+        if update.any():
+            for tidx in np.flatnonzero(update):
+                logger.info(f" ... setting the date in has_nans_array to True: {self.datetime[tidx]}")
+            has_nans[update] = True
+
+            # one region write, spanning all of the updated dates
+            stored_dims = xds["has_nans_array"].dims
+            tidx = np.flatnonzero(update)
+            span = slice(int(tidx[0]), int(tidx[-1])+1)
+            values = np.transpose(has_nans[span], [stat_dims.index(d) for d in stored_dims])
+            region = tuple(span if d == "time" else slice(None) for d in stored_dims)
+            zds["has_nans_array"][region] = values
+        return has_nans, is_missing, update
+
+
+    def _find_unexpected_nan_dates(self, xds: xr.Dataset, has_nans: np.ndarray, is_missing: np.ndarray) -> list:
+        """Find the dates with NaNs in any variable that should not have them, which are not already missing
+
+        Args:
+            xds (xr.Dataset): the store, opened with xarray
+            has_nans (np.ndarray): from :meth:`_set_has_nans_at_missing_dates`, with dimensions ("time", "variable", "ensemble")
+            is_missing (np.ndarray): True at the time indices of the missing dates
+
+        Returns:
+            new_missing_dates (list): to be added to missing_dates
+        """
         logger.info("Checking that missing_dates contains all instances of has_nans_array = True (as desired per variable)")
+        keep_idx = self._variables_to_check_for_nans(xds.attrs["variables"], xds["variable"].values)
+        keep = np.isin(xds["variable"].values, keep_idx)
+        nanidx = has_nans[:, keep, :].any(axis=(1, 2)) & ~is_missing
+
+        new_missing_dates = [str(self.datetime[tidx]) for tidx in np.flatnonzero(nanidx)]
+        for ndate in new_missing_dates:
+            logger.info(f" ... adding date where has_nans_array = True to missing_dates: {ndate}")
+        return new_missing_dates
+
+
+    def _reconcile_missing_and_nan_times(self, nan_times: list) -> None:
+        """The equivalent of :meth:`reconcile_missing_and_nans` when the statistics were accumulated in memory,
+        so has_nans_array is not needed to find the unexpected NaNs.
+
+        Instead, any missing date in the statistics period sets has_nans in :meth:`aggregate_stats`,
+        and the times with unexpected NaNs found by :meth:`update_statistics` are added to missing_dates.
+        If the per sample statistics are stored, has_nans_array is still set to True at the missing dates,
+        just as in :meth:`reconcile_missing_and_nans`.
+
+        Args:
+            nan_times (list): logical time indices with unexpected NaNs, from all ranks
+        """
+
+        logger.info(f"{self.name}._reconcile_missing_and_nan_times: Starting...")
+
+        zds = zarr.open(self.store_path, mode="a")
+        missing_dates = list(zds.attrs.get("missing_dates", []))
+
+        start, end = pd.Timestamp(self.statistics_start_date), pd.Timestamp(self.statistics_end_date)
+        self._missing_in_statistics_period = any(start <= pd.Timestamp(mdate) <= end for mdate in missing_dates)
+
+        updated = False
+        if self.store_sample_statistics and len(missing_dates) > 0:
+            xds = xr.open_zarr(self.store_path)
+            _, _, update = self._set_has_nans_at_missing_dates(xds, zds, missing_dates)
+            updated = update.any()
+
+        new_missing_dates = list()
+        for t in nan_times:
+            ndate = str(self.datetime[t])
+            if ndate not in missing_dates:
+                logger.info(f" ... adding date with unexpected NaNs to missing_dates: {ndate}")
+                new_missing_dates.append(ndate)
+
+        if len(new_missing_dates) > 0:
+            zds.attrs["missing_dates"] = sorted(missing_dates + new_missing_dates)
+
+        if updated or len(new_missing_dates) > 0:
+            zarr.consolidate_metadata(self.store_path)
+            logger.info(f"{self.name}._reconcile_missing_and_nan_times: Updated zarr with missing_dates and has_nans_array")
+
+
+    def _variables_to_check_for_nans(self, variables: list, variable_idx: np.ndarray) -> list:
+        """Get the variable indices that should not have NaNs, i.e. everything not in variables_with_nans
+
+        Args:
+            variables (list): the channel names, from the "variables" attribute
+            variable_idx (np.ndarray): the "variable" coordinate
+
+        Returns:
+            keep_idx (list): subset of variable_idx
+        """
         ignore_idx = []
         if self.variables_with_nans is not None:
 
             ignoreme = list()
             for ignore_this in self.variables_with_nans:
-                if ignore_this in xds.attrs["variables"]:
+                if ignore_this in variables:
                     ignoreme.append(ignore_this)
                 else:
-                    all_instances = [entry for entry in xds.attrs["variables"] if ignore_this in entry]
+                    all_instances = [entry for entry in variables if ignore_this in entry]
                     for entry in all_instances:
                         ignoreme.append(entry)
 
-            logger.info(f"Will ignore the following fields if they have NaNs\n{ignoreme}")
-            ignore_idx = [xds.attrs["variables"].index(varname) for varname in ignoreme]
+            logger.debug(f"Will ignore the following fields if they have NaNs\n{ignoreme}")
+            ignore_idx = [variables.index(varname) for varname in ignoreme]
 
-        keep_idx = [idx for idx in xds["variable"].values if idx not in ignore_idx]
+        return [idx for idx in variable_idx if idx not in ignore_idx]
 
-        nanidx = xds["has_nans_array"].sel(variable=keep_idx).any(["variable", "ensemble"]).values
-        nandates = [str(pd.Timestamp(ndate)) for ndate in xds["dates"][nanidx].values]
-        new_missing_dates = list()
-        for ndate in nandates:
-            is_missing = ndate in missing_dates
-            if not is_missing:
-                something_happened = True
-                logger.info(f" ... adding date where has_nans_array = True to missing_dates: {ndate}")
-                new_missing_dates.append(ndate)
-
-        if len(new_missing_dates) > 0:
-            attrs["missing_dates"] = sorted(missing_dates + new_missing_dates)
 
-
-        if something_happened:
-            nds["time"] = xds["time"]
-            nds = nds.swap_dims({"dates": "time"}).drop_vars("dates")
-            nds.attrs = attrs
-            nds.to_zarr(self.store_path, mode="a")
-            logger.info(f"{self.name}.reconcile_missing_and_nans: Updated zarr with missing_dates and has_nans_array")
+    def _statistics_index_range(self) -> tuple:
+        """The start/end times for computing statistics, in terms of logical time index values (inclusive)"""
+        start_idx = int(self.get_indexer("datetime", pd.Timestamp(self.statistics_start_date))[0])
+        end_idx = int(self.get_indexer("datetime", pd.Timestamp(self.statistics_end_date))[0])
+        return start_idx, end_idx
 
 
     def aggregate_stats(self, topo) -> None:
@@ -646,76 +1072,43 @@ class Anemoi(Target):
 
             ["count", "has_nans", "maximum", "mean", "minimum", "squares", "stdev", "sums"]
 
-        and it will get rid of the "_array" versions of the statistics
+        and it will get rid of the "_array" versions of the statistics.
+        The per sample (count, mean, m2) are merged with the parallel algorithm of Chan et al.,
+        on each rank and then across ranks, so the variance never comes from ``squares/count - mean**2``.
         """
 
         xds = xr.open_zarr(self.store_path)
         attrs = xds.attrs.copy()
 
-        # get the start/end times for computing statistics
-        # in terms of logical time index values
-        start_idx = list(self.datetime).index(pd.Timestamp(self.statistics_start_date))
-        end_idx = list(self.datetime).index(pd.Timestamp(self.statistics_end_date))
-        xds = xds.sel(time=slice(start_idx, end_idx))
-
-        dims = ["time", "ensemble"]
-        time_indices = np.array_split(np.arange(len(xds["time"])), topo.size)
-        local_indices = time_indices[topo.rank]
-
-        vidx = xds["variable"].values
-        count = np.zeros_like(vidx, dtype=xds["count_array"].dtype)
-        has_nans = np.full_like(vidx, fill_value=False, dtype=xds["has_nans_array"].dtype)
-        maximum = np.full_like(vidx, fill_value=-np.inf, dtype=xds["maximum_array"].dtype)
-        minimum = np.full_like(vidx, fill_value=np.inf, dtype=xds["minimum_array"].dtype)
-        squares = np.zeros_like(vidx, dtype=xds["squares_array"].dtype)
-        sums = np.zeros_like(vidx, dtype=xds["sums_array"].dtype)
-
-        logger.info(f"{self.name}.aggregate_stats: Performing local computations")
-        if local_indices.size > 0:
-
-            lds = xds.isel(time=local_indices)
-            local_count = lds["count_array"].sum(dims).compute().values
-            local_has_nans = lds["has_nans_array"].any(dims).compute().values
-            local_maximum = lds["maximum_array"].max(dims).compute().values
-            local_minimum = lds["minimum_array"].min(dims).compute().values
-            local_squares = lds["squares_array"].sum(dims).compute().values
-            local_sums = lds["sums_array"].sum(dims).compute().values
+        if self._local_nan_times is not None:
+            logger.info(f"{self.name}.aggregate_stats: Using the statistics accumulated while storing the data")
+            local_stats = self._local_statistics
+            if local_stats is None:
+                local_stats = empty_statistics((len(xds["variable"]),))
 
         else:
+            # get the start/end times for computing statistics
+            # in terms of logical time index values
+            start_idx, end_idx = self._statistics_index_range()
+            xds = xds.sel(time=slice(start_idx, end_idx))
+            local_stats = self._read_local_stats(xds, topo)
 
-            local_count = count.copy()
-            local_has_nans = has_nans.copy()
-            local_maximum = maximum.copy()
-            local_minimum = minimum.copy()
-            local_squares = squares.copy()
-            local_sums = sums.copy()
-
-
-        # reduce results
+        # reduce results, merging the (count, mean, m2) from each rank
         logger.info(f"{self.name}.aggregate_stats: Communicating results to root")
-        topo.sum(local_count, count)
-        topo.any(local_has_nans, has_nans)
-        topo.max(local_maximum, maximum)
-        topo.min(local_minimum, minimum)
-        topo.sum(local_squares, squares)
-        topo.sum(local_sums, sums)
+        local_packed = pack_statistics(local_stats)
+        packed = np.zeros_like(local_packed)
+        topo.reduce_records(local_packed, packed, merge_packed_statistics)
         logger.info(f"{self.name}.aggregate_stats: ... done communicating")
 
         # the rest is done on the root rank
         if topo.is_root:
+            stats = finalize_statistics(unpack_statistics(packed))
+            if self._missing_in_statistics_period:
+                stats["has_nans"][:] = True
             nds = xr.Dataset()
             kw = {"coords": xds["variable"].coords}
-            nds["count"] = xr.DataArray(count, **kw)
-            nds["has_nans"] = xr.DataArray(has_nans, **kw)
-            nds["maximum"] = xr.DataArray(maximum, **kw)
-            nds["minimum"] = xr.DataArray(minimum, **kw)
-            nds["squares"] = xr.DataArray(squares, **kw)
-            nds["sums"] = xr.DataArray(sums, **kw)
-
-            # now add mean & stdev
-            nds["mean"] = nds["sums"] / nds["count"]
-            variance = nds["squares"] / nds["count"] - nds["mean"]**2
-            nds["stdev"] = xr.where(variance >= 0, np.sqrt(variance), 0.)
+            for key in ["count", "has_nans", "maximum", "minimum", "squares", "sums", "mean", "stdev"]:
+                nds[key] = xr.DataArray(stats[key], **kw)
 
             # store it, first copying the attributes over
             nds.attrs = attrs
@@ -726,66 +1119,63 @@ class Anemoi(Target):
         topo.barrier()
 
 
+    def _read_local_stats(self, xds: xr.Dataset, topo) -> dict:
+        """Read this rank's share of the stored per sample statistics, and combine them over time and ensemble"""
+        dims = ["time", "ensemble"]
+        time_indices = np.array_split(np.arange(len(xds["time"])), topo.size)
+        local_indices = time_indices[topo.rank]
+
+        logger.info(f"{self.name}._read_local_stats: Performing local computations")
+        if local_indices.size > 0:
+
+            # read all of the per sample statistics at once
+            names = [f"{key}_array" for key in packed_statistics]
+            lds = xds[names].isel(time=local_indices).transpose("variable", *dims).load()
+            return combine_statistics(
+                {key: lds[f"{key}_array"].values for key in packed_statistics},
+                axis=(1, 2),
+            )
+
+        else:
+            return empty_statistics((len(xds["variable"]),))
+
+
     def calc_temporal_residual_stats(self, topo):
+        """Compute statistics of the difference between consecutive time steps, e.g. for the "tendencies" in anemoi
+
+        Each rank streams through its own contiguous block of time steps, one zarr chunk at a time,
+        keeping only the previous time step in memory, so that the data is read once.
+        The difference across the boundary between two ranks is computed by passing the
+        first time step of each block to the previous rank.
+        """
 
         xds = xr.open_zarr(self.store_path)
         attrs = xds.attrs.copy()
         freqstr = self.dates.freqstr
+        variable_coords = xds["variable"].coords
 
         # get the start/end times for computing statistics
         # in terms of logical time index values
-        start_idx = list(self.datetime).index(pd.Timestamp(self.statistics_start_date))
-        end_idx = list(self.datetime).index(pd.Timestamp(self.statistics_end_date))
-        xds = xds.sel(time=slice(start_idx, end_idx))
-
-        data_diff = xds["data"].diff("time")
-        n_time = len(data_diff["time"])
-        count = xds["count"].load()/len(xds["time"])*n_time
-        count = count.values.astype(np.float64)
-        time_indices = np.array_split(np.arange(n_time), topo.size)
-        local_indices = time_indices[topo.rank]
+        start_idx, end_idx = self._statistics_index_range()
 
-        residual_avg = np.zeros_like(xds["variable"].values, dtype=np.float64)
-        residual_var = np.zeros_like(xds["variable"].values, dtype=np.float64)
-        residual_max = np.zeros_like(xds["variable"].values, dtype=np.float64)
-        residual_min = np.zeros_like(xds["variable"].values, dtype=np.float64)
-
-        logger.info(f"{self.name}.calc_temporal_residual_stats: Performing local computations")
-        if local_indices.size > 0:
-            dims = [d for d in xds["data"].dims if d != "variable"]
-            local_data_diff = data_diff.isel(time=local_indices).astype(np.float64)
-            local_residual_avg = local_data_diff.sum(dims).compute().values
-            local_residual_var = (local_data_diff**2).sum(dims).compute().values
-            local_residual_max = local_data_diff.max(dims).compute().values
-            local_residual_min = local_data_diff.min(dims).compute().values
-
-        else:
-            local_residual_var = residual_var.copy()
-            local_residual_avg = residual_avg.copy()
-            local_residual_max = residual_max.copy()
-            local_residual_min = residual_min.copy()
+        # read the data directly, rather than building a dask graph
+        array = zarr.open(self.store_path, mode="r")["data"]
+        local_stats = self._local_temporal_residual_stats(array, xds["data"].dims, start_idx, end_idx, topo)
 
         logger.info(f"{self.name}.calc_temporal_residual_stats: Communicating results to root")
-        topo.sum(local_residual_avg, residual_avg)
-        topo.sum(local_residual_var, residual_var)
-        topo.max(local_residual_max, residual_max)
-        topo.min(local_residual_min, residual_min)
+        local_packed = pack_statistics(local_stats)
+        packed = np.zeros_like(local_packed)
+        topo.reduce_records(local_packed, packed, merge_packed_statistics)
         logger.info(f"{self.name}.calc_temporal_residual_stats: ... done communicating")
 
-
         if topo.is_root:
+            stats = finalize_statistics(unpack_statistics(packed))
             nds = xr.Dataset()
             nds.attrs = attrs
 
-            # some corrections
-            residual_avg /= count
-            residual_var = residual_var / count - residual_avg**2
-
-            ckw = {"coords": xds["variable"].coords}
-            nds[f"statistics_tendencies_{freqstr}_mean"] = xr.DataArray(residual_avg, **ckw)
-            nds[f"statistics_tendencies_{freqstr}_stdev"] = xr.DataArray(np.sqrt(residual_var), **ckw)
-            nds[f"statistics_tendencies_{freqstr}_maximum"] = xr.DataArray(residual_max, **ckw)
-            nds[f"statistics_tendencies_{freqstr}_minimum"] = xr.DataArray(residual_min, **ckw)
+            ckw = {"coords": variable_coords}
+            for key in ["mean", "stdev", "maximum", "minimum"]:
+                nds[f"statistics_tendencies_{freqstr}_{key}"] = xr.DataArray(stats[key], **ckw)
 
             nds.to_zarr(self.store_path, mode="a")
             logger.info(f"{self.name}.calc_temporal_residual_stats: Stored temporal residual stats")
@@ -794,6 +1184,61 @@ class Anemoi(Target):
         topo.barrier()
 
 
+    def _local_temporal_residual_stats(self, array: zarr.Array, dims: tuple, start_idx: int, end_idx: int, topo) -> dict:
+        """Compute this rank's share of the statistics for :meth:`calc_temporal_residual_stats`
+
+        Args:
+            array (zarr.Array): the stored "data"
+            dims (tuple): the dimensions of ``array``
+            start_idx, end_idx (int): the logical time indices to compute the differences over (inclusive)
+            topo (SerialTopology or MPITopology): distributes the time steps, and exchanges the edges of each block
+
+        Returns:
+            local_stats (dict): the unfinalized statistics, see :func:`reduce_statistics`
+        """
+        time_axis = dims.index("time")
+        reduce_axis = tuple(i for i, d in enumerate(dims) if d != "variable")
+        step = array.chunks[time_axis]
+
+        def read(st, ed):
+            selection = tuple(slice(st, ed) if i == time_axis else slice(None) for i in range(len(dims)))
+            return array[selection]
+
+        # each rank gets a contiguous block of time steps, and computes the differences within it,
+        # plus the difference between its last time step and the next rank's first time step
+        time_indices = np.array_split(np.arange(start_idx, end_idx+1), topo.size)
+        local_indices = time_indices[topo.rank]
+        has_next = topo.rank+1 < topo.size and time_indices[topo.rank+1].size > 0
+
+        local_stats = empty_statistics((array.shape[dims.index("variable")],))
+
+        logger.info(f"{self.name}.calc_temporal_residual_stats: Performing local computations")
+        if local_indices.size > 0:
+            st, ed = int(local_indices[0]), int(local_indices[-1])+1
+            first = read(st, st+1)
+            next_first = np.empty_like(first) if has_next else None
+            topo.exchange_edges(
+                send_array=first if topo.rank > 0 else None,
+                recv_buffer=next_first,
+            )
+
+            previous = first
+            block_start = st + 1
+            while block_start < ed:
+                block_end = min(ed, (block_start // step + 1) * step)
+                block = read(block_start, block_end)
+                diff = np.diff(np.concatenate([previous, block], axis=time_axis).astype(np.float64), axis=time_axis)
+                local_stats = merge_statistics(local_stats, reduce_statistics(diff, axis=reduce_axis))
+                previous = np.take(block, [-1], axis=time_axis)
+                block_start = block_end
+
+            if has_next:
+                diff = next_first.astype(np.float64) - previous.astype(np.float64)
+                local_stats = merge_statistics(local_stats, reduce_statistics(diff, axis=reduce_axis))
+
+        return local_stats
+
+
     def handle_missing_data(self, missing_data: list[dict]) -> None:
         """Take a list of dicts, with dimensions of missing data. Keep track of any missing dates
         (via "t0" or "time") and store that in the zarr.
@@ -882,6 +1327,11 @@ class AnemoiInferenceWithForcings(Anemoi):
     Augmented "anemoi" target to be used for creating datasets for inference.
     THis facilitiates everything the anemoi target does,
     but only loads initial conditions, and then calculates forcings for the entire requested forecast.
+
+    The mover only reads the initial conditions (see :meth:`load_data_flag`), and all other time steps
+    are filled in by :meth:`store_forcings`, which computes the forcings for many time steps at once
+    and writes them straight into their channels. The "lsm" and "orog" variables are carried over from the initial conditions,
+    and every other channel is left alone, so it keeps the zarr fill value (NaN).
     """
 
     def __init__(
@@ -896,6 +1346,7 @@ class AnemoiInferenceWithForcings(Anemoi):
         sort_channels_by_levels: Optional[bool] = False,
         variables_with_nans: Optional[list] = None,
         multistep_input: Optional[int] = 1,
+        store_sample_statistics: Optional[bool] = True,
     ) -> None:
 
         super().__init__(
@@ -908,10 +1359,14 @@ class AnemoiInferenceWithForcings(Anemoi):
             compute_temporal_residual_statistics=compute_temporal_residual_statistics,
             sort_channels_by_levels=sort_channels_by_levels,
             variables_with_nans=variables_with_nans,
+            store_sample_statistics=store_sample_statistics,
         )
 
         self.multistep_input = multistep_input
 
+        # the land sea mask and orography are carried over from the initial conditions to every other time step
+        self.static_vars = [self.rename.get(key, key) for key in ("lsm", "orog")]
+
 
     @property
     def dates_with_data(self):
@@ -934,31 +1389,122 @@ class AnemoiInferenceWithForcings(Anemoi):
         return t0_val in self.dates_with_data
 
 
-    def save_ds_structure(self, ds):
-        """
-        Utility to save structure of our ds.
-        We do this to have coords (time/lat/lon/etc.) readily available later for computing forcings.
-        """
-        coords = {c: ds.coords[c].copy(deep=True) for c in ds.coords}
+    def finalize(self, topo) -> None:
+        """Fill in the time steps without data, and then finalize as usual"""
+        logger.info(f"Storing forcings")
+        self.store_forcings(topo)
+        logger.info(f"Done storing forcings\n")
+        super().finalize(topo)
 
-        # keep static vars, as they don't change over time
-        keep_vars = {"lsm", "orog"}
 
-        data_vars = {}
-        for v, da in ds.data_vars.items():
-            if v in keep_vars:
-                out = da.copy(deep=True)
-            else:
-                # for the rest, create float NaN-filled array with same structure
-                shape = tuple(ds.sizes[d] for d in da.dims)
-                data = np.full(shape, np.nan, dtype=float)
-                out = xr.DataArray(data, dims=da.dims, attrs=dict(da.attrs))
+    def store_forcings(self, topo, block_size: int = 2**26) -> None:
+        """Compute the forcings at every time step that does not have data, and store them along with the static variables
 
-            data_vars[v] = out
+        The forcing functions are called once per block of time steps on the stored grid,
+        with each rank handling its own share of the time steps.
+        Only the forcing and static channels are written, every other channel keeps the zarr fill value (NaN).
+        The per sample statistics are computed for these time steps as well, as if the other channels were all NaN.
 
-            self.ds_structure = xr.Dataset(
-                coords=coords, data_vars=data_vars, attrs=dict(ds.attrs)
+        Args:
+            topo (SerialTopology or MPITopology): distributes the time steps
+            block_size (int, optional): approximate number of elements to compute and write at once
+        """
+        zds = zarr.open(self.store_path, mode="a")
+        variables = list(zds.attrs["variables"])
+        dims = tuple(zds["data"].attrs["_ARRAY_DIMENSIONS"])
+        grid_dims = tuple(zds["latitudes"].attrs["_ARRAY_DIMENSIONS"])
+        block_dims = ("time", "variable", "ensemble") + grid_dims
+        n_ensemble = zds["data"].shape[dims.index("ensemble")]
+
+        def selection(**kwargs):
+            return tuple(kwargs.get(d, slice(None)) for d in dims)
+
+        # which time steps and channels
+        has_data = self.get_indexer("datetime", self.dates_with_data)
+        forcing_steps = np.setdiff1d(np.arange(len(self.datetime)), has_data)
+        local_steps = np.array_split(forcing_steps, topo.size)[topo.rank]
+        forcing_channels = [variables.index(key) for key in self.forcings]
+        static_channels = [variables.index(key) for key in self.static_vars if key in variables]
+        channels = forcing_channels + static_channels
+
+        logger.info(f"{self.name}.store_forcings: Computing forcings for {len(local_steps)} time steps")
+        if local_steps.size > 0 and len(channels) > 0:
+
+            # static variables are read once from the first initial condition
+            if len(static_channels) > 0:
+                static = zds["data"].get_orthogonal_selection(
+                    selection(time=int(has_data[0]), variable=static_channels),
+                )
+                static = xr.DataArray(static, dims=dims[:dims.index("time")] + dims[dims.index("time")+1:])
+                static = static.transpose(*block_dims[1:]).values
+
+            grid = xr.Dataset(
+                coords={
+                    "latitude": (grid_dims, zds["latitudes"][:]),
+                    "longitude": (grid_dims, zds["longitudes"][:]),
+                },
             )
+            mappings = fmod.get_mappings(time="time")
+
+            # the statistics of the channels that are not written, which are all NaN
+            nan_stats = reduce_statistics(np.full((1, 1), np.nan), axis=1, skipna=self.allow_nans)
+
+            n_cells = int(np.prod([grid.sizes[d] for d in grid_dims]))
+            steps_per_block = max(1, block_size // (len(channels) * n_ensemble * n_cells))
+            for st in range(0, len(local_steps), steps_per_block):
+                steps = local_steps[st:st+steps_per_block]
+                xds = grid.assign_coords(time=self.datetime[steps])
+
+                values = np.empty(
+                    (len(steps), len(channels), n_ensemble) + tuple(grid.sizes[d] for d in grid_dims),
+                    dtype=self.data_dtype,
+                )
+                for this_channel, key in enumerate(self.forcings):
+                    xda = mappings[key](xds)
+                    present = tuple(d for d in ("time",) + grid_dims if d in xda.dims)
+                    values[:, this_channel] = np.expand_dims(
+                        xda.transpose(*present).values,
+                        [i for i, d in enumerate(("time", "ensemble") + grid_dims) if d not in present],
+                    )
+                if len(static_channels) > 0:
+                    values[:, len(forcing_channels):] = static[None]
+
+                zds["data"].set_orthogonal_selection(
+                    selection(time=steps, variable=channels),
+                    xr.DataArray(values, dims=block_dims).transpose(*dims).values,
+                )
+
+                # per sample statistics
+                stats = reduce_statistics(values, axis=tuple(range(3, values.ndim)), skipna=self.allow_nans)
+                sds = xr.Dataset(
+                    coords={
+                        "time": steps,
+                        "variable": np.arange(len(variables)),
+                        "ensemble": np.arange(n_ensemble),
+                    },
+                    attrs={"variables": variables},
+                )
+                for key, val in stats.items():
+                    array = np.full((len(steps), len(variables), n_ensemble), nan_stats[key][0], dtype=val.dtype)
+                    array[:, channels] = val
+                    sds[f"{key}_array"] = xr.DataArray(array, dims=("time", "variable", "ensemble"))
+
+                self.update_statistics(sds)
+                if self.store_sample_statistics:
+                    for key in packed_statistics:
+                        name = f"{key}_array"
+                        stat_dims = tuple(zds[name].attrs["_ARRAY_DIMENSIONS"])
+                        zds[name].set_orthogonal_selection(
+                            tuple(steps if d == "time" else slice(None) for d in stat_dims),
+                            sds[name].transpose(*stat_dims).values,
+                        )
+
+        topo.barrier()
+
+
+    def _reconcile_missing_and_nan_times(self, nan_times: list) -> None:
+        logger.info(f"{self.name}._reconcile_missing_and_nan_times: Not necessary for this target, we expect nans after initial conditinos")
+
 
     def reconcile_missing_and_nans(self) -> None:
         logger.info(f"{self.name}.reconcile_missing_and_nans: Not necessary for this target, we expect nans after initial conditinos")
@@ -1,6 +1,9 @@
 import logging
+import threading
 from typing import Optional
 
+import numpy as np
+import pandas as pd
 import xarray as xr
 import zarr
 
@@ -79,6 +82,12 @@ class Target:
         self.store_path = store_path
         self.chunks = chunks
         self.rename = rename if rename is not None else dict()
+        self._indexes = dict()
+        self._constant_forcings = dict()
+
+        # several threads (e.g. prefetching batches) transform samples at the same time,
+        # so the caches on the target are only ever looked up or filled while holding this
+        self._cache_lock = threading.RLock()
 
         # set these for different source handling
         self._has_fhr = getattr(self.source, "fhr", None) is not None
@@ -151,6 +160,39 @@ class Target:
         return tuple(self.rename.get(d, d) for d in self.sample_dims)
 
 
+    def get_index(self, key: str) -> pd.Index:
+        """A hash based lookup table for the full coordinate ``key`` (e.g. "t0", "member", or "datetime"),
+        built once and reused, so that finding the position of a value does not scan the whole axis
+
+        Args:
+            key (str): name of an attribute on this target with all of the coordinate values
+
+        Returns:
+            index (pd.Index): with all values of the coordinate
+        """
+        with self._cache_lock:
+            if key not in self._indexes:
+                self._indexes[key] = pd.Index(getattr(self, key))
+            return self._indexes[key]
+
+
+    def get_indexer(self, key: str, values) -> np.ndarray:
+        """Find the logical index of each of ``values`` along the full coordinate ``key``
+
+        Args:
+            key (str): name of the coordinate, see :meth:`get_index`
+            values (array_like): values to look up, all of which must be in the coordinate
+
+        Returns:
+            indices (np.ndarray): integer positions of each value
+        """
+        indices = self.get_index(key).get_indexer(np.atleast_1d(values))
+        if (indices < 0).any():
+            missing = np.atleast_1d(values)[indices < 0]
+            raise ValueError(f"{self.name}.get_indexer: could not find {missing} in {key}")
+        return indices
+
+
     def apply_transforms_to_sample(
         self,
         xds: xr.Dataset,
@@ -202,11 +244,43 @@ class Target:
             dummy_name = f"computed_forcing_{key}"
             assert dummy_name not in xds, \
                 f"{self.name}.compute_forcings: {dummy_name} in dataset, but this name is needed to store forcings ... "
-            func = mappings[key]
-            xds[dummy_name] = func(xds)
+            xds[dummy_name] = self._get_forcing(key, mappings[key], xds)
         return xds
 
 
+    def _get_forcing(self, key: str, func, xds: xr.Dataset) -> xr.DataArray:
+        """Compute a forcing, unless it is constant in time and was already computed on this grid
+
+        Args:
+            key (str): name of the forcing
+            func (callable): from :func:`forcings.get_mappings`
+            xds (xr.Dataset): the sample
+
+        Returns:
+            forcing (xr.DataArray): read-only if it is constant in time
+        """
+        grid_keys = [k for k in ("latitude", "longitude") if k in xds]
+        with self._cache_lock:
+            cached = self._constant_forcings.get(key, None)
+        if cached is not None and all(
+            k in cached["grid"] and np.array_equal(cached["grid"][k], xds[k].values) for k in grid_keys
+        ):
+            return cached["forcing"]
+
+        # computed without the lock, so that the forcings that vary in time are computed in parallel
+        forcing = func(xds)
+        if forcing.attrs.get("constant_in_time", False):
+            # anything that isn't part of the grid, e.g. the time, is different for the next sample
+            forcing = forcing.reset_coords(drop=True).copy(deep=True)
+            forcing.values.flags.writeable = False
+            with self._cache_lock:
+                self._constant_forcings[key] = {
+                    "grid": {k: xds[k].values.copy() for k in grid_keys},
+                    "forcing": forcing,
+                }
+        return forcing
+
+
     def manage_coords(self, xds: xr.Dataset) -> xr.Dataset:
         """Manage the coordinates that will get stored in the container
 
@@ -221,6 +295,22 @@ class Target:
         xds = self.source.add_full_extra_coords(xds)
         return xds
 
+    def reset_statistics(self) -> None:
+        """Start keeping track of any statistics in memory, as each batch is stored. Nothing to do here."""
+        pass
+
+    def update_statistics(self, xds: xr.Dataset) -> None:
+        """Update any statistics kept in memory with a batch that is being stored. Nothing to do here."""
+        pass
+
+    def check_existing_store(self) -> None:
+        """Make sure that an existing store, e.g. for a restart or patch, can be added to. Nothing to do here."""
+        pass
+
+    def drop_sample_statistics(self, xds: xr.Dataset) -> xr.Dataset:
+        """Remove anything that is only needed for :meth:`update_statistics`, and should not be stored"""
+        return xds
+
     def compute_valid_time(self, topo) -> None:
         """Deal with the dates issue
 
@@ -1,4 +1,5 @@
 import logging
+from functools import lru_cache
 
 import numpy as np
 import xarray as xr
@@ -63,14 +64,27 @@ def _sin_longitude(xds: xr.Dataset):
     slon.attrs["constant_in_time"] = True
     return slon
 
+def _per_timestamp(func, xtime: xr.DataArray) -> np.ndarray:
+    """Apply a memoized function of a single timestamp to each time in an array,
+    so that e.g. all ensemble members at the same valid time share the work"""
+    values = [func(pd.Timestamp(t)) for t in np.atleast_1d(xtime.values)]
+    return np.array(values).reshape(xtime.shape + np.shape(values[0]))
+
+@lru_cache(maxsize=4096)
+def _julian_day_of(timestamp: pd.Timestamp) -> float:
+    delta = timestamp - pd.Timestamp(year=timestamp.year, month=1, day=1)
+    return delta.days + delta.seconds / 86400
+
+@lru_cache(maxsize=4096)
+def _hours_of_day(timestamp: pd.Timestamp) -> float:
+    delta = timestamp - timestamp.normalize() # gets the delta in hours
+    return delta.seconds / 86400 * 24 # now this is e.g. 12 at 12z
+
 def _julian_day(xds: xr.Dataset, time="time"):
-    ptime = pd.to_datetime(xds[time])
-    pyears = pd.to_datetime(xds[time].dt.year.astype(str))
-    delta = ptime - pyears
-    jday = delta.days + delta.seconds / 86400
     jday = xr.DataArray(
-        jday,
+        _per_timestamp(_julian_day_of, xds[time]),
         coords=xds[time].coords,
+        dims=xds[time].dims,
         attrs={
             "description": "julian day relative to start of year",
             "computed_forcing": True,
@@ -96,10 +110,11 @@ def _sin_julian_day(xds: xr.Dataset, time="time"):
     return sjd
 
 def _local_time(xds: xr.Dataset, time="time"):
-    pd_time = pd.to_datetime(xds[time].values)
-    delta = pd_time - pd_time.normalize() # gets the delta in hours
-    hours = delta.seconds / 86400 * 24 # now this is e.g. 12 at 12z
-    hours = xr.DataArray(hours, coords=xds[time].coords)
+    hours = xr.DataArray(
+        _per_timestamp(_hours_of_day, xds[time]),
+        coords=xds[time].coords,
+        dims=xds[time].dims,
+    )
     local_time = (xds["longitude"] / 360 * 24 + hours) % 24
     local_time.attrs["description"] = "relative local time in hours, from time in UTC & longitude"
     local_time.attrs["computed_forcing"] = True
@@ -130,7 +145,15 @@ def _solar_declination_angle(xds: xr.Dataset, time="time"):
         declination (xr.DataArray): in radians, not in degrees as in earthkit-meteo
         time_correction (xr.DataArray): function of dataset time array
     """
-    angle = _julian_day(xds, time=time) / 365.25 * np.pi * 2
+    values = _per_timestamp(_solar_declination_angle_of, xds[time])
+    kw = {"coords": xds[time].coords, "dims": xds[time].dims}
+    declination = xr.DataArray(values[..., 0], **kw)
+    time_correction = xr.DataArray(values[..., 1], **kw)
+    return declination, time_correction
+
+@lru_cache(maxsize=4096)
+def _solar_declination_angle_of(timestamp: pd.Timestamp) -> tuple:
+    angle = _julian_day_of(timestamp) / 365.25 * np.pi * 2
     declination = np.deg2rad(
         0.396372
         - 22.91327 * np.cos(angle)
@@ -0,0 +1,228 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("ufs2arco")
+
+# the order of the statistics in a packed record, see pack_statistics
+packed_statistics = ("count", "mean", "m2", "maximum", "minimum", "has_nans")
+
+def reduce_statistics(
+    data: np.ndarray,
+    axis: tuple,
+    skipna: bool = True,
+    block_size: int = 2**20,
+) -> dict:
+    """Compute the count, has_nans, maximum, minimum, mean, and m2 (sum of squared deviations from the mean)
+    of ``data`` over ``axis`` with a single pass through the array.
+
+    The reduced axes are processed in blocks, so that the float64 copy of the data
+    never takes more than ``8 * block_size`` bytes at once, and the blocks are combined
+    with :func:`merge_statistics`.
+
+    Args:
+        data (np.ndarray): the array to reduce, e.g. with dims (time, ensemble, variable, latitude, longitude)
+        axis (tuple): the axes to reduce over, e.g. the horizontal axes
+        skipna (bool, optional): if True, ignore NaNs as in :func:`numpy.nanmean`, otherwise
+            NaNs propagate to maximum, minimum, mean, and m2
+        block_size (int, optional): approximate number of elements to process at once
+
+    Returns:
+        stats (dict): with keys "count", "has_nans", "maximum", "minimum", "mean", "m2",
+            each array has the shape of ``data`` without the ``axis`` dimensions.
+            Everything is float64, except for "has_nans" which is bool.
+    """
+    axis = tuple(a % data.ndim for a in np.atleast_1d(axis))
+    keep = tuple(a for a in range(data.ndim) if a not in axis)
+    out_shape = tuple(data.shape[a] for a in keep)
+
+    # put the reduced axes last, and flatten to (n_keep, n_reduce)
+    x = np.transpose(data, keep + axis).reshape(int(np.prod(out_shape)), -1)
+    n_rows, n_cols = x.shape
+
+    stats = empty_statistics((n_rows,))
+    cols_per_block = max(1, block_size // max(1, n_rows))
+    for start in range(0, n_cols, cols_per_block):
+        block = x[:, start:start+cols_per_block].astype(np.float64)
+        isnan = np.isnan(block)
+        nan_count = isnan.sum(axis=1)
+        block_count = (block.shape[1] - nan_count).astype(np.float64)
+
+        if skipna:
+            maximum = np.fmax.reduce(block, axis=1)
+            minimum = np.fmin.reduce(block, axis=1)
+            block[isnan] = 0.
+        else:
+            maximum = block.max(axis=1)
+            minimum = block.min(axis=1)
+
+        mean = _divide(block.sum(axis=1), block_count)
+        block -= mean[:, None]
+        if skipna:
+            block[isnan] = 0.
+        np.multiply(block, block, out=block)
+
+        stats = merge_statistics(
+            stats,
+            {
+                "count": block_count,
+                "has_nans": nan_count > 0,
+                "maximum": maximum,
+                "minimum": minimum,
+                "mean": mean,
+                "m2": block.sum(axis=1),
+            },
+        )
+
+    if not skipna:
+        for key in ["maximum", "minimum", "mean", "m2"]:
+            stats[key][stats["has_nans"]] = np.nan
+
+    # no valid values, as with np.nanmax
+    stats["maximum"][stats["count"] == 0] = np.nan
+    stats["minimum"][stats["count"] == 0] = np.nan
+    return {key: val.reshape(out_shape) for key, val in stats.items()}
+
+
+def empty_statistics(shape: tuple) -> dict:
+    """Statistics of nothing, which leave anything they are merged with unchanged
+
+    Args:
+        shape (tuple): of each array
+
+    Returns:
+        stats (dict): see :func:`reduce_statistics`
+    """
+    return {
+        "count": np.zeros(shape, dtype=np.float64),
+        "has_nans": np.zeros(shape, dtype=bool),
+        "maximum": np.full(shape, -np.inf, dtype=np.float64),
+        "minimum": np.full(shape, np.inf, dtype=np.float64),
+        "mean": np.zeros(shape, dtype=np.float64),
+        "m2": np.zeros(shape, dtype=np.float64),
+    }
+
+
+def merge_statistics(a: dict, b: dict) -> dict:
+    """Combine the statistics of two disjoint sets of values, using the parallel algorithm
+    of Chan et al. (1979) for the mean and m2, which avoids the cancellation in ``squares/count - mean**2``.
+
+    Entries with a count of 0 contribute nothing, regardless of the other values.
+
+    Args:
+        a, b (dict): see :func:`reduce_statistics`
+
+    Returns:
+        stats (dict): for the union of both sets
+    """
+    n_a, n_b = _valid_count(a["count"]), _valid_count(b["count"])
+    count = n_a + n_b
+    delta = np.where(n_b > 0, b["mean"] - a["mean"], 0.)
+    fraction = _divide(n_b, count)
+    return {
+        "count": count,
+        "has_nans": np.logical_or(a["has_nans"], b["has_nans"]),
+        "maximum": np.fmax(a["maximum"], b["maximum"]),
+        "minimum": np.fmin(a["minimum"], b["minimum"]),
+        "mean": np.where(n_a > 0, a["mean"], 0.) + delta * fraction,
+        "m2": np.where(n_a > 0, a["m2"], 0.) + np.where(n_b > 0, b["m2"], 0.) + delta**2 * n_a * fraction,
+    }
+
+
+def combine_statistics(stats: dict, axis: tuple) -> dict:
+    """Combine the statistics of many disjoint sets of values at once, e.g. the per sample statistics over time.
+    This gives the same result as repeatedly calling :func:`merge_statistics`.
+
+    Args:
+        stats (dict): see :func:`reduce_statistics`
+        axis (tuple): the axes to combine over
+
+    Returns:
+        stats (dict): without the ``axis`` dimensions
+    """
+    axis = tuple(np.atleast_1d(axis))
+    count = _valid_count(stats["count"])
+    valid = count > 0
+    total = count.sum(axis=axis)
+    mean = _divide(np.where(valid, count * stats["mean"], 0.).sum(axis=axis), total)
+    deviation = np.where(valid, stats["mean"] - np.expand_dims(mean, axis), 0.)
+    m2 = np.where(valid, stats["m2"], 0.).sum(axis=axis) + (count * deviation**2).sum(axis=axis)
+    return {
+        "count": total,
+        "has_nans": np.logical_or.reduce(stats["has_nans"], axis=axis),
+        "maximum": np.fmax.reduce(stats["maximum"], axis=axis),
+        "minimum": np.fmin.reduce(stats["minimum"], axis=axis),
+        "mean": mean,
+        "m2": m2,
+    }
+
+
+def pack_statistics(stats: dict) -> np.ndarray:
+    """Put 1D statistics into a single (n, 6) float64 array, with one record per row, e.g. to send with MPI
+
+    Args:
+        stats (dict): see :func:`reduce_statistics`
+
+    Returns:
+        packed (np.ndarray): with columns ordered as in ``packed_statistics``
+    """
+    return np.stack([np.asarray(stats[key], dtype=np.float64) for key in packed_statistics], axis=-1)
+
+
+def unpack_statistics(packed: np.ndarray) -> dict:
+    """Inverse of :func:`pack_statistics`"""
+    stats = {key: packed[..., i].copy() for i, key in enumerate(packed_statistics)}
+    stats["has_nans"] = stats["has_nans"] > 0
+    return stats
+
+
+def merge_packed_statistics(records: np.ndarray, result: np.ndarray) -> None:
+    """Merge the packed ``records`` into ``result``, in place, for use as an MPI reduction operation
+
+    Args:
+        records, result (np.ndarray): from :func:`pack_statistics`
+    """
+    result[:] = pack_statistics(
+        merge_statistics(unpack_statistics(records), unpack_statistics(result)),
+    )
+
+
+def finalize_statistics(stats: dict) -> dict:
+    """Convert to the statistics that anemoi expects
+
+    Args:
+        stats (dict): see :func:`reduce_statistics`
+
+    Returns:
+        stats (dict): with "count", "has_nans", "maximum", "mean", "minimum", "squares", "stdev", "sums"
+    """
+    count = stats["count"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(count > 0, stats["mean"], np.nan)
+        stdev = np.where(count > 0, np.sqrt(stats["m2"] / count), 0.)
+    return {
+        "count": count,
+        "has_nans": stats["has_nans"],
+        "maximum": stats["maximum"],
+        "mean": mean,
+        "minimum": stats["minimum"],
+        "squares": stats["m2"] + count * stats["mean"]**2,
+        "stdev": stdev,
+        "sums": count * stats["mean"],
+    }
+
+
+def _valid_count(count: np.ndarray) -> np.ndarray:
+    """Treat missing counts (e.g. NaN fill values) as zero"""
+    count = np.asarray(count, dtype=np.float64)
+    return np.where(count > 0, count, 0.)
+
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """numerator / denominator, with 0 where the denominator is 0"""
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.zeros(np.broadcast(numerator, denominator).shape, dtype=np.float64),
+        where=denominator > 0,
+    )
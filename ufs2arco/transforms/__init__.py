@@ -1,4 +1,6 @@
 from .transformer import Transformer
 
+from .derived_variables import fv_derived_variables
 from .horizontal_regrid import horizontal_regrid
+from .pressure_levels import interp2pressure
 from .vertical_regrid import fv_vertical_regrid
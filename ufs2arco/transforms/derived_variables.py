@@ -0,0 +1,100 @@
+"""
+Derive variables on the FV3 native vertical grid, e.g. layer thickness, layer mean pressure, and geopotential
+"""
+import logging
+
+import xarray as xr
+
+from ufs2arco.layers2pressure import Layers2Pressure
+
+logger = logging.getLogger("ufs2arco")
+
+available_derived_variables = ("delz", "prsl", "geopotential")
+
+def fv_derived_variables(
+    xds: xr.Dataset,
+    variables: list | tuple,
+) -> xr.Dataset:
+    """Compute variables on the FV3 native vertical grid, with dimension "level", and add them to the dataset
+
+    The pressure at the vertical grid interfaces, and the difference of its log across each layer,
+    are computed once and shared by every derived variable.
+    The options are
+
+    - "delz": hydrostatic layer thickness, computed from "pressfc", "tmp", and "spfh", overwriting any "delz" in the dataset
+    - "prsl": layer mean pressure, computed from "pressfc", "tmp", "spfh", and "delz"
+    - "geopotential": at layer centers, computed from "delz" and the surface height, "hgtsfc" or "hgtsfc_static"
+
+    Note:
+        If "delz" is derived here, then it is used to compute "prsl" and "geopotential", which means
+        that they also rely on the hydrostatic approximation.
+
+    Args:
+        xds (xr.Dataset): with the data on the native vertical grid, which is assumed to be the default
+            127 level grid in :class:`Layers2Pressure`
+        variables (list, tuple): the variables to derive, any of ``available_derived_variables``
+
+    Returns:
+        xds (xr.Dataset): with the derived variables added
+    """
+
+    unrecognized = [key for key in variables if key not in available_derived_variables]
+    assert len(unrecognized) == 0, \
+        f"fv_derived_variables: the following are not recognized: {unrecognized}, choose from {available_derived_variables}"
+
+    lp = Layers2Pressure(level_name="level", interface_name="phalf")
+
+    needed = {"pressfc", "tmp", "spfh"} if "delz" in variables or "prsl" in variables else set()
+    if "geopotential" in variables:
+        needed.add("hgtsfc" if "hgtsfc" in xds else "hgtsfc_static")
+    if "delz" not in variables and ("prsl" in variables or "geopotential" in variables):
+        needed.add("delz")
+    missing = [key for key in sorted(needed) if key not in xds]
+    assert len(missing) == 0, \
+        f"fv_derived_variables: can't find the following variables needed to compute {list(variables)}: {missing}"
+
+    prsi = lp.calc_pressure_interfaces(xds["pressfc"]) if "pressfc" in needed else None
+
+    # only shared with prsl when delz is derived here, since then prsl = dpres / dlogp
+    dlogp = lp.calc_dlogp(prsi) if "delz" in variables else None
+
+    if "delz" in variables:
+        delz = lp.calc_delz(xds["pressfc"], xds["tmp"], xds["spfh"], prsi=prsi, dlogp=dlogp)
+        xds["delz"] = _finalize(
+            delz,
+            like=xds["tmp"],
+            attrs={
+                "units": "m",
+                "long_name": "layer thickness",
+                "description": "Hydrostatic approximation, diagnosed using ufs2arco.Layers2Pressure.calc_delz",
+            },
+        )
+
+    if "prsl" in variables:
+        prsl = lp.calc_layer_mean_pressure(xds["pressfc"], xds["tmp"], xds["spfh"], xds["delz"], prsi=prsi, dlogp=dlogp)
+        xds["prsl"] = _finalize(
+            prsl,
+            like=xds["tmp"],
+            attrs={
+                "units": "Pa",
+                "long_name": "layer mean pressure",
+                "description": "Diagnosed using ufs2arco.Layers2Pressure.calc_layer_mean_pressure",
+            },
+        )
+
+    if "geopotential" in variables:
+        hgtsfc = xds["hgtsfc"] if "hgtsfc" in xds else xds["hgtsfc_static"]
+        geopotential = lp.calc_geopotential(hgtsfc, xds["delz"])
+        attrs = geopotential.attrs.copy()
+        attrs["long_name"] = "geopotential"
+        xds["geopotential"] = _finalize(geopotential, like=xds["delz"], attrs=attrs)
+
+    return xds
+
+
+def _finalize(xda: xr.DataArray, like: xr.DataArray, attrs: dict) -> xr.DataArray:
+    """Match the dimension order and dtype of ``like``, without the coordinates brought in by the vertical grid"""
+    xda = xda.drop_vars([key for key in xda.coords if key not in like.coords])
+    xda = xda.transpose(*like.dims, ...).astype(like.dtype)
+    xda.attrs = attrs
+    return xda
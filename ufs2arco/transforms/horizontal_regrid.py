@@ -1,5 +1,7 @@
 import os
+import hashlib
 import logging
+import threading
 from typing import Optional
 
 import numpy as np
@@ -10,11 +12,11 @@ import xarray as xr
 import cf_xarray as cfxr
 
 try:
-    import xesmf
+    import scipy.sparse
 
-    _has_xesmf = True
+    _has_scipy = True
 except ImportError:
-    _has_xesmf = False
+    _has_scipy = False
 
 from ufs2arco.regrid.gaussian_grid import gaussian_latitudes
 
@@ -26,10 +28,26 @@ def horizontal_regrid(
     regridder_kwargs: dict,
     open_target_kwargs: Optional[dict] = None,
     source_is_on_gaussian_grid: bool = False,
+    regridder_cache: Optional[dict] = None,
+    backend: str = "xesmf",
 ):
+    """Regrid the dataset horizontally to the grid in ``target_grid_path`` with xesmf
 
-    kw = {} if open_target_kwargs is None else open_target_kwargs
-    ds_out = xr.open_dataset(os.path.expandvars(target_grid_path), **kw)
+    Args:
+        xds (xr.Dataset): with "latitude" and "longitude" as horizontal coordinates
+        target_grid_path (str): path to a dataset with the target "lat" and "lon"
+        regridder_kwargs (dict): passed to :class:`xesmf.Regridder`
+        open_target_kwargs (dict, optional): passed to :func:`xarray.open_dataset` when opening the target grid
+        source_is_on_gaussian_grid (bool, optional): if True, compute latitude bounds for a gaussian grid
+        regridder_cache (dict, optional): if provided, regridders are stored here based on the source grid
+            and options, and reused whenever the same source grid comes through again
+        backend (str, optional): "xesmf" to regrid with :class:`xesmf.Regridder`, or "sparse" to apply
+            an existing xesmf weights file with scipy, see :class:`SparseRegridder`. With "sparse", only the
+            ``regridder_kwargs`` in ``sparse_regridder_kwargs`` can be used, since the weights are never computed
+
+    Returns:
+        ds_out (xr.Dataset): on the target grid
+    """
 
     # required for xesmf
     rename = {"longitude": "lon", "latitude": "lat"}
@@ -37,43 +55,93 @@ def horizontal_regrid(
         if key in xds:
             xds = xds.rename({key: val})
 
-    # for the first time, we have to compute the regridder weights no matter what
-    # so, figure out if we have the file or not
-    kw = regridder_kwargs.copy()
-    filename = kw.get(
-        "filename",
-        f"{kw['method']}_{len(xds.lat)}x{len(xds.lon)}_{len(ds_out.lat)}x{len(ds_out.lon)}.nc",
-    )
-    filename = os.path.expandvars(filename)
-    kw["filename"] = filename
-    if os.path.isfile(filename):
-        kw["reuse_weights"] = kw.get("reuse_weights", True)
-    else:
-        kw["reuse_weights"] = False
-        logger.info(f"ufs2arco.transforms.horizontal_regrid: couldn't find xesmf weights filename {filename}, they'll be computed now.")
+    signature = None
+    if regridder_cache is not None:
+        signature = _grid_signature(
+            xds,
+            target_grid_path,
+            regridder_kwargs,
+            open_target_kwargs,
+            source_is_on_gaussian_grid,
+            backend,
+        )
 
-    # check if bounds are there
-    if "lat_b" not in xds and "lon_b" not in xds:
-        if not os.path.isfile(filename):
-            logger.info(f"ufs2arco.transforms.horizontal_regrid: did not find 'lat_b' or 'lon_b' in source, computing bounds.")
-        xds = get_bounds(xds, is_gaussian=source_is_on_gaussian_grid)
-        if not os.path.isfile(filename):
-            logger.info(f"ufs2arco.transforms.horizontal_regrid: computed bounds are\nLongitude\n{xds.lon_b}\nLatitude\n{xds.lat_b}")
+    # several threads (e.g. prefetching batches) can get here at the same time,
+    # so only one of them builds each regridder, and ESMF is never called concurrently for the same grid
+    with _regridder_lock(signature):
+        if signature is not None and signature in regridder_cache:
+            regridder = regridder_cache[signature]
+
+        elif backend == "sparse":
+            unsupported = [key for key in regridder_kwargs if key not in sparse_regridder_kwargs]
+            if len(unsupported) > 0:
+                raise ValueError(
+                    f"ufs2arco.transforms.horizontal_regrid: the following regridder_kwargs can't be used with backend='sparse': {unsupported}. " +\
+                    f"Choose from {sparse_regridder_kwargs}, or use backend='xesmf'"
+                )
+            kw = {} if open_target_kwargs is None else open_target_kwargs
+            ds_out = xr.open_dataset(os.path.expandvars(target_grid_path), **kw)
+            filename = regridder_kwargs.get(
+                "filename",
+                f"{regridder_kwargs['method']}_{len(xds.lat)}x{len(xds.lon)}_{len(ds_out.lat)}x{len(ds_out.lon)}.nc",
+            )
+            regridder = SparseRegridder(
+                filename=os.path.expandvars(filename),
+                ds_out=ds_out,
+                shape_in=(len(xds.lat), len(xds.lon)),
+                method=regridder_kwargs.get("method", None),
+                unmapped_to_nan=regridder_kwargs.get("unmapped_to_nan", True),
+            )
+            if signature is not None:
+                regridder_cache[signature] = regridder
+
+        else:
+            kw = {} if open_target_kwargs is None else open_target_kwargs
+            ds_out = xr.open_dataset(os.path.expandvars(target_grid_path), **kw)
+
+            # for the first time, we have to compute the regridder weights no matter what
+            # so, figure out if we have the file or not
+            kw = regridder_kwargs.copy()
+            filename = kw.get(
+                "filename",
+                f"{kw['method']}_{len(xds.lat)}x{len(xds.lon)}_{len(ds_out.lat)}x{len(ds_out.lon)}.nc",
+            )
+            filename = os.path.expandvars(filename)
+            kw["filename"] = filename
+            if os.path.isfile(filename):
+                kw["reuse_weights"] = kw.get("reuse_weights", True)
+            else:
+                kw["reuse_weights"] = False
+                logger.info(f"ufs2arco.transforms.horizontal_regrid: couldn't find xesmf weights filename {filename}, they'll be computed now.")
+
+            # check if bounds are there
+            ds_in = xds
+            if "lat_b" not in ds_in and "lon_b" not in ds_in:
+                if not os.path.isfile(filename):
+                    logger.info(f"ufs2arco.transforms.horizontal_regrid: did not find 'lat_b' or 'lon_b' in source, computing bounds.")
+                ds_in = get_bounds(ds_in, is_gaussian=source_is_on_gaussian_grid)
+                if not os.path.isfile(filename):
+                    logger.info(f"ufs2arco.transforms.horizontal_regrid: computed bounds are\nLongitude\n{ds_in.lon_b}\nLatitude\n{ds_in.lat_b}")
+
+            # imported here rather than at the top, so that ESMF is only loaded when it's needed
+            import xesmf
+            regridder = xesmf.Regridder(
+                ds_in=maybe_make_dataset_c_contiguous(ds_in),
+                ds_out=ds_out,
+                **kw,
+            )
+            if signature is not None:
+                regridder_cache[signature] = regridder
 
     # check input_array for c_contiguous or not
     xds = maybe_make_dataset_c_contiguous(xds)
 
     # do the work
-    regridder = xesmf.Regridder(
-        ds_in=xds,
-        ds_out=ds_out,
-        **kw,
-    )
     ds_out = regridder(xds, keep_attrs=True)
 
-    # ds_out has the lat/lon boundaries from input dataset
+    # ds_out may have the lat/lon boundaries from input dataset
     # remove these because it doesn't make sense anymore
-    ds_out = ds_out.drop_vars(["lat_b", "lon_b"])
+    ds_out = ds_out.drop_vars(["lat_b", "lon_b"], errors="ignore")
 
     # this one is a weird one, created by xesmf's global grid util creator
     if "latitude_longitude" in ds_out:
@@ -82,6 +150,133 @@ def horizontal_regrid(
     ds_out = ds_out.rename({"lon": "longitude", "lat": "latitude",})
     return ds_out
 
+
+# the regridder_kwargs that mean something to SparseRegridder, where "reuse_weights" is always True
+sparse_regridder_kwargs = ("method", "filename", "reuse_weights", "unmapped_to_nan")
+
+_regridder_locks = dict()
+_regridder_locks_lock = threading.Lock()
+
+def _regridder_lock(signature: Optional[str]) -> threading.Lock:
+    """The lock for getting or building the regridder with this grid signature"""
+    with _regridder_locks_lock:
+        if signature not in _regridder_locks:
+            _regridder_locks[signature] = threading.Lock()
+        return _regridder_locks[signature]
+
+
+class SparseRegridder:
+    """
+    Apply xesmf regridding weights as a scipy sparse matrix, so that neither xesmf nor ESMF are needed.
+
+    The weights file has to exist already, e.g. from a previous run using the "xesmf" backend
+    or from :class:`xesmf.Regridder` directly. As in xesmf, the horizontal grid is flattened in
+    C order, i.e. ``(lat, lon) -> lat * n_lon + lon``, and every horizontal field in the dataset
+    (all variables, all levels, all times) is regridded in a single sparse matrix multiply.
+    Also as in xesmf, target cells that no source cell maps to are NaN, unless ``unmapped_to_nan=False``.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        ds_out: xr.Dataset,
+        shape_in: tuple,
+        method: Optional[str] = None,
+        unmapped_to_nan: bool = True,
+    ) -> None:
+        """
+        Args:
+            filename (str): path to the xesmf weights file, with "row", "col", and "S" (1-based indices)
+            ds_out (xr.Dataset): with the target "lat" and "lon"
+            shape_in (tuple): the source grid shape, (n_lat, n_lon)
+            method (str, optional): the regridding method, just used for attributes
+            unmapped_to_nan (bool, optional): if True, target cells without any weights are NaN rather than 0
+        """
+        if not _has_scipy:
+            raise ImportError(f"SparseRegridder.__init__: Could not 'import scipy', but this is needed for the 'sparse' backend")
+        if not os.path.isfile(filename):
+            raise FileNotFoundError(f"SparseRegridder.__init__: could not find weights file {filename}, create it with the 'xesmf' backend first")
+
+        self.lat = ds_out["lat"]
+        self.lon = ds_out["lon"]
+        self.method = method
+        self.shape_in = tuple(shape_in)
+        self.shape_out = (len(self.lat), len(self.lon))
+
+        with xr.open_dataset(filename) as weights:
+            row = weights["row"].values.astype(np.int64) - 1
+            col = weights["col"].values.astype(np.int64) - 1
+            S = weights["S"].values
+        self.weights = scipy.sparse.csr_matrix(
+            (S, (row, col)),
+            shape=(int(np.prod(self.shape_out)), int(np.prod(self.shape_in))),
+        )
+        self.unmapped = np.diff(self.weights.indptr) == 0 if unmapped_to_nan else None
+
+    def __call__(self, xds: xr.Dataset, keep_attrs: bool = True) -> xr.Dataset:
+        """Regrid all variables with "lat" and "lon" dimensions, others are dropped as in xesmf
+
+        Args:
+            xds (xr.Dataset): on the source grid
+            keep_attrs (bool, optional): keep variable and dataset attributes
+
+        Returns:
+            ds_out (xr.Dataset): on the target grid
+        """
+        horizontal = ("lat", "lon")
+        n_in = int(np.prod(self.shape_in))
+        names = [name for name, xda in xds.data_vars.items() if set(horizontal).issubset(xda.dims)]
+
+        # stack every horizontal field as a row, do the matmul once, then unstack
+        arrays = [xds[name].transpose(..., *horizontal) for name in names]
+        fields = [np.asarray(xda.values).reshape(-1, n_in) for xda in arrays]
+        if len(fields) > 0:
+            stacked = np.concatenate(fields, axis=0)
+            result = np.ascontiguousarray((self.weights @ stacked.T).T)
+            if self.unmapped is not None and self.unmapped.any():
+                result = result.astype(np.result_type(result, np.float32), copy=False)
+                result[:, self.unmapped] = np.nan
+        else:
+            result = np.empty((0, int(np.prod(self.shape_out))))
+
+        coords = {key: val for key, val in xds.coords.items() if not set(horizontal) & set(val.dims)}
+        coords["lat"] = self.lat
+        coords["lon"] = self.lon
+        ds_out = xr.Dataset(coords=coords, attrs=xds.attrs.copy() if keep_attrs else {})
+
+        start = 0
+        for name, xda, field in zip(names, arrays, fields):
+            n_fields = len(field)
+            data = result[start:start+n_fields].reshape(xda.shape[:-2] + self.shape_out)
+            start += n_fields
+            ds_out[name] = xr.DataArray(
+                data.astype(xda.dtype, copy=False),
+                dims=xda.dims,
+                attrs=xda.attrs.copy() if keep_attrs else {},
+            )
+
+        if self.method is not None:
+            ds_out.attrs["regrid_method"] = self.method
+        return ds_out
+
+
+def _grid_signature(xds: xr.Dataset, *options) -> tuple:
+    """Identify the source grid and regridding options, so that a regridder can be reused
+
+    Args:
+        xds (xr.Dataset): with "lat" and "lon" coordinates
+        options: any other arguments that determine the regridder
+
+    Returns:
+        signature (tuple): hashable
+    """
+    signature = []
+    for key in ["lat", "lon"]:
+        values = np.ascontiguousarray(xds[key].values)
+        signature += [key, values.shape, hashlib.sha1(values.tobytes()).hexdigest()]
+    signature.append(repr(options))
+    return tuple(signature)
+
 def get_bounds(xds, is_gaussian=False):
     """
     Use cf_xarray to get the bounds of a rectilinear grid
@@ -0,0 +1,87 @@
+"""
+Interpolate from the FV3 native vertical grid to pressure levels
+"""
+import logging
+from typing import Optional
+
+import numpy as np
+import xarray as xr
+
+from ufs2arco.layers2pressure import Layers2Pressure
+
+logger = logging.getLogger("ufs2arco")
+
+def interp2pressure(
+    xds: xr.Dataset,
+    levels: list | np.ndarray,
+    variables: Optional[list | tuple] = None,
+    keep_prsl: Optional[bool] = False,
+) -> xr.Dataset:
+    """Interpolate 3D variables from the FV3 native vertical grid, with dimension "level", to pressure levels
+
+    The layer mean pressure is taken from the variable "prsl" if it's in the dataset, otherwise it is computed
+    from "pressfc", "tmp", "spfh", and "delz" with :meth:`Layers2Pressure.calc_layer_mean_pressure`.
+    Values are not extrapolated, so they are NaN where a pressure level is below the lowest model layer.
+
+    Args:
+        xds (xr.Dataset): with the data on the native vertical grid, which is assumed to be the default
+            127 level grid in :class:`Layers2Pressure`
+        levels (array_like): pressure levels to interpolate to, in hPa
+        variables (list, tuple, optional): the 3D variables to interpolate, default is every variable with
+            a "level" dimension. Any other variable with a "level" dimension is dropped.
+        keep_prsl (bool, optional): if False, drop "prsl" from the dataset, otherwise it is interpolated too
+
+    Returns:
+        xds (xr.Dataset): with the 3D variables on pressure levels, and "level" as the new vertical coordinate
+    """
+
+    lp = Layers2Pressure(level_name="level", interface_name="phalf")
+
+    if "prsl" in xds:
+        prsl = xds["prsl"]
+    else:
+        missing = [key for key in ["pressfc", "tmp", "spfh", "delz"] if key not in xds]
+        assert len(missing) == 0, \
+            f"interp2pressure: need 'prsl' or the variables to compute it, but can't find {missing} in the dataset"
+        prsl = lp.calc_layer_mean_pressure(xds["pressfc"], xds["tmp"], xds["spfh"], xds["delz"])
+
+    vars3d = [key for key in xds.data_vars if "level" in xds[key].dims]
+    if variables is None:
+        variables = list(vars3d)
+    else:
+        missing = [key for key in variables if key not in vars3d]
+        assert len(missing) == 0, \
+            f"interp2pressure: can't find the following 3D variables in the dataset: {missing}"
+        variables = list(variables)
+
+    if keep_prsl and "prsl" not in variables:
+        variables.append("prsl")
+    elif not keep_prsl and "prsl" in variables:
+        variables.remove("prsl")
+
+    fields = xr.Dataset({key: prsl if key == "prsl" else xds[key] for key in variables})
+    pstar = np.asarray(levels, dtype=np.float64)
+    pds = lp.interp2pressure_levels(fields, pstar*100, prsl)
+
+    dropped = [key for key in vars3d if key not in variables and key != "prsl"]
+    if len(dropped) > 0:
+        logger.info(f"interp2pressure: dropping 3D variables that were not interpolated: {dropped}")
+    xds = xds.drop_vars([key for key in xds.variables if "level" in xds[key].dims])
+
+    pds = pds.rename({"pstar": "level"})
+    level = pstar.astype(int) if np.all(pstar == pstar.astype(int)) else pstar
+    xds["level"] = xr.DataArray(
+        level,
+        coords={"level": level},
+        dims=("level",),
+        attrs={
+            "description": "pressure level",
+            "units": "hPa",
+        },
+    )
+    for key in variables:
+        xda = pds[key].transpose(*fields[key].dims)
+        xds[key] = xda.astype(fields[key].dtype).assign_coords(level=xds["level"])
+        xds[key].attrs = fields[key].attrs.copy()
+        xds[key].attrs["vertical_coordinate"] = "interpolated linearly in log pressure to pressure levels, NaN below the lowest model layer"
+    return xds
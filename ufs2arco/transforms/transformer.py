@@ -2,8 +2,10 @@ import logging
 
 import xarray as xr
 
+from ufs2arco.transforms.derived_variables import available_derived_variables, fv_derived_variables
 from ufs2arco.transforms.horizontal_regrid import horizontal_regrid
 from ufs2arco.transforms.mappings import get_available_mappings, apply_mappings
+from ufs2arco.transforms.pressure_levels import interp2pressure
 from ufs2arco.transforms.rotate_vectors import rotate_vectors
 from ufs2arco.transforms.vertical_regrid import fv_vertical_regrid
 
@@ -16,7 +18,9 @@ class Transformer:
         return (
             "multiply",
             "divide",
+            "fv_derived_variables",
             "fv_vertical_regrid",
+            "interp2pressure",
             "horizontal_regrid",
             "mappings",
             "rotate_vectors",
@@ -46,8 +50,14 @@ class Transformer:
             if len(unrecognized) > 0:
                 raise NotImplementedError(f"Transformer.__init__: the following mappings are not recognized or not implemented: {unrecognized}")
 
+        # check the derived variables
+        if "fv_derived_variables" in names:
+            unrecognized = [key for key in options["fv_derived_variables"]["variables"] if key not in available_derived_variables]
+            if len(unrecognized) > 0:
+                raise NotImplementedError(f"Transformer.__init__: the following derived variables are not recognized or not implemented: {unrecognized}")
+
         # if we want to do horizontal regridding, check if xesmf is installed
-        if "horizontal_regrid" in names:
+        if "horizontal_regrid" in names and options["horizontal_regrid"].get("backend", "xesmf") != "sparse":
             try:
                 import xesmf
             except ImportError:
@@ -55,6 +65,9 @@ class Transformer:
 
         self.names = names
         self.options = options
+
+        # regridders are expensive to create, so keep them around for every sample
+        self._regridders = dict()
         logger.info(str(self))
 
     def __str__(self) -> str:
@@ -85,11 +98,21 @@ class Transformer:
         if "rotate_vectors" in self.names:
             xds = rotate_vectors(xds, **self.options["rotate_vectors"])
 
+        if "fv_derived_variables" in self.names:
+            xds = fv_derived_variables(xds, **self.options["fv_derived_variables"])
+
+        if "interp2pressure" in self.names:
+            xds = interp2pressure(xds, **self.options["interp2pressure"])
+
         if "fv_vertical_regrid" in self.names:
             xds = fv_vertical_regrid(xds, **self.options["fv_vertical_regrid"])
 
         if "horizontal_regrid" in self.names:
-            xds = horizontal_regrid(xds, **self.options["horizontal_regrid"])
+            xds = horizontal_regrid(
+                xds,
+                regridder_cache=self._regridders,
+                **self.options["horizontal_regrid"],
+            )
 
         if "mappings" in self.names:
             xds = apply_mappings(xds, self.options["mappings"])
@@ -1,15 +1,10 @@
 import logging
+from functools import lru_cache
 from typing import Optional
 
 import numpy as np
 import xarray as xr
 
-try:
-    import flox
-    _has_flox = True
-except ImportError:
-    _has_flox = False
-
 logger = logging.getLogger("ufs2arco")
 
 def fv_vertical_regrid(
@@ -35,9 +30,6 @@ def fv_vertical_regrid(
         xds (xr.Dataset): with vertical averaging
     """
 
-    if not _has_flox:
-        logger.warning("Could not import flox, install with 'conda install -c conda-forge flox' for faster volume averaging (i.e. groupby operations)")
-
     assert weight_var in xds, \
         f"fv_vertical_regrid: can't find {weight_var} in dataset, can't use it for regridding"
 
@@ -59,60 +51,139 @@ def fv_vertical_regrid(
             attrs={"description": "vertical coordinate interfaces created for regridding"},
         )
 
-    # get the regrid weighting
-    layer_thickness = xds[weight_var].groupby_bins(
-        "level",
-        bins=xds["interface"],
-    ).sum()
-    layer_thickness.attrs = xds[weight_var].attrs.copy()
-    layer_thickness_inverse = 1/layer_thickness
+    # map each level to its new layer, once per set of levels and interfaces
+    segments = _get_segments(
+        tuple(xds["level"].values.tolist()),
+        tuple(xds["interface"].values.tolist()),
+    )
+    n_layers = len(xds["interface"]) - 1
+    weight = xds[weight_var].drop_vars("level")
 
-    # do the regridding
+    # do the regridding, stacking all variables that have the same dims and dtype
     vars3d = [x for x in xds.data_vars if "level" in xds[x].dims and x != weight_var]
+    groups = dict()
     for key in vars3d:
-        attrs = xds[key].attrs.copy()
-        xds[key] = layer_thickness_inverse * (
-            (
-                xds[key]*xds[weight_var]
-            ).groupby_bins(
-                "level",
-                bins=xds["interface"],
-            ).sum()
+        dims = [d for d in weight.dims if d in xds[key].dims and d != "level"]
+        dims += [d for d in xds[key].dims if d not in weight.dims]
+        groups.setdefault((tuple(dims + ["level"]), xds[key].dtype), []).append(key)
+
+    regridded = dict()
+    for (dims, dtype), keys in groups.items():
+        stacked = xds[keys].drop_vars("level").transpose(*dims).to_dataarray(dim="variable")
+        averaged = xr.apply_ufunc(
+            _weighted_segment_mean,
+            stacked,
+            weight,
+            kwargs={"segments": segments},
+            input_core_dims=[["level"], ["level"]],
+            output_core_dims=[["level"]],
+            exclude_dims={"level"},
+            dask="parallelized",
+            output_dtypes=[np.result_type(dtype, weight.dtype)],
+            dask_gufunc_kwargs={"output_sizes": {"level": n_layers}},
         )
-        xds[key].attrs = attrs
-        long_name = attrs.get("long_name", key)
-        xds[key].attrs["long_name"] = f"vertically regridded {long_name}"
+        out_dims = list(weight.dims) + [d for d in dims if d not in weight.dims]
+        for key in keys:
+            regridded[key] = averaged.sel(variable=key, drop=True).transpose(*out_dims)
 
     # make new coordinates for approximate new level
     new_level = (xds["interface"].values[:-1] + xds["interface"].values[1:])/2
     if np.all(new_level == new_level.astype(int)):
         new_level = new_level.astype(int)
-    xds["new_level"] = xr.DataArray(
+    new_level = xr.DataArray(
         new_level,
-        coords={"new_level": new_level},
-        dims=("new_level",),
+        coords={"level": new_level},
+        dims=("level",),
         attrs={
             "description": f"approximated vertical grid cell center after regridding",
             "details": "computed as (interface[:-1] + interface[1:])/2",
         },
     )
+
     # we need to drop the original weight_var (e.g. delz) b/c it has the OG levels on it
     # we'll add the regridded version later if desired
-    xds = xds.drop_vars(weight_var)
-    xds = xds.drop_vars("level")
-    xds = xds.rename({"new_level": "level"})
-
-    # handle the bins and add attrs
-    xds["level_bins"] = xds["level_bins"].swap_dims({"level_bins": "level"})
-    for key in vars3d:
-        with xr.set_options(keep_attrs=True):
-            xds[key] = xds[key].swap_dims({"level_bins": "level"})
-        xds[key].attrs["vertical_coordinate"] = f"{weight_var} weighted average in vertical, new coordinate bounds represented by 'interface'"
+    result = xr.Dataset(
+        coords={key: val for key, val in xds.coords.items() if "level" not in val.dims},
+        attrs=xds.attrs.copy(),
+    )
+    result["level"] = new_level
+    for key in xds.data_vars:
+        if key in regridded:
+            attrs = xds[key].attrs.copy()
+            result[key] = regridded[key].assign_coords(level=new_level)
+            result[key].attrs = attrs
+            long_name = attrs.get("long_name", key)
+            result[key].attrs["long_name"] = f"vertically regridded {long_name}"
+            result[key].attrs["vertical_coordinate"] = f"{weight_var} weighted average in vertical, new coordinate bounds represented by 'interface'"
+        elif key != weight_var:
+            result[key] = xds[key]
 
     if keep_weight_var:
-        xds[weight_var] = layer_thickness.swap_dims({"level_bins": "level"})
-        xds[weight_var].attrs["vertical_coordinate"] = f"vertically averaged, new coordinate bounds represented by 'interface'"
+        layer_thickness = xr.apply_ufunc(
+            _segment_sum,
+            weight,
+            kwargs={"segments": segments},
+            input_core_dims=[["level"]],
+            output_core_dims=[["level"]],
+            exclude_dims={"level"},
+            dask="parallelized",
+            output_dtypes=[weight.dtype],
+            dask_gufunc_kwargs={"output_sizes": {"level": n_layers}},
+        )
+        result[weight_var] = layer_thickness.transpose(*weight.dims).assign_coords(level=new_level)
+        result[weight_var].attrs = xds[weight_var].attrs.copy()
+        result[weight_var].attrs["vertical_coordinate"] = f"vertically averaged, new coordinate bounds represented by 'interface'"
 
-    # unfortunately, cannot store the level_bins due to this issue: https://github.com/pydata/xarray/issues/2847
-    xds = xds.drop_vars("level_bins")
-    return xds
+    return result
+
+
+@lru_cache(maxsize=32)
+def _get_segments(level: tuple, interfaces: tuple) -> tuple:
+    """Find the levels in each layer between interfaces, with layers closed on the right as in
+    ``xarray.DataArray.groupby_bins``
+
+    Args:
+        level (tuple): the original vertical coordinate values
+        interfaces (tuple): increasing interface values, defining ``len(interfaces)-1`` layers
+
+    Returns:
+        order (np.ndarray or None): indices that put the levels in order of their layer, dropping levels
+            outside of all layers, or None if they are already in order
+        starts (np.ndarray): index of the first level in each non-empty layer, for use with :func:`numpy.add.reduceat`
+        empty (np.ndarray): True for the layers that have no levels
+    """
+    level = np.asarray(level)
+    interfaces = np.asarray(interfaces)
+    assert (np.diff(interfaces) > 0).all(), \
+        f"fv_vertical_regrid: interfaces need to be monotonically increasing"
+
+    n_layers = len(interfaces) - 1
+    layer = np.searchsorted(interfaces, level, side="left") - 1
+    valid = (layer >= 0) & (layer < n_layers)
+    order = np.flatnonzero(valid)
+    order = order[np.argsort(layer[order], kind="stable")]
+    if len(order) == len(level) and (order == np.arange(len(level))).all():
+        order = None
+
+    counts = np.bincount(layer[valid], minlength=n_layers)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    empty = counts == 0
+    return order, starts[~empty], empty
+
+
+def _segment_sum(x: np.ndarray, segments: tuple) -> np.ndarray:
+    """Sum ``x`` over each layer in ``segments`` along the last axis, NaN for the empty layers"""
+    order, starts, empty = segments
+    if order is not None:
+        x = np.take(x, order, axis=-1)
+    if not empty.any():
+        return np.add.reduceat(x, starts, axis=-1)
+    result = np.full(x.shape[:-1] + empty.shape, np.nan, dtype=np.result_type(x, np.float32))
+    if len(starts) > 0:
+        result[..., ~empty] = np.add.reduceat(x, starts, axis=-1)
+    return result
+
+
+def _weighted_segment_mean(x: np.ndarray, weight: np.ndarray, segments: tuple) -> np.ndarray:
+    """The ``weight`` weighted average of ``x`` over each layer in ``segments`` along the last axis"""
+    return _segment_sum(x * weight, segments) / _segment_sum(weight, segments)